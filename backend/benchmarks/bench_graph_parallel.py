@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+# Every run must pay the full simulated latency
+os.environ.setdefault("LLM_CACHE_BACKEND", "off")
+os.environ.setdefault("CACHE_PERSIST", "0")
+
+from langgraph.graph import StateGraph, END
+
+from backend import graph, synthesis
+
+# Simulated upstream latency per tool call (seconds)
+LATENCY = {
+    "geocode": 0.15,
+    "weather": 0.20,
+    "attractions": 0.30,
+    "restaurants": 0.25,
+    "route": 0.30,
+    "costs": 0.25,
+    "llm": 0.50,
+}
+
+async def fake_get_coordinates(place_name):
+    await asyncio.sleep(LATENCY["geocode"])
+    return {"lat": 12.97, "lon": 77.59, "formatted": place_name}
+
+async def fake_get_weather_forecast(lat, lon, days=None):
+    await asyncio.sleep(LATENCY["weather"])
+    return {"daily": {"temperature_2m_max": [30, 31, 29]}}
+
+async def fake_search_attractions(lat, lon, limit=5, query_context=None):
+    await asyncio.sleep(LATENCY["attractions"])
+    return [{"name": f"Attraction {i}", "lat": lat + i / 100, "lon": lon} for i in range(limit)]
+
+async def fake_search_restaurants(lat, lon, radius=1000):
+    await asyncio.sleep(LATENCY["restaurants"])
+    return [{"name": f"Restaurant {i}", "lat": lat, "lon": lon + i / 100} for i in range(5)]
+
+async def fake_calculate_route(locations, optimize_waypoint_order=True):
+    await asyncio.sleep(LATENCY["route"])
+    return {"routes": [{"distanceMeters": 1000}]}
+
+async def fake_estimate_leg_costs(legs):
+    await asyncio.sleep(LATENCY["costs"])
+    return [{} for _ in legs]
+
+FAKE_OVERVIEW = {
+    "trip_title": "Trip", "weather_summary": "Sunny", "attractions": [], "dining": [],
+    "costs": {"transport_estimate": "N/A", "total_estimate": "N/A"},
+}
+
+class FakeLLM:
+    async def ainvoke(self, messages, response_json_schema=None, **kwargs):
+        await asyncio.sleep(LATENCY["llm"])
+        title = (response_json_schema or {}).get("title")
+        if title == "DailyPlan":
+            return SimpleNamespace(content=json.dumps({"daily_plan": [{"day": 1, "activities": ["Explore"]}]}))
+        return SimpleNamespace(content=json.dumps({**FAKE_OVERVIEW, "daily_plan": []}))
+
+def install_stubs():
+    graph.get_coordinates = fake_get_coordinates
+    graph.get_weather_forecast = fake_get_weather_forecast
+    graph.search_attractions = fake_search_attractions
+    graph.search_restaurants = fake_search_restaurants
+    graph.calculate_route = fake_calculate_route
+    graph.estimate_leg_costs = fake_estimate_leg_costs
+    synthesis.get_llm = lambda *args, **kwargs: FakeLLM()
+
+async def sequential_places_node(state):
+    lat = state["coordinates"].lat
+    lon = state["coordinates"].lon
+    places = await graph.search_attractions(lat, lon, query_context=state["destination"])
+    restaurants = await graph.search_restaurants(lat, lon)
+    return {"places": graph.parse_places(places), "restaurants": graph.parse_places(restaurants)}
+
+def build_sequential_app():
+    """The original strictly sequential topology, kept here as the baseline."""
+    workflow = StateGraph(graph.AgentState)
+    workflow.add_node("geocoder", graph.geocode_node)
+    workflow.add_node("fetch_weather", graph.weather_node)
+    workflow.add_node("fetch_places", sequential_places_node)
+    workflow.add_node("calculate_route", graph.route_node)
+    workflow.add_node("calculate_cost", graph.cost_node)
+    workflow.add_node("synthesizer", graph.synthesizer_node)
+    workflow.set_entry_point("geocoder")
+    workflow.add_edge("geocoder", "fetch_weather")
+    workflow.add_edge("fetch_weather", "fetch_places")
+    workflow.add_edge("fetch_places", "calculate_route")
+    workflow.add_edge("calculate_route", "calculate_cost")
+    workflow.add_edge("calculate_cost", "synthesizer")
+    workflow.add_edge("synthesizer", END)
+    return workflow.compile()
+
+async def time_app(app, runs, route_optimizer):
+    graph.ROUTE_OPTIMIZER = route_optimizer
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = await app.ainvoke({"destination": "Bangalore"})
+        timings.append(time.perf_counter() - start)
+        assert "structured_itinerary" in result
+    return sorted(timings)[len(timings) // 2]
+
+async def main(runs: int = 5):
+    install_stubs()
+    sequential = build_sequential_app()
+
+    expected_sequential = sum(LATENCY.values())
+    places_branch = max(LATENCY["attractions"], LATENCY["restaurants"])
+    expected_parallel = (
+        LATENCY["geocode"]
+        + max(LATENCY["weather"], places_branch + LATENCY["route"] + LATENCY["costs"])
+        + LATENCY["llm"]
+    )
+    # Local ordering takes microseconds; geometry and cost then run side by side
+    expected_local = (
+        LATENCY["geocode"]
+        + max(LATENCY["weather"], places_branch + max(LATENCY["route"], LATENCY["costs"]))
+        + LATENCY["llm"]
+    )
+
+    seq = await time_app(sequential, runs, "google")
+    par = await time_app(graph.get_app(), runs, "google")
+    local = await time_app(graph.get_app(), runs, "local")
+
+    print("--- Trip graph critical path (stubbed tools) ---")
+    print(f"Sequential:              {seq * 1000:7.1f} ms (expected ~{expected_sequential * 1000:.0f} ms)")
+    print(f"Parallel, Google order:  {par * 1000:7.1f} ms (expected ~{expected_parallel * 1000:.0f} ms)")
+    print(f"Parallel, local order:   {local * 1000:7.1f} ms (expected ~{expected_local * 1000:.0f} ms)")
+    print(f"Speedup:                 {seq / local:7.2f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "benchmark")
+os.environ.setdefault("CACHE_PERSIST", "0")
+
+from backend.tools import http_client, places
+
+# Simulated latency per Places request (seconds)
+LATENCY = 0.25
+
+def sparse_region_handler(results_per_tier):
+    """
+    Mock Places API for a rural destination like Belagavi: each tier only returns a
+    few results, so the serial strategy has to walk all three tiers.
+    """
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(LATENCY)
+        body = request.read().decode()
+        if "searchText" in str(request.url):
+            tier = "text"
+        elif "50000" in body:
+            tier = "nearby_50km"
+        else:
+            tier = "nearby_5km"
+        count = results_per_tier[tier]
+        return httpx.Response(200, json={"places": [
+            {
+                "id": f"{tier}-{i}",
+                "displayName": {"text": f"{tier} place {i}"},
+                "location": {"latitude": 15.85, "longitude": 74.5},
+            }
+            for i in range(count)
+        ]})
+    return handler
+
+async def run(strategy, results_per_tier):
+    places.places_cache.memory.clear()
+    places.tier_metrics.clear()
+    requests = []
+    handler = sparse_region_handler(results_per_tier)
+
+    async def counting_handler(request):
+        requests.append(request.url.path)
+        return await handler(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(counting_handler))
+    http_client.set_client("places", client)
+    start = time.perf_counter()
+    found = await places.search_attractions(15.85, 74.5, query_context="Belagavi", strategy=strategy)
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+    return elapsed, len(found), len(requests), places.get_tier_stats()
+
+async def main():
+    scenarios = {
+        "dense (5km tier suffices)": {"nearby_5km": 5, "nearby_50km": 5, "text": 5},
+        "sparse (needs all tiers)": {"nearby_5km": 1, "nearby_50km": 2, "text": 5},
+    }
+    for name, results_per_tier in scenarios.items():
+        print(f"\n--- {name} ---")
+        for strategy in ("serial", "hedged"):
+            elapsed, found, requests, tiers = await run(strategy, results_per_tier)
+            print(f"{strategy:>6}: {elapsed * 1000:6.1f} ms, {found} places, {requests} Places requests")
+            for tier, stats in tiers.items():
+                print(
+                    f"        {tier:<12} used={stats['used']} unused={stats['unused']} "
+                    f"cancelled={stats['cancelled']} avg={stats['avg_ms']:.1f} ms"
+                )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+"""
+Tail latency and failure behaviour of the upstream resilience layer, against a mock
+upstream (no network needed):
+
+- stalls: a small fraction of requests hang for a while; hedging after the p95
+  delay should remove them from the tail;
+- outage: the upstream refuses connections; the circuit breaker should fail fast
+  and serve the last good responses;
+- hang: the upstream never answers; a request deadline should bound the wait.
+
+    python backend/benchmarks/bench_resilience.py
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import httpx
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+os.environ.setdefault("CACHE_PERSIST", "0")
+os.environ.setdefault("RATE_LIMIT_OPEN_METEO", "0")
+
+from backend.tools import resilience
+from backend.tools.governor import governed_request
+
+URL = "https://api.open-meteo.com/v1/forecast"
+
+class MockUpstream:
+    def __init__(self, latency: float, stall: float, stall_rate: float, seed: int):
+        self.latency = latency
+        self.stall = stall
+        self.stall_rate = stall_rate
+        self.mode = "ok"
+        self.requests = 0
+        self.rng = random.Random(seed)
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.mode == "down":
+            raise httpx.ConnectError("connection refused", request=request)
+        if self.mode == "hang":
+            await asyncio.sleep(3600)
+        stalled = self.rng.random() < self.stall_rate
+        await asyncio.sleep(self.stall if stalled else self.latency * self.rng.uniform(0.8, 1.2))
+        return httpx.Response(200, json={"ok": True})
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+async def timed(client, i, keys):
+    start = time.perf_counter()
+    await governed_request("open-meteo", client, "GET", URL, params={"point": i % keys})
+    return time.perf_counter() - start
+
+async def stalls(args, hedge: bool):
+    resilience.HEDGE_ENABLED = hedge
+    resilience._health.clear()
+    upstream = MockUpstream(args.latency, args.stall, args.stall_rate, args.seed)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream.handler))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i):
+        async with semaphore:
+            return await timed(client, i, args.requests)
+
+    latencies = await asyncio.gather(*(one(i) for i in range(args.requests)))
+    stats = resilience.get_resilience_stats()["open-meteo"]
+    label = "hedged" if hedge else "plain"
+    print(
+        f"{label:>6}: p50 {percentile(latencies, 50) * 1000:6.1f} ms  p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+        f"max {max(latencies) * 1000:7.1f} ms  upstream requests {upstream.requests} (hedged {stats['hedged']}, won {stats['hedge_wins']})"
+    )
+
+async def outage(args):
+    resilience._health.clear()
+    upstream = MockUpstream(args.latency, args.stall, 0, args.seed)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream.handler))
+    keys = 20
+    for i in range(keys):
+        await timed(client, i, keys)
+    upstream.mode = "down"
+    upstream.requests = 0
+    latencies, stale = [], 0
+    for i in range(args.requests):
+        start = time.perf_counter()
+        response = await governed_request("open-meteo", client, "GET", URL, params={"point": i % keys})
+        latencies.append(time.perf_counter() - start)
+        stale += response.headers.get("x-inkle-fallback") == "stale"
+    stats = resilience.get_resilience_stats()["open-meteo"]
+    print(
+        f"outage: {args.requests} calls, p50 {percentile(latencies, 50) * 1000:.1f} ms, {stale} served stale, "
+        f"{upstream.requests} reached the upstream, breaker {stats['state']}"
+    )
+
+async def hang(args):
+    resilience._health.clear()
+    upstream = MockUpstream(args.latency, args.stall, 0, args.seed)
+    upstream.mode = "hang"
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream.handler))
+    start = time.perf_counter()
+    with resilience.deadline(args.deadline):
+        try:
+            await governed_request("open-meteo", client, "GET", URL, params={"point": "new"})
+            outcome = "answered"
+        except Exception as e:
+            outcome = type(e).__name__
+    print(f"  hang: {outcome} after {(time.perf_counter() - start) * 1000:.0f} ms (deadline {args.deadline * 1000:.0f} ms)")
+
+async def main(args):
+    print("--- Stalled requests ---")
+    await stalls(args, hedge=False)
+    await stalls(args, hedge=True)
+    print("\n--- Failures ---")
+    await outage(args)
+    await hang(args)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upstream resilience benchmark")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="typical upstream latency (s)")
+    parser.add_argument("--stall", type=float, default=2.0, help="latency of a stalled request (s)")
+    parser.add_argument("--stall-rate", type=float, default=0.02)
+    parser.add_argument("--deadline", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,107 @@
+"""
+Cold-start benchmark for the web API and the MCP server.
+
+Each measurement runs in a fresh interpreter: the import time of each entry module,
+the heaviest modules it pulls in (from `python -X importtime`), and for the web API
+the time from launching uvicorn until it answers its first request, per
+STARTUP_PRELOAD mode.
+
+    python backend/benchmarks/bench_startup.py
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+ENTRY_MODULES = ("backend.server", "backend.mcp_server", "backend.graph")
+# Heavy dependencies each entry point should (or should not) load at import
+WATCHED = ("fastapi", "fastmcp", "langgraph", "langchain_core", "langchain_google_genai")
+
+def _env(**extra):
+    env = {**os.environ, "CACHE_PERSIST": "0", "PLAN_CHECKPOINTER": "memory", **extra}
+    env.setdefault("GOOGLE_API_KEY", "benchmark")
+    return env
+
+def import_time(module: str) -> tuple:
+    """Seconds to import the module in a fresh interpreter, and which watched packages it loaded."""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(elapsed, ','.join(m for m in {WATCHED!r} if m in sys.modules))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=_env(), capture_output=True, text=True, check=True)
+    elapsed, _, loaded = out.stdout.strip().splitlines()[-1].partition(" ")
+    return float(elapsed), loaded
+
+def heaviest_imports(module: str, top: int) -> list:
+    """Third-party packages by cumulative import time, from -X importtime."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT, env=_env(), capture_output=True, text=True, check=True)
+    totals = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # The outermost import of a package has the largest cumulative time
+        package = name.strip().split(".")[0]
+        if package not in ("backend", "site", "encodings"):
+            totals[package] = max(totals.get(package, 0), int(cumulative))
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def time_to_first_response(preload: str, timeout: float = 60) -> float:
+    """Seconds from launching uvicorn until GET /metrics answers."""
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=_env(STARTUP_PRELOAD=preload), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/metrics", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            time.sleep(0.02)
+        raise TimeoutError(f"server did not answer within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=6)
+    args = parser.parse_args()
+
+    print("--- Import time (fresh interpreter, median) ---")
+    for module in ENTRY_MODULES:
+        runs = [import_time(module) for _ in range(args.runs)]
+        median = statistics.median(elapsed for elapsed, _ in runs)
+        print(f"{module:<22} {median * 1000:7.0f} ms   loads: {runs[0][1] or '-'}")
+        for name, micros in heaviest_imports(module, args.top):
+            print(f"    {name:<26} {micros / 1000:7.0f} ms")
+
+    print("\n--- Web API time to first response (median) ---")
+    for preload in ("off", "background", "eager"):
+        median = statistics.median(time_to_first_response(preload) for _ in range(args.runs))
+        print(f"STARTUP_PRELOAD={preload:<11} {median * 1000:7.0f} ms")
+
+if __name__ == "__main__":
+    main()
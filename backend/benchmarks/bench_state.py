@@ -0,0 +1,135 @@
+"""
+Memory and serialization cost of the plan state: the typed models (models.py)
+against the plain dicts of raw tool results the graph used to carry.
+
+A plan state is assembled from the replayed tool results, as the graph nodes would,
+then kept both ways. For each form it reports the memory held by a set of plans,
+the checkpoint round trip LangGraph does when a plan is saved, and the time to encode a
+plan response: with json for the dict state, as JSONResponse did, with orjson for the
+dict state, and with models.dumps (msgspec) for both, which is what the server uses.
+
+    python backend/benchmarks/bench_state.py
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import orjson
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+for key in ("GEOAPIFY_KEY", "GOOGLE_MAPS_API_KEY", "GOOGLE_API_KEY"):
+    os.environ.setdefault(key, "benchmark")
+os.environ.setdefault("CACHE_PERSIST", "0")
+for upstream in ("GEOAPIFY", "OPEN_METEO", "PLACES", "ROUTES", "DISTANCEMATRIX"):
+    os.environ.setdefault(f"RATE_LIMIT_{upstream}", "0")
+
+from backend.benchmarks.replay import ReplayLLM, ReplayTransport, install
+from backend.models import dumps, parse_state
+from backend.planning import CHECKPOINT_FORMAT, checkpoint_serde
+from backend.plan_cache import plan_response
+from backend.tools.costs import estimate_leg_costs
+from backend.tools.geocoding import get_coordinates
+from backend.tools.places import search_attractions, search_restaurants
+from backend.tools.route_optimizer import optimize_route
+from backend.tools.routing import calculate_route
+from backend.tools.weather import get_weather_forecast
+
+async def dict_state(destination: str, days: int) -> dict:
+    """The state as the nodes used to keep it: tool results as returned."""
+    coordinates = await get_coordinates(destination)
+    lat, lon = coordinates["lat"], coordinates["lon"]
+    weather, places, restaurants = await asyncio.gather(
+        get_weather_forecast(lat, lon, days=days),
+        search_attractions(lat, lon, query_context=destination),
+        search_restaurants(lat, lon),
+    )
+    locations = [coordinates] + [{"lat": p["lat"], "lon": p["lon"]} for p in places]
+    route = optimize_route(locations)
+    order = route["routes"][0]["optimizedIntermediateWaypointIndex"]
+    places = [places[i] for i in order]
+    geometry = await calculate_route(locations, optimize_waypoint_order=False)
+    remote = {k: v for k, v in geometry["routes"][0].items() if k != "optimizedIntermediateWaypointIndex"}
+    route = {**geometry, "routes": [{**route["routes"][0], **remote}]}
+    stops = [{"name": "City center", **coordinates}] + places
+    pairs = list(zip(stops, stops[1:]))
+    table = await estimate_leg_costs([({"lat": a["lat"], "lon": a["lon"]}, {"lat": b["lat"], "lon": b["lon"]}) for a, b in pairs])
+    costs = {"legs": [{"from": a.get("name"), "to": b.get("name"), "modes": modes} for (a, b), modes in zip(pairs, table)]}
+    itinerary = json.loads(ReplayLLM().fixture["content"])
+    return {
+        "destination": destination, "coordinates": coordinates, "weather": weather,
+        "places": places, "restaurants": restaurants, "route": route, "costs": costs,
+        "final_itinerary": json.dumps(itinerary), "structured_itinerary": itinerary, "days": days,
+    }
+
+def held_bytes(make, count: int) -> float:
+    """Bytes allocated per plan while `count` independent plans are alive."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    plans = [make() for _ in range(count)]
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del plans
+    return held / count
+
+def per_call_us(fn, runs: int) -> float:
+    """Median microseconds per call, over 5 batches of `runs` calls."""
+    samples = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(runs):
+            fn()
+        samples.append((time.perf_counter() - start) / runs)
+    return statistics.median(samples) * 1e6
+
+def report(args, label: str, state: dict, serde):
+    response = plan_response(state["destination"], state)
+    round_trip = lambda: serde.loads_typed(serde.dumps_typed(state))
+    # The checkpoint format must give back an equal state, in the plan format
+    assert serde.dumps_typed(state)[0] == CHECKPOINT_FORMAT and round_trip() == state, f"{label} state does not round-trip"
+    row = {
+        "kB/plan": held_bytes(lambda: copy.deepcopy(state), args.plans) / 1024,
+        "checkpoint kB": len(serde.dumps_typed(state)[1]) / 1024,
+        "checkpoint us": per_call_us(round_trip, args.runs),
+        "json us": per_call_us(lambda: json.dumps(response, default=str), args.runs) if label == "dict" else None,
+        "orjson us": per_call_us(lambda: orjson.dumps(response, default=str), args.runs) if label == "dict" else None,
+        "dumps us": per_call_us(lambda: dumps(response), args.runs),
+        "response kB": len(dumps(response)) / 1024,
+    }
+    cells = "".join(f"{'-' if value is None else f'{value:.1f}':>16}" for value in row.values())
+    return row, f"{label:<8}{cells}"
+
+async def main(args):
+    transport = ReplayTransport(latency_scale=0, seed=args.seed)
+    install(transport, ReplayLLM(latency_scale=0, seed=args.seed))
+    raw = await dict_state("Benchmark city", args.days)
+    typed = parse_state(raw)
+    serde = checkpoint_serde()
+
+    columns = ("kB/plan", "checkpoint kB", "checkpoint us", "json us", "orjson us", "dumps us", "response kB")
+    print(f"--- Plan state, {args.days}-day trip ({args.plans} plans held, median of {args.runs} encodes) ---")
+    print(f"{'':<8}" + "".join(f"{c:>16}" for c in columns))
+    before, line = report(args, "dict", raw, serde)
+    print(line)
+    after, line = report(args, "typed", typed, serde)
+    print(line)
+    print(
+        f"\nmemory {after['kB/plan'] / before['kB/plan'] - 1:+.0%}, checkpoint round trip "
+        f"{after['checkpoint us'] / before['checkpoint us'] - 1:+.0%}, response encode "
+        f"{after['dumps us'] / before['dumps us'] - 1:+.0%} (same encoder), "
+        f"{after['dumps us'] / before['orjson us'] - 1:+.0%} against orjson on dicts"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan state memory and serialization benchmark")
+    parser.add_argument("--plans", type=int, default=1000, help="plans held at once for the memory figure")
+    parser.add_argument("--runs", type=int, default=500, help="encodes per timing batch")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,63 @@
+"""
+Re-records the benchmark fixtures from the live APIs (needs real keys in backend/.env).
+
+    python backend/benchmarks/record_fixtures.py Bangalore
+"""
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+from dotenv import load_dotenv
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "..", ".env"))
+os.environ["CACHE_PERSIST"] = "0"
+os.environ["PLACES_SEARCH_STRATEGY"] = "hedged"  # Record every Places tier
+
+from backend.benchmarks.replay import FIXTURES_DIR, fixture_name
+
+def save(name, body):
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json"), "w") as f:
+        json.dump(body, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    print(f"Recorded {name}")
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self):
+        self.inner = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        response = await self.inner.handle_async_request(request)
+        await response.aread()
+        name = fixture_name(request)
+        if name and response.status_code == 200:
+            save(name, response.json())
+        return response
+
+class RecordingLLM:
+    def __init__(self, llm):
+        self.llm = llm
+        self.model = llm.model
+        self.temperature = llm.temperature
+
+    async def ainvoke(self, messages):
+        response = await self.llm.ainvoke(messages)
+        save("gemini_itinerary", {"content": response.content, "usage_metadata": response.usage_metadata})
+        return response
+
+async def main(destination):
+    from backend.graph import get_app
+    from backend.llm_factory import get_llm, set_llm
+    from backend.tools import http_client
+
+    transport = RecordingTransport()
+    for upstream in http_client.UPSTREAMS:
+        http_client.set_client(upstream, httpx.AsyncClient(transport=transport))
+    set_llm(RecordingLLM(get_llm()))
+    await get_app().ainvoke({"destination": destination})
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "Bangalore"))
@@ -0,0 +1,180 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import random
+from typing import Any, Dict, List, Optional
+
+import httpx
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Median latency per upstream in milliseconds, roughly what we see in production
+DEFAULT_LATENCY_MS = {
+    "geoapify": 120,
+    "open-meteo": 150,
+    "places": 300,
+    "routes": 350,
+    "distancematrix": 250,
+    "gemini": 2500,
+}
+
+def load_fixture(name: str) -> Any:
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json")) as f:
+        return json.load(f)
+
+def fixture_name(request: httpx.Request) -> Optional[str]:
+    """Maps an upstream request to the fixture recorded for it."""
+    host, path = request.url.host, request.url.path
+    if host == "api.geoapify.com":
+        return "geoapify_search"
+    if host == "api.open-meteo.com":
+        return "open_meteo_forecast"
+    if host == "places.googleapis.com":
+        if path.endswith(":searchText"):
+            return "places_text"
+        return "places_restaurants" if b'"restaurant"' in request.content else "places_nearby"
+    if host == "routes.googleapis.com":
+        return "routes_compute"
+    if host == "maps.googleapis.com" and "distancematrix" in path:
+        return "distancematrix"
+    return None
+
+UPSTREAM_BY_FIXTURE = {
+    "geoapify_search": "geoapify",
+    "open_meteo_forecast": "open-meteo",
+    "places_text": "places",
+    "places_nearby": "places",
+    "places_restaurants": "places",
+    "routes_compute": "routes",
+    "distancematrix": "distancematrix",
+}
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Serves recorded fixtures instead of calling the real upstreams. Latency is drawn
+    from a log-normal distribution around the configured median, and a fraction of
+    requests fail with 500 or 429 to exercise the error paths. Seeded for repeatability.
+    """
+    def __init__(self, latency_ms: Optional[Dict[str, float]] = None, error_rate: float = 0.0,
+                 latency_scale: float = 1.0, seed: int = 0):
+        self.latency_ms = {**DEFAULT_LATENCY_MS, **(latency_ms or {})}
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.fixtures = {name: load_fixture(name) for name in UPSTREAM_BY_FIXTURE}
+        self.calls: Dict[str, int] = {}
+        # Distance Matrix bills per element (origins x destinations)
+        self.elements = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        name = fixture_name(request)
+        if name is None:
+            return httpx.Response(404, json={"error": f"no fixture for {request.url}"})
+        upstream = UPSTREAM_BY_FIXTURE[name]
+        self.calls[upstream] = self.calls.get(upstream, 0) + 1
+
+        median = self.latency_ms[upstream] * self.latency_scale / 1000
+        await asyncio.sleep(median * self.rng.lognormvariate(0, 0.35))
+
+        if self.rng.random() < self.error_rate:
+            if self.rng.random() < 0.5:
+                return httpx.Response(429, headers={"Retry-After": "0.1"}, json={"error": "quota"})
+            return httpx.Response(500, json={"error": "upstream failure"})
+        return httpx.Response(200, json=self._body(name, request))
+
+    def _body(self, name: str, request: httpx.Request) -> Any:
+        body = self.fixtures[name]
+        if name == "geoapify_search":
+            # Spread destinations over distinct coordinates so each one is a cold lookup
+            text = request.url.params.get("text", "")
+            digest = int(hashlib.sha256(text.lower().encode()).hexdigest()[:8], 16)
+            body = json.loads(json.dumps(body))
+            props = body["features"][0]["properties"]
+            props["lat"] = round(-50 + (digest % 10000) / 100, 4)
+            props["lon"] = round(-170 + (digest // 10000 % 34000) / 100, 4)
+            props["formatted"] = text
+        elif name == "distancematrix":
+            # Tile the recorded element to the requested origins x destinations
+            origins = len(request.url.params.get("origins", "").split("|"))
+            destinations = len(request.url.params.get("destinations", "").split("|"))
+            element = body["rows"][0]["elements"][0]
+            self.elements += origins * destinations
+            body = {**body, "rows": [{"elements": [element] * destinations} for _ in range(origins)]}
+        elif name == "open_meteo_forecast":
+            body = self._forecasts(body, request.url.params)
+        return body
+
+    @staticmethod
+    def _forecasts(body: Dict[str, Any], params: httpx.QueryParams) -> Any:
+        """The recorded forecast for each requested location, tiled to forecast_days."""
+        days = int(params.get("forecast_days", len(body["daily"]["time"])))
+        first = datetime.date.fromisoformat(body["daily"]["time"][0])
+        daily = {key: [values[i % len(values)] for i in range(days)] for key, values in body["daily"].items()}
+        daily["time"] = [(first + datetime.timedelta(days=i)).isoformat() for i in range(days)]
+        latitudes = params.get("latitude", str(body["latitude"])).split(",")
+        longitudes = params.get("longitude", str(body["longitude"])).split(",")
+        forecasts = [
+            {**body, "latitude": float(lat), "longitude": float(lon), "daily": daily}
+            for lat, lon in zip(latitudes, longitudes)
+        ]
+        # Like Open-Meteo: one location is an object, several are a list
+        return forecasts[0] if len(forecasts) == 1 else forecasts
+
+class ReplayLLM:
+    """
+    Stands in for ChatGoogleGenerativeAI with the recorded itinerary. In JSON-schema
+    mode it answers with the matching part of the recording (the overview or the
+    daily plan), and latency scales with output length as it does for the real model.
+    """
+    model = "replay"
+    temperature = 0.7
+
+    def __init__(self, latency_ms: float = DEFAULT_LATENCY_MS["gemini"], latency_scale: float = 1.0, seed: int = 0):
+        self.latency = latency_ms * latency_scale / 1000
+        self.rng = random.Random(seed)
+        self.fixture = load_fixture("gemini_itinerary")
+        self.itinerary = json.loads(self.fixture["content"])
+        self.calls = 0
+
+    def _content(self, schema: Optional[Dict[str, Any]]) -> str:
+        title = (schema or {}).get("title")
+        if title == "DailyPlan":
+            return json.dumps({"daily_plan": self.itinerary["daily_plan"]})
+        if title == "TripOverview":
+            return json.dumps({k: v for k, v in self.itinerary.items() if k != "daily_plan"})
+        return self.fixture["content"]
+
+    async def ainvoke(self, messages: List[Any], response_json_schema: Optional[Dict[str, Any]] = None, **kwargs) -> AIMessage:
+        self.calls += 1
+        content = self._content(response_json_schema)
+        # A fixed time to first token plus generation time proportional to length
+        share = len(content) / len(self.fixture["content"])
+        await asyncio.sleep(self.latency * (0.2 + 0.8 * share) * self.rng.lognormvariate(0, 0.25))
+        usage = self.fixture["usage_metadata"]
+        output_tokens = max(1, round(usage["output_tokens"] * share))
+        usage = {**usage, "output_tokens": output_tokens, "total_tokens": usage["input_tokens"] + output_tokens}
+        return AIMessage(content=content, usage_metadata=usage)
+
+    async def astream(self, messages: List[Any]):
+        self.calls += 1
+        words = self.fixture["content"].split(" ")
+        delay = self.latency * self.rng.lognormvariate(0, 0.25) / len(words)
+        for i, word in enumerate(words):
+            await asyncio.sleep(delay)
+            last = i == len(words) - 1
+            yield AIMessageChunk(
+                content=word if last else word + " ",
+                usage_metadata=self.fixture["usage_metadata"] if last else None,
+            )
+
+def install(transport: ReplayTransport, llm: ReplayLLM):
+    """Points every tool and the LLM factory at the replay doubles."""
+    from backend.llm_factory import set_llm
+    from backend.tools import http_client
+
+    for upstream in http_client.UPSTREAMS:
+        http_client.set_client(upstream, httpx.AsyncClient(transport=transport))
+    set_llm(llm)
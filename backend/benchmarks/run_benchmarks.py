@@ -0,0 +1,219 @@
+"""
+Offline load benchmark for the trip planner.
+
+Replays recorded upstream fixtures (Geoapify, Open-Meteo, Places, Routes, Distance Matrix,
+Gemini) through a mock transport with injected latency and errors, drives the graph and
+the FastAPI app under concurrent load, and reports p50/p95/p99 latency, throughput and
+peak memory per scenario. No network access or API keys are needed.
+
+    python backend/benchmarks/run_benchmarks.py --output before.json
+    python backend/benchmarks/run_benchmarks.py --compare before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+# Deterministic, offline configuration. Must be set before the backend is imported.
+for key in ("GEOAPIFY_KEY", "GOOGLE_MAPS_API_KEY", "GOOGLE_API_KEY"):
+    os.environ.setdefault(key, "benchmark")
+os.environ.setdefault("CACHE_PERSIST", "0")
+os.environ.setdefault("PLAN_CHECKPOINTER", "memory")
+
+import httpx
+
+from backend.benchmarks.replay import ReplayLLM, ReplayTransport, install
+
+POPULAR = [
+    "Paris", "London", "Rome", "Tokyo", "New York", "Bangalore", "Goa", "Jaipur", "Barcelona",
+    "Istanbul", "Dubai", "Singapore", "Bangkok", "Lisbon", "Prague", "Amsterdam", "Kyoto",
+    "Sydney", "Cape Town", "Mumbai",
+]
+
+def disable_rate_limits():
+    """The governor would otherwise dominate throughput; benchmark the pipeline itself."""
+    for upstream in ("GEOAPIFY", "OPEN_METEO", "PLACES", "ROUTES", "DISTANCEMATRIX", "GEMINI"):
+        os.environ.setdefault(f"RATE_LIMIT_{upstream}", "0")
+        os.environ.setdefault(f"MAX_INFLIGHT_{upstream}", "10000")
+
+def reset_state():
+    """Clears in-memory caches and governors so scenarios do not warm each other up."""
+    from backend.llm_factory import response_cache
+    from backend.planning import plan_flight
+    from backend.tools import governor, resilience
+    from backend.tools.geocoding import geocode_cache
+    from backend.tools.places import places_cache
+    from backend.tools.weather import weather_cache
+    from backend.tools.costs import leg_cache
+    from backend.plan_cache import static_layer, synthesis_layer
+
+    for cache in (geocode_cache, places_cache, weather_cache, leg_cache, response_cache, static_layer, synthesis_layer):
+        cache.memory.clear()
+    if plan_flight.results is not None:
+        plan_flight.results.memory.clear()
+    governor._governors.clear()
+    resilience._health.clear()
+    resilience.last_good.clear()
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+async def drive(make_call, destinations, concurrency):
+    """Runs make_call(destination) for every destination with bounded concurrency."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(destination):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await make_call(destination)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(d) for d in destinations))
+    return latencies, errors, time.perf_counter() - start
+
+def zipf_destinations(count, rng):
+    weights = [1 / (rank + 1) for rank in range(len(POPULAR))]
+    return rng.choices(POPULAR, weights=weights, k=count)
+
+async def run_scenario(name, args):
+    from backend.graph import get_app
+    from backend.planning import replan, run_plan
+    from backend.server import app as web_app
+
+    rng = random.Random(args.seed)
+    error_rate = 0.1 if name == "degraded" else args.error_rate
+    latency_scale = args.latency_scale * (2 if name == "degraded" else 1)
+    transport = ReplayTransport(error_rate=error_rate, latency_scale=latency_scale, seed=args.seed)
+    llm = ReplayLLM(latency_scale=latency_scale, seed=args.seed)
+    reset_state()
+    install(transport, llm)
+
+    unique = [f"{name} city {i}" for i in range(args.requests)]
+    if name in ("graph_cold", "degraded"):
+        destinations = unique
+        async def call(destination):
+            await get_app().ainvoke({"destination": destination})
+    elif name == "graph_popular":
+        destinations = zipf_destinations(args.requests, rng)
+        async def call(destination):
+            await run_plan(destination)
+    elif name == "api_plan_trip":
+        destinations = zipf_destinations(args.requests // 2, rng) + unique[: args.requests - args.requests // 2]
+        rng.shuffle(destinations)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=web_app), base_url="http://bench")
+        async def call(destination):
+            response = await client.post("/api/plan_trip", json={"destination": destination})
+            response.raise_for_status()
+    elif name == "api_plan_get":
+        # Browsers revalidating popular plans: GET with the last ETag seen for each
+        destinations = zipf_destinations(args.requests, rng)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=web_app), base_url="http://bench")
+        etags = {}
+        async def call(destination):
+            headers = {"If-None-Match": etags[destination]} if destination in etags else {}
+            response = await client.get("/api/plan_trip", params={"destination": destination}, headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+            etags[destination] = response.headers["ETag"]
+    elif name == "replan":
+        # Edits of existing plans: drop the first stop, which re-runs route, cost and synthesis
+        destinations = unique
+        plans = {}
+        for destination in destinations:
+            plans[destination] = await run_plan(destination)
+        transport.calls.clear()
+        transport.elements = 0
+        llm.calls = 0
+        async def call(destination):
+            plan = plans[destination]
+            await replan({"remove_places": [plan["places"][0].name]}, plan_id=plan["plan_id"])
+    else:
+        raise ValueError(f"Unknown scenario: {name}")
+
+    if args.memory:
+        tracemalloc.start()
+    latencies, errors, wall = await drive(call, destinations, args.concurrency)
+    peak = tracemalloc.get_traced_memory()[1] if args.memory else 0
+    if args.memory:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "requests": len(destinations),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": len(destinations) / wall,
+        "peak_mem_mb": peak / 1024 / 1024,
+        "upstream_calls": dict(sorted(transport.calls.items())),
+        "distancematrix_elements": transport.elements,
+        "llm_calls": llm.calls,
+    }
+
+def print_report(results, baseline=None):
+    columns = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "peak_mem_mb")
+    print(f"{'scenario':<15}" + "".join(f"{c:>22}" for c in columns) + f"{'errors':>8}")
+    for name, result in results.items():
+        row = f"{name:<15}"
+        for column in columns:
+            cell = f"{result[column]:.1f}"
+            if baseline and name in baseline:
+                before = baseline[name][column]
+                if before:
+                    cell += f" ({(result[column] - before) / before * 100:+.0f}%)"
+            row += f"{cell:>22}"
+        print(row + f"{result['errors']:>8}")
+
+async def main(args):
+    if not args.governed:
+        disable_rate_limits()
+    results = {}
+    for name in args.scenarios:
+        # The nodes print progress lines; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[name] = await run_scenario(name, args)
+        print(f"finished {name}", file=sys.stderr)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["scenarios"]
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "scenarios": results}, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=["graph_cold", "graph_popular", "api_plan_trip", "api_plan_get", "replan", "degraded"])
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply all injected latencies (0.1 for a quick run)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail (degraded always uses 0.1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip tracemalloc (it slows the run)")
+    parser.add_argument("--governed", action="store_true", help="keep the per-upstream rate governor enabled")
+    parser.add_argument("--output", help="write results as JSON for later comparison")
+    parser.add_argument("--compare", help="JSON from a previous run to diff against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,404 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import msgspec
+import orjson
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """A boolean setting: 1/true/yes/on (any case) are true, other values false."""
+    value = os.getenv(name, "").strip()
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "inkle.sqlite3")
+
+# Shared second tier behind every TieredCache: "sqlite" (a WAL file that all workers
+# on the host share), "redis" (REDIS_URL; "local://" selects the in-process stand-in)
+# or "none" for memory only.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Caps how long a worker keeps an entry in memory, so entries refreshed by another
+# process are picked up from the shared tier (the multi-worker launcher sets this).
+CACHE_MEMORY_MAX_TTL = float(os.getenv("CACHE_MEMORY_MAX_TTL", 0)) or None
+# SQLite runs in these threads, never on the event loop. A write waits up to
+# CACHE_BUSY_TIMEOUT seconds for another worker's lock before it is skipped.
+CACHE_IO_THREADS = int(os.getenv("CACHE_IO_THREADS", 4))
+CACHE_BUSY_TIMEOUT = float(os.getenv("CACHE_BUSY_TIMEOUT", 5))
+# Expired rows are deleted from the SQLite file at startup and then this often (seconds)
+CACHE_PURGE_INTERVAL = float(os.getenv("CACHE_PURGE_INTERVAL", 3600))
+
+_io_executor = ThreadPoolExecutor(max_workers=CACHE_IO_THREADS, thread_name_prefix="cache-io")
+
+async def _in_thread(fn: Callable, *args) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_io_executor, fn, *args)
+
+# msgspec writes the typed plan state (models.py) as objects of their fields
+_json_encoder = msgspec.json.Encoder(enc_hook=str)
+
+def _encode(value: Any) -> bytes:
+    return _json_encoder.encode(value)
+
+# Returned by the caches on a miss. Cached values may legitimately be None
+# (e.g. a negative geocoding result), so None cannot signal a miss.
+MISS = object()
+
+def normalize_query(text: str) -> str:
+    """
+    Folds case, accents and whitespace so "  São Paulo,Brazil" and "sao paulo, brazil"
+    share a cache key.
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    folded = stripped.casefold().replace(",", ", ")
+    return " ".join(folded.split()).replace(" ,", ",")
+
+def params_hash(params: Dict[str, Any]) -> str:
+    """Short stable hash of keyword parameters, independent of their order."""
+    canonical = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+# While set, TieredCache reads miss so the tools refetch and overwrite their entries.
+# Used by the background refresher to renew popular entries before they expire.
+_refreshing: ContextVar[bool] = ContextVar("cache_refreshing", default=False)
+
+@contextmanager
+def refreshing(enabled: bool = True):
+    """Makes tiered cache reads inside the block miss, forcing a fresh fetch."""
+    token = _refreshing.set(enabled)
+    try:
+        yield
+    finally:
+        _refreshing.reset(token)
+
+class TTLCache:
+    """
+    In-process LRU cache where every entry carries its own expiry.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = MISS) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class SQLiteStore:
+    """
+    On-disk key/value store with per-key expiry. Values are stored as JSON. The
+    methods are coroutines; the queries run in the cache I/O threads.
+    """
+    def __init__(self, path: Optional[str] = None, namespace: str = "default"):
+        self.path = path or os.getenv("CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=CACHE_BUSY_TIMEOUT)
+        if self.path != ":memory:":
+            # WAL lets every worker process read while one writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+
+    def _execute(self, sql: str, params: tuple, commit: bool = False):
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+            if commit:
+                self._conn.commit()
+            return row
+
+    async def get_entry(self, key: str) -> Tuple[Any, Optional[float]]:
+        """The value and its remaining seconds (None if unknown), or (MISS, None)."""
+        row = await _in_thread(
+            self._execute, "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+        remaining = row[1] - time.time() if row else 0
+        if remaining <= 0:
+            return MISS, None
+        return orjson.loads(row[0]), remaining
+
+    async def get(self, key: str, default: Any = MISS) -> Any:
+        value, _ = await self.get_entry(key)
+        return default if value is MISS else value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await _in_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, _encode(value).decode(), time.time() + ttl),
+            True,
+        )
+
+    async def delete(self, key: str):
+        await _in_thread(self._execute, "DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key), True)
+
+    async def purge_expired(self):
+        await _in_thread(
+            self._execute, "DELETE FROM cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time()), True
+        )
+
+def _purge_file(path: str) -> int:
+    conn = sqlite3.connect(path, timeout=CACHE_BUSY_TIMEOUT)
+    try:
+        deleted = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        conn.commit()
+        return deleted
+    finally:
+        conn.close()
+
+async def purge_expired() -> int:
+    """
+    Deletes the expired entries of every namespace from the SQLite cache file and
+    returns how many there were. Redis expires keys itself.
+    """
+    path = os.getenv("CACHE_PATH", DEFAULT_CACHE_PATH)
+    if CACHE_BACKEND != "sqlite" or path == ":memory:" or not os.path.exists(path):
+        return 0
+    return await _in_thread(_purge_file, path)
+
+async def purge_forever(interval: float = CACHE_PURGE_INTERVAL):
+    """Purges expired cache entries now and then every `interval` seconds (0 runs once)."""
+    while True:
+        try:
+            deleted = await purge_expired()
+            if deleted:
+                print(f"Cache: purged {deleted} expired entries")
+        except sqlite3.Error as e:
+            print(f"Cache: purge failed: {e}")
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+
+class LocalRedis:
+    """
+    In-process stand-in for the subset of the redis.asyncio API the caches use (GET,
+    SET with EX, DELETE, PTTL and pipelines of them), for development and tests
+    without a Redis server. Not shared between processes.
+    """
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+
+    async def get(self, name: str) -> Optional[bytes]:
+        entry = self._data.get(name)
+        if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+            self._data.pop(name, None)
+            return None
+        return entry[0]
+
+    async def set(self, name: str, value: Any, ex: Optional[float] = None):
+        data = value.encode() if isinstance(value, str) else value
+        self._data[name] = (data, time.time() + ex if ex else None)
+        return True
+
+    async def delete(self, *names: str) -> int:
+        return sum(self._data.pop(name, None) is not None for name in names)
+
+    async def pttl(self, name: str) -> int:
+        """Milliseconds to expiry; -2 if missing and -1 without expiry, as in Redis."""
+        if await self.get(name) is None:
+            return -2
+        expires_at = self._data[name][1]
+        return -1 if expires_at is None else int((expires_at - time.time()) * 1000)
+
+    def pipeline(self, transaction: bool = True) -> "LocalPipeline":
+        return LocalPipeline(self)
+
+class LocalPipeline:
+    """Queues LocalRedis commands and runs them in order on execute()."""
+    def __init__(self, client: LocalRedis):
+        self.client = client
+        self.commands: List[tuple] = []
+
+    def __getattr__(self, name: str):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self) -> List[Any]:
+        return [await getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+_redis_client = None
+
+def get_redis_client():
+    """
+    One redis.asyncio client per process for REDIS_URL. Connections are opened on
+    first use, in the running event loop. "local://" selects LocalRedis.
+    """
+    global _redis_client
+    if _redis_client is None:
+        if REDIS_URL.startswith("local://"):
+            _redis_client = LocalRedis()
+        else:
+            import redis.asyncio as redis
+            _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+async def close_redis_client():
+    """Closes the process's Redis connections (at shutdown)."""
+    global _redis_client
+    client, _redis_client = _redis_client, None
+    close = getattr(client, "aclose", None) or getattr(client, "close", None)
+    if close is not None:
+        await close()
+
+class RedisStore:
+    """
+    Same interface as SQLiteStore, on Redis (redis.asyncio, so lookups never block
+    the event loop). Keys are prefixed with the namespace and Redis expires them itself.
+    """
+    def __init__(self, namespace: str = "default", client: Any = None):
+        self.namespace = namespace
+        self.client = client or get_redis_client()
+
+    def _key(self, key: str) -> str:
+        return f"inkle:{self.namespace}:{key}"
+
+    async def get_entry(self, key: str) -> Tuple[Any, Optional[float]]:
+        # GET and PTTL in one round trip
+        raw, remaining = await self.client.pipeline(transaction=False).get(self._key(key)).pttl(self._key(key)).execute()
+        if raw is None:
+            return MISS, None
+        return orjson.loads(raw), remaining / 1000 if remaining and remaining > 0 else None
+
+    async def get(self, key: str, default: Any = MISS) -> Any:
+        value, _ = await self.get_entry(key)
+        return default if value is MISS else value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        # Redis wants a whole number of seconds of at least 1
+        await self.client.set(self._key(key), _encode(value), ex=max(1, int(ttl)))
+
+    async def delete(self, key: str):
+        await self.client.delete(self._key(key))
+
+    async def purge_expired(self):
+        pass  # Redis expires keys itself
+
+def make_store(namespace: str):
+    """
+    The shared store for a cache namespace, per CACHE_BACKEND. Falls back to SQLite
+    when Redis is selected but the redis package is not installed.
+    """
+    if CACHE_BACKEND == "none":
+        return None
+    if CACHE_BACKEND == "redis":
+        try:
+            return RedisStore(namespace)
+        except ImportError:
+            print("Warning: redis package not installed, using the SQLite cache backend")
+    return SQLiteStore(namespace=namespace)
+
+class TieredCache:
+    """
+    Memory LRU in front of an optional shared store (see make_store). Entries found
+    in the store are promoted to memory with their remaining lifetime. Memory hits
+    never leave the event loop; a store that fails (e.g. a locked SQLite file or an
+    unreachable Redis) counts as a miss, and writes to it are skipped.
+    """
+    def __init__(self, namespace: str, maxsize: int = 1024, ttl: float = 3600, persist: Optional[bool] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        if persist is None:
+            persist = env_flag("CACHE_PERSIST", True)
+        self.store = make_store(namespace) if persist else None
+        self.stats: Dict[str, int] = {
+            "hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "refreshes": 0, "store_errors": 0,
+        }
+
+    async def get(self, key: str, default: Any = MISS) -> Any:
+        if _refreshing.get():
+            self.stats["refreshes"] += 1
+            return default
+        value = self.memory.get(key)
+        if value is not MISS:
+            self.stats["hits"] += 1
+            self.stats["memory_hits"] += 1
+            return value
+        if self.store is not None:
+            try:
+                value, remaining = await self.store.get_entry(key)
+            except Exception as e:
+                self._store_error("read", e)
+                value = MISS
+            if value is not MISS:
+                if remaining:
+                    self.memory.set(key, value, ttl=self._memory_ttl(remaining))
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                return value
+        self.stats["misses"] += 1
+        return default
+
+    def _memory_ttl(self, ttl: float) -> float:
+        if self.store is not None and CACHE_MEMORY_MAX_TTL:
+            return min(ttl, CACHE_MEMORY_MAX_TTL)
+        return ttl
+
+    def _store_error(self, operation: str, error: Exception):
+        self.stats["store_errors"] += 1
+        print(f"Cache {self.namespace}: {operation} failed: {error}")
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, value, ttl=self._memory_ttl(ttl))
+        if self.store is not None:
+            try:
+                await self.store.set(key, value, ttl)
+            except Exception as e:
+                self._store_error("write", e)
+
+    async def delete(self, key: str):
+        self.memory.delete(key)
+        if self.store is not None:
+            try:
+                await self.store.delete(key)
+            except Exception as e:
+                self._store_error("delete", e)
@@ -0,0 +1,195 @@
+import math
+import os
+import re
+from collections import Counter
+from datetime import date
+from typing import Any, Dict, List, Optional
+try:
+    from backend.cache import MISS, TTLCache, normalize_query, params_hash
+    from backend.compaction import compact_costs, compact_weather
+    from backend.models import PARSERS, parse_state
+    from backend.planning import get_plan_app, plan_config
+except ImportError:
+    from cache import MISS, TTLCache, normalize_query, params_hash
+    from compaction import compact_costs, compact_weather
+    from models import PARSERS, parse_state
+    from planning import get_plan_app, plan_config
+
+CHAT_TOP_K = int(os.getenv("CHAT_TOP_K", 6))
+
+# Indexes are built once per plan and reused for every chat turn about it
+chat_indexes = TTLCache(
+    maxsize=int(os.getenv("CHAT_INDEX_CACHE_SIZE", 512)),
+    ttl=float(os.getenv("CHAT_INDEX_TTL", 3600)),
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are at be can do does for from how i in is it me my of on or our should "
+    "the there to we what when where which who will with you".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    return [w for w in _WORD.findall(normalize_query(text)) if w not in _STOPWORDS]
+
+class BM25Index:
+    """
+    Okapi BM25 over short text chunks. Plans produce a few dozen chunks, so a plain
+    in-memory index is fast enough and needs no embedding model.
+    """
+    def __init__(self, chunks: List[str], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(chunks)) if chunks else 0
+        doc_freq: Counter = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def search(self, query: str, k: int = CHAT_TOP_K) -> List[str]:
+        """
+        Top-k chunks for the query, in their original order. When fewer than k chunks
+        match (e.g. "summarize my trip"), the rest are filled from the start of the
+        plan, which holds the overview and the day-by-day plan.
+        """
+        terms = [t for t in tokenize(query) if t in self.idf]
+        scores = []
+        for i, tf in enumerate(self.term_freqs):
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+            score = sum(self.idf[t] * tf[t] * (self.k1 + 1) / (tf[t] + norm) for t in terms if tf[t])
+            if score > 0:
+                scores.append((score, i))
+        best = {i for _, i in sorted(scores, reverse=True)[:k]}
+        for i in range(len(self.chunks)):
+            if len(best) >= k:
+                break
+            best.add(i)
+        return [self.chunks[i] for i in sorted(best)]
+
+def _fields(**values: Any) -> str:
+    return ", ".join(f"{key.replace('_', ' ')} {value}" for key, value in values.items() if value not in (None, "", []))
+
+def _unit(value: Any, unit: str) -> Any:
+    return None if value is None else f"{value}{unit}"
+
+def _weekday(iso_date: Any) -> Any:
+    try:
+        return date.fromisoformat(iso_date).strftime("%A")
+    except (TypeError, ValueError):
+        return None
+
+def _records(items: Any) -> List[Dict[str, Any]]:
+    """The dict entries of an itinerary list; inline contexts may hold anything."""
+    return [item for item in items if isinstance(item, dict)] if isinstance(items, list) else []
+
+def chunk_plan(state: Dict[str, Any]) -> List[str]:
+    """
+    Splits a plan into small self-contained text chunks: the itinerary overview first,
+    then one chunk per day, attraction, restaurant, weather day and travel leg. Raw
+    polylines and API envelopes are left out. Accepts either the full plan state or
+    just its structured itinerary (what older clients send as chat context).
+    """
+    itinerary = state.get("structured_itinerary")
+    if itinerary is None and ("daily_plan" in state or "trip_title" in state):
+        # Just the itinerary: there is no plan data beside it
+        itinerary, state = state, {}
+    if not isinstance(itinerary, dict):
+        itinerary = {}
+    # Inline contexts and older checkpoints hold plain dicts. Plan data that does not
+    # parse is left out; the rest of the context is still indexed.
+    try:
+        state = parse_state(state)
+    except (AttributeError, TypeError):
+        state = {key: value for key, value in state.items() if key not in PARSERS}
+
+    chunks = []
+    overview = _fields(
+        trip=itinerary.get("trip_title") or state.get("destination"),
+        days=state.get("days") or len(_records(itinerary.get("daily_plan"))) or None,
+        weather=itinerary.get("weather_summary"),
+    )
+    if overview:
+        chunks.append(f"Overview: {overview}")
+    if isinstance(itinerary.get("costs"), dict) and itinerary["costs"]:
+        chunks.append(f"Budget: {_fields(**itinerary['costs'])}")
+    for day in _records(itinerary.get("daily_plan")):
+        chunks.append(f"Day {day.get('day')}: " + "; ".join(str(a) for a in day.get("activities") or []))
+    for attraction in _records(itinerary.get("attractions")):
+        chunks.append("Attraction: " + _fields(
+            name=attraction.get("name"), visit_order=attraction.get("visit_order"),
+            rating=attraction.get("rating"), about=attraction.get("description"),
+        ))
+    for dining in _records(itinerary.get("dining")):
+        chunks.append("Restaurant: " + _fields(
+            name=dining.get("name"), cuisine=dining.get("cuisine"),
+            rating=dining.get("rating"), about=dining.get("description"),
+        ))
+
+    for place in state.get("places") or []:
+        chunks.append("Attraction location: " + _fields(
+            name=place.name, address=place.address, rating=place.rating,
+            category=(place.categories or [None])[0],
+        ))
+    for restaurant in state.get("restaurants") or []:
+        chunks.append("Restaurant location: " + _fields(
+            name=restaurant.name, address=restaurant.address,
+            rating=restaurant.rating, price_level=restaurant.price_level,
+        ))
+    weather = compact_weather(state.get("weather")) or {}
+    # Worded the way people ask ("will it rain on Saturday?")
+    now = weather.get("now")
+    if now:
+        chunks.append("Weather now: " + _fields(
+            temperature=_unit(now.get("temp_c"), "°C"), rain=_unit(now.get("precip_mm"), " mm"),
+            wind=_unit(now.get("wind_kmh"), " km/h"),
+        ))
+    for day in weather.get("days") or []:
+        chunks.append("Weather forecast: " + _fields(
+            day=_weekday(day.get("date")), date=day.get("date"), high=_unit(day.get("max_c"), "°C"),
+            low=_unit(day.get("min_c"), "°C"), chance_of_rain=_unit(day.get("precip_prob"), "%"),
+        ))
+    route = state.get("route")
+    if route and route.distance_meters:
+        chunks.append("Route: " + _fields(total_distance_km=round(route.distance_meters / 1000, 1), total_duration=route.duration))
+    for leg in compact_costs(state.get("costs")):
+        chunks.append("Travel leg: " + _fields(**leg))
+    return chunks
+
+def index_for_state(key: str, state: Dict[str, Any]) -> BM25Index:
+    index = chat_indexes.get(key)
+    if index is MISS:
+        index = BM25Index(chunk_plan(state))
+        chat_indexes.set(key, index)
+    return index
+
+async def get_plan_index(plan_id: str) -> BM25Index:
+    """
+    Index for a checkpointed plan. Raises KeyError for an unknown plan_id.
+    """
+    index = chat_indexes.get(f"plan:{plan_id}")
+    if index is not MISS:
+        return index
+    plan_app = await get_plan_app()
+    state = (await plan_app.aget_state(plan_config(plan_id))).values
+    if not state:
+        raise KeyError(f"Unknown plan_id: {plan_id}")
+    return index_for_state(f"plan:{plan_id}", state)
+
+def get_context_index(context: Dict[str, Any]) -> BM25Index:
+    """Index for a context sent inline by older clients, keyed by its content."""
+    return index_for_state(f"context:{params_hash(context)}", context)
+
+async def relevant_chunks(message: str, plan_id: Optional[str] = None, context: Optional[Dict[str, Any]] = None, k: int = CHAT_TOP_K) -> List[str]:
+    """
+    The chunks to put in the chat prompt. The overview is always included, since it
+    frames every answer and costs a few dozen tokens.
+    """
+    index = await get_plan_index(plan_id) if plan_id else get_context_index(context or {})
+    chunks = index.search(message, k)
+    if index.chunks and index.chunks[0].startswith("Overview:") and index.chunks[0] not in chunks:
+        chunks = [index.chunks[0]] + chunks
+    return chunks
@@ -0,0 +1,108 @@
+from typing import Any, Dict, List, Optional
+try:
+    from backend.models import Costs, Place, Weather, dumps
+except ImportError:
+    from models import Costs, Place, Weather, dumps
+
+# Rough characters-per-token ratio for English/JSON text; good enough to compare
+# prompt sizes without calling the model's tokenizer endpoint.
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a prompt fragment."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+def _at(values: Optional[List[Any]], i: int) -> Any:
+    return values[i] if values and i < len(values) else None
+
+def compact_weather(weather: Optional[Weather]) -> Optional[Dict[str, Any]]:
+    """
+    Reduces a forecast to today's conditions and daily max/min/precipitation.
+    """
+    if not weather or not weather.daily:
+        return None
+    daily = weather.daily
+    days = []
+    for i, date in enumerate(daily.time):
+        days.append({
+            "date": date,
+            "max_c": _at(daily.temperature_2m_max, i),
+            "min_c": _at(daily.temperature_2m_min, i),
+            "precip_prob": _at(daily.precipitation_probability_max, i),
+        })
+    compact: Dict[str, Any] = {"days": days}
+    current = weather.current
+    if current:
+        compact["now"] = {
+            "temp_c": current.temperature_2m,
+            "precip_mm": current.precipitation,
+            "wind_kmh": current.wind_speed_10m,
+        }
+    return compact
+
+def compact_places(places: Optional[List[Place]]) -> List[Dict[str, Any]]:
+    """Attractions as name, rating and category, in visiting order."""
+    return [
+        {"name": p.name, "rating": p.rating, "category": (p.categories or [None])[0]}
+        for p in places or []
+    ]
+
+def compact_restaurants(restaurants: Optional[List[Place]]) -> List[Dict[str, Any]]:
+    """Restaurants as name, rating and price level."""
+    return [
+        {"name": r.name, "rating": r.rating, "price_level": r.price_level}
+        for r in restaurants or []
+    ]
+
+def compact_costs(costs: Optional[Costs]) -> List[Dict[str, Any]]:
+    """
+    One row per leg: distance, minutes in each mode (prefixed "~" when estimated)
+    and the transit fare when known.
+    """
+    rows = []
+    for leg in costs.legs if costs else []:
+        row: Dict[str, Any] = {"from": leg.origin, "to": leg.destination}
+        for mode, cost in leg.modes.items():
+            if cost is None:
+                continue
+            if "km" not in row and cost.distance_m is not None:
+                row["km"] = round(cost.distance_m / 1000, 1)
+            if cost.duration_s is not None:
+                approx = "~" if cost.source == "estimate" else ""
+                row[f"{mode}_min"] = f"{approx}{round(cost.duration_s / 60)}"
+            if cost.fare:
+                row["fare"] = cost.fare
+        rows.append(row)
+    return rows
+
+def compact_data_summary(data_summary: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turns the synthesizer's raw data summary into the minimal form the prompt needs.
+    """
+    return {
+        "destination": data_summary.get("destination"),
+        "weather": compact_weather(data_summary.get("weather")),
+        "places": compact_places(data_summary.get("places")),
+        "restaurants": compact_restaurants(data_summary.get("restaurants")),
+        "route_summary": data_summary.get("route_summary"),
+        "costs": compact_costs(data_summary.get("costs")),
+        "days": data_summary.get("days"),
+    }
+
+def payload_tokens(value: Any) -> int:
+    """Approximate token count of a tool result, as its JSON would appear in a prompt."""
+    return estimate_tokens(dumps(value).decode())
+
+def prompt_token_report(data_summary: Dict[str, Any], compact: Dict[str, Any], raw_tokens: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    Approximate token counts of the raw and compacted data for logging. The state only
+    holds parsed models, so `raw_tokens` has the size of each tool's raw output as the
+    graph received it (AgentState.raw_tokens); fields without one are measured as they
+    are in `data_summary`.
+    """
+    raw_tokens = raw_tokens or {}
+    rest = {key: value for key, value in data_summary.items() if key not in raw_tokens}
+    return {
+        "before": payload_tokens(rest) + sum(raw_tokens.values()),
+        "after": payload_tokens(compact),
+    }
@@ -1,183 +1,225 @@
-from typing import TypedDict, List, Dict, Any, Annotated
-from langgraph.graph import StateGraph, END
+from typing import TypedDict, List, Dict, Any, Annotated, Optional
 try:
     from backend.tools.geocoding import get_coordinates
     from backend.tools.weather import get_weather_forecast
     from backend.tools.places import search_attractions, search_restaurants
     from backend.tools.routing import calculate_route
-    from backend.tools.costs import estimate_travel_costs
-    from backend.llm_factory import get_llm
+    from backend.tools.route_optimizer import optimize_route
+    from backend.tools.costs import estimate_leg_costs
+    from backend.synthesis import synthesize_itinerary
+    from backend.compaction import payload_tokens
+    from backend.models import (
+        Coordinates, Weather, Place, Route, Costs, CostLeg,
+        parse_coordinates, parse_weather, parse_places, parse_route, parse_leg_cost,
+    )
+    from backend.metrics import instrument_node
+    from backend.tools.resilience import budgeted
 except ImportError:
     # When running on Railway, imports are relative
     from tools.geocoding import get_coordinates
     from tools.weather import get_weather_forecast
     from tools.places import search_attractions, search_restaurants
     from tools.routing import calculate_route
-    from tools.costs import estimate_travel_costs
-    from llm_factory import get_llm
-from langchain_core.messages import HumanMessage, SystemMessage
+    from tools.route_optimizer import optimize_route
+    from tools.costs import estimate_leg_costs
+    from synthesis import synthesize_itinerary
+    from compaction import payload_tokens
+    from models import (
+        Coordinates, Weather, Place, Route, Costs, CostLeg,
+        parse_coordinates, parse_weather, parse_places, parse_route, parse_leg_cost,
+    )
+    from metrics import instrument_node
+    from tools.resilience import budgeted
+import asyncio
 import json
+import msgspec
+import os
+import threading
+
+# "local" orders stops in-process and only asks Google Routes for the polyline/ETA;
+# "google" lets the Routes API optimize the waypoint order.
+ROUTE_OPTIMIZER = os.getenv("ROUTE_OPTIMIZER", "local")
+
+# Tool results are parsed into the typed models (models.py) as they enter the state
+def _merge(left: Optional[Dict[str, int]], right: Optional[Dict[str, int]]) -> Dict[str, int]:
+    return {**(left or {}), **(right or {})}
 
 class AgentState(TypedDict):
     destination: str
-    coordinates: Dict[str, float]
-    weather: Dict[str, Any]
-    places: List[Dict[str, Any]]
-    restaurants: List[Dict[str, Any]]
-    route: Dict[str, Any]
-    costs: Dict[str, Any]
+    coordinates: Optional[Coordinates]
+    weather: Optional[Weather]
+    places: List[Place]
+    restaurants: List[Place]
+    route: Optional[Route]
+    costs: Optional[Costs]
     final_itinerary: str
     structured_itinerary: Dict[str, Any] # New field for JSON output
+    days: int # Optional trip length; the LLM picks one when unset
+    # Approximate tokens of each tool's raw output, for the synthesizer's prompt report
+    raw_tokens: Annotated[Dict[str, int], _merge]
 
 async def geocode_node(state: AgentState):
     print(f"Geocoding: {state['destination']}")
     coords = await get_coordinates(state['destination'])
-    return {"coordinates": coords}
+    return {"coordinates": parse_coordinates(coords)}
 
 async def weather_node(state: AgentState):
     if not state.get("coordinates"):
-        return {"weather": {"error": "No coordinates"}}
-    lat = state["coordinates"]["lat"]
-    lon = state["coordinates"]["lon"]
+        return {"weather": None}
+    lat = state["coordinates"].lat
+    lon = state["coordinates"].lon
     print(f"Fetching weather for: {lat}, {lon}")
-    weather = await get_weather_forecast(lat, lon)
-    return {"weather": weather}
+    weather = await get_weather_forecast(lat, lon, days=state.get("days"))
+    return {"weather": parse_weather(weather), "raw_tokens": {"weather": payload_tokens(weather)}}
 
 async def places_node(state: AgentState):
     if not state.get("coordinates"):
         return {"places": [], "restaurants": []}
-    lat = state["coordinates"]["lat"]
-    lon = state["coordinates"]["lon"]
+    lat = state["coordinates"].lat
+    lon = state["coordinates"].lon
     print(f"Fetching places for: {lat}, {lon}")
-    places = await search_attractions(lat, lon, query_context=state["destination"])
-    restaurants = await search_restaurants(lat, lon)
-    return {"places": places, "restaurants": restaurants}
+    # Attractions and restaurants are independent lookups, so fetch them together
+    places, restaurants = await asyncio.gather(
+        search_attractions(lat, lon, query_context=state["destination"]),
+        search_restaurants(lat, lon),
+    )
+    return {
+        "places": parse_places(places),
+        "restaurants": parse_places(restaurants),
+        "raw_tokens": {"places": payload_tokens(places), "restaurants": payload_tokens(restaurants)},
+    }
+
+def _locations(state: AgentState) -> List[Dict[str, float]]:
+    # Origin (City Center) -> Place 1 -> ... -> Place N, as the routing tools take them
+    origin = state["coordinates"]
+    return [{"lat": origin.lat, "lon": origin.lon}] + [{"lat": p.lat, "lon": p.lon} for p in state.get("places", [])]
 
 async def route_node(state: AgentState):
     places = state.get("places", [])
     if not places:
-        return {"route": {}}
+        return {"route": None}
     
-    # Prepare locations for routing: Origin (City Center) -> Place 1 -> ... -> Place N
-    locations = [state["coordinates"]] + [{"lat": p["lat"], "lon": p["lon"]} for p in places]
-    print("Calculating route...")
-    route = await calculate_route(locations)
+    locations = _locations(state)
+    if ROUTE_OPTIMIZER == "local":
+        print("Optimizing route locally...")
+        route = parse_route(optimize_route(locations))
+    else:
+        print("Calculating route...")
+        # Approximate fallback: order the stops locally if Routes cannot answer
+        route = parse_route(await calculate_route(locations)) or parse_route(optimize_route(locations))
     
     # Apply optimization to places order immediately
-    route_data = route.get("routes", [{}])[0]
-    optimized_indices = route_data.get("optimizedIntermediateWaypointIndex", [])
-    
-    if optimized_indices and len(optimized_indices) == len(places):
-        print(f"Reordering places based on optimized route: {optimized_indices}")
-        optimized_places = [places[i] for i in optimized_indices]
+    if route and route.order and len(route.order) == len(places):
+        print(f"Reordering places based on optimized route: {route.order}")
+        optimized_places = [places[i] for i in route.order]
         return {"route": route, "places": optimized_places}
         
     return {"route": route}
 
+async def route_geometry_node(state: AgentState):
+    """
+    Fetches the polyline and ETA for an order that was optimized locally. Runs alongside
+    the cost estimate, so the Routes round trip is off the ordering critical path.
+    """
+    route = state.get("route")
+    if route is None or route.optimizer != "local":
+        return {}
+
+    print("Fetching route geometry...")
+    geometry = parse_route(await calculate_route(_locations(state), optimize_waypoint_order=False))
+    if geometry is None:
+        # No Routes key or upstream error: keep the locally optimized order
+        return {}
+
+    return {"route": msgspec.structs.replace(
+        route,
+        distance_meters=geometry.distance_meters if geometry.distance_meters is not None else route.distance_meters,
+        duration=geometry.duration,
+        polyline=geometry.polyline,
+    )}
+
 async def cost_node(state: AgentState):
     places = state.get("places", [])
     if not places:
-        return {"costs": {}}
+        return {"costs": None}
     
-    # Simple cost estimation between sequential points
-    origins = [state["coordinates"]] + [{"lat": p["lat"], "lon": p["lon"]} for p in places[:-1]]
-    destinations = [{"lat": p["lat"], "lon": p["lon"]} for p in places]
+    # Only the legs we travel, in visiting order: city center -> place 1 -> ... -> place N
+    stops = [Place(name="City center", lat=state["coordinates"].lat, lon=state["coordinates"].lon)] + places
+    pairs = list(zip(stops, stops[1:]))
+    legs = [({"lat": a.lat, "lon": a.lon}, {"lat": b.lat, "lon": b.lon}) for a, b in pairs]
     
     print("Estimating costs...")
-    costs = await estimate_travel_costs(origins, destinations)
-    return {"costs": costs}
+    table = await estimate_leg_costs(legs)
+    return {
+        "costs": Costs(legs=[
+            CostLeg(origin=a.name, destination=b.name, modes={mode: parse_leg_cost(cost) for mode, cost in modes.items()})
+            for (a, b), modes in zip(pairs, table)
+        ]),
+        "raw_tokens": {"costs": payload_tokens(table)},
+    }
 
 async def synthesizer_node(state: AgentState):
-    llm = get_llm()
-    
-    # Construct a prompt with all the gathered data
-    data_summary = {
-        "destination": state["destination"],
-        "weather": state.get("weather"),
-        "places": state.get("places"),
-        "restaurants": state.get("restaurants"),
-        "route_summary": state.get("route", {}).get("routes", [{}])[0].get("summary", "N/A"),
-        "costs": state.get("costs")
-    }
-    
-    prompt = f"""
-    You are an expert Travel Agent. Create a detailed itinerary for a trip to {state['destination']}.
-    
-    Here is the real-time data I have gathered:
-    {json.dumps(data_summary, default=str)}
-    
-    CRITICAL INSTRUCTIONS:
-    1. **STRICTLY FORBIDDEN TO HALLUCINATE**: You must ONLY use the Attractions and Restaurants explicitly listed in the `places` and `restaurants` arrays above.
-    2. **OUTPUT FORMAT**: You must return a valid JSON object. Do NOT return Markdown. Do NOT return code blocks. Just the raw JSON.
-    
-    The JSON structure must be exactly:
-    {{
-      "trip_title": "...",
-      "weather_summary": "...",
-      "attractions": [
-        {{
-          "name": "...",
-          "description": "...",
-          "rating": 4.5,
-          "visit_order": 1
-        }}
-      ],
-      "dining": [
-        {{
-          "name": "...",
-          "description": "...",
-          "cuisine": "...",
-          "rating": 4.0
-        }}
-      ],
-      "costs": {{
-        "transport_estimate": "...",
-        "total_estimate": "..."
-      }},
-      "daily_plan": [
-        {{
-          "day": 1,
-          "activities": ["..."]
-        }}
-      ]
-    }}
-    
-    Be enthusiastic in the descriptions but strictly factual based on the provided data.
-    """
-    
-    response = await llm.ainvoke([HumanMessage(content=prompt)])
-    
-    # Clean up response to ensure valid JSON
-    content = response.content.strip()
-    if content.startswith("```json"):
-        content = content[7:]
-    if content.endswith("```"):
-        content = content[:-3]
-        
-    try:
-        structured_data = json.loads(content)
-    except json.JSONDecodeError:
-        print("Error decoding JSON from LLM")
-        structured_data = {}
-
-    return {"final_itinerary": response.content, "structured_itinerary": structured_data}
-
-# Build the Graph
-workflow = StateGraph(AgentState)
-
-workflow.add_node("geocoder", geocode_node)
-workflow.add_node("fetch_weather", weather_node)
-workflow.add_node("fetch_places", places_node)
-workflow.add_node("calculate_route", route_node)
-workflow.add_node("calculate_cost", cost_node)
-workflow.add_node("synthesizer", synthesizer_node)
-
-workflow.set_entry_point("geocoder")
-workflow.add_edge("geocoder", "fetch_weather")
-workflow.add_edge("fetch_weather", "fetch_places")
-workflow.add_edge("fetch_places", "calculate_route")
-workflow.add_edge("calculate_route", "calculate_cost")
-workflow.add_edge("calculate_cost", "synthesizer")
-workflow.add_edge("synthesizer", END)
-
-app = workflow.compile()
+    # Validated against the Pydantic itinerary models; long trips are written in parallel parts
+    itinerary = await synthesize_itinerary(state)
+    return {"final_itinerary": json.dumps(itinerary), "structured_itinerary": itinerary}
+
+# The graph is built and compiled on first use, not at import, so the web server and
+# the MCP server can start (and bind their port) before LangGraph is even loaded.
+_graph_lock = threading.RLock()
+_workflow = None
+_app = None
+
+def get_workflow():
+    """The trip StateGraph, built once. planning.py compiles it with a checkpointer."""
+    global _workflow
+    with _graph_lock:
+        if _workflow is None:
+            from langgraph.graph import StateGraph, END
+
+            workflow = StateGraph(AgentState)
+
+            # Each tool node gets a time budget within the request's deadline (see
+            # tools/resilience.py), so one stalled upstream cannot hold the plan.
+
+            workflow.add_node("geocoder", instrument_node("geocoder", budgeted("geocoder", geocode_node)))
+            workflow.add_node("fetch_weather", instrument_node("fetch_weather", budgeted("fetch_weather", weather_node)))
+            workflow.add_node("fetch_places", instrument_node("fetch_places", budgeted("fetch_places", places_node)))
+            workflow.add_node("calculate_route", instrument_node("calculate_route", budgeted("calculate_route", route_node)))
+            workflow.add_node("fetch_route_geometry", instrument_node("fetch_route_geometry", budgeted("fetch_route_geometry", route_geometry_node)))
+            workflow.add_node("calculate_cost", instrument_node("calculate_cost", budgeted("calculate_cost", cost_node)))
+            # Deferred: runs once, after every branch that was triggered in this run has finished.
+            # Unlike a fixed join this also holds for partial re-runs (see planning.replan).
+            workflow.add_node("synthesizer", instrument_node("synthesizer", synthesizer_node), defer=True)
+
+            # Weather and places only depend on the coordinates, so they fan out in parallel
+            # after geocoding. Route and cost depend on the places found; once the visiting
+            # order is known, route geometry and cost are fetched in parallel. The synthesizer
+            # waits for every branch to finish.
+            workflow.set_entry_point("geocoder")
+            workflow.add_edge("geocoder", "fetch_weather")
+            workflow.add_edge("geocoder", "fetch_places")
+            workflow.add_edge("fetch_places", "calculate_route")
+            workflow.add_edge("calculate_route", "fetch_route_geometry")
+            workflow.add_edge("calculate_route", "calculate_cost")
+            workflow.add_edge("fetch_weather", "synthesizer")
+            workflow.add_edge("fetch_route_geometry", "synthesizer")
+            workflow.add_edge("calculate_cost", "synthesizer")
+            workflow.add_edge("synthesizer", END)
+            _workflow = workflow
+    return _workflow
+
+def get_app():
+    """The graph compiled without a checkpointer, compiled once."""
+    global _app
+    with _graph_lock:
+        if _app is None:
+            _app = get_workflow().compile()
+    return _app
+
+def __getattr__(name: str):
+    # `from backend.graph import app` keeps working; the graph is compiled on access
+    if name == "app":
+        return get_app()
+    if name == "workflow":
+        return get_workflow()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
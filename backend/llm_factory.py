@@ -1,20 +1,170 @@
+import hashlib
+import json
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
+import time
+from typing import Any, AsyncIterator, Dict, List, Tuple
 from dotenv import load_dotenv
+try:
+    from backend.cache import MISS, TieredCache
+    from backend.tools.governor import MAX_RETRIES, get_governor, is_rate_limit_error
+    from backend.metrics import LLM_DURATION, LLM_TOKENS, span
+except ImportError:
+    from cache import MISS, TieredCache
+    from tools.governor import MAX_RETRIES, get_governor, is_rate_limit_error
+    from metrics import LLM_DURATION, LLM_TOKENS, span
 
 load_dotenv()
 
+# One client per (model, temperature); the underlying SDK keeps its own connection pool
+_llm_pool: Dict[Tuple[str, float], Any] = {}
+
+def load_llm_class():
+    """
+    Imports the Gemini chat model class. The SDK takes over a second to import, so it
+    is loaded on first use (or preloaded in the background) rather than at startup.
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI
+
 def get_llm(model_name: str = "gemini-2.0-flash", temperature: float = 0.7):
     """
-    Returns a configured ChatGoogleGenerativeAI instance.
+    Returns a configured ChatGoogleGenerativeAI instance, reused across calls.
     """
+    key = (model_name, temperature)
+    llm = _llm_pool.get(key)
+    if llm is not None:
+        return llm
+
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise ValueError("GOOGLE_API_KEY not found in environment variables.")
-    
-    return ChatGoogleGenerativeAI(
+
+    llm = load_llm_class()(
         model=model_name,
         temperature=temperature,
         google_api_key=api_key,
         convert_system_message_to_human=True # Sometimes needed for older models, safe to keep
     )
+    _llm_pool[key] = llm
+    return llm
+
+def set_llm(llm: Any, model_name: str = "gemini-2.0-flash", temperature: float = 0.7):
+    """
+    Replaces the pooled client for (model, temperature), e.g. with a fake model in
+    benchmarks. Passing None drops the override.
+    """
+    if llm is None:
+        _llm_pool.pop((model_name, temperature), None)
+    else:
+        _llm_pool[(model_name, temperature)] = llm
+
+# Response cache: "memory" (default), "shared" (or "sqlite") to keep responses in the
+# shared cache backend across restarts and worker processes, or "off"
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+
+response_cache = TieredCache(
+    "llm",
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("LLM_CACHE_TTL", 600)),
+    persist=LLM_CACHE_BACKEND in ("shared", "sqlite"),
+)
+
+def prompt_cache_key(namespace: str, llm: Any, payload: Any) -> str:
+    """
+    Canonical hash of a prompt payload, so the same data in a different key order
+    still hits the cache. Model and temperature are part of the key.
+    """
+    canonical = json.dumps(
+        {
+            "namespace": namespace,
+            "model": getattr(llm, "model", None),
+            "temperature": getattr(llm, "temperature", None),
+            "payload": payload,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+async def governed_ainvoke(llm: Any, messages: List[Any], endpoint: str = "llm", **invoke_kwargs) -> Any:
+    """
+    Invokes the LLM through the "gemini" rate governor, backing off on quota errors.
+    Duration and token usage are recorded under `endpoint`. Extra keyword arguments
+    (e.g. response_json_schema) are passed to the model call.
+    """
+    governor = get_governor("gemini")
+    for attempt in range(MAX_RETRIES + 1):
+        async with governor.slot():
+            start = time.perf_counter()
+            try:
+                with span("llm.invoke", endpoint=endpoint):
+                    response = await llm.ainvoke(messages, **invoke_kwargs)
+            except Exception as e:
+                LLM_DURATION.observe(time.perf_counter() - start, endpoint=endpoint, status="error")
+                if attempt == MAX_RETRIES or not is_rate_limit_error(e):
+                    raise
+                governor.throttled()
+                print(f"gemini: rate limited (attempt {attempt + 1})")
+                continue
+        LLM_DURATION.observe(time.perf_counter() - start, endpoint=endpoint, status="ok")
+        usage = getattr(response, "usage_metadata", None) or {}
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), endpoint=endpoint, kind="input")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), endpoint=endpoint, kind="output")
+        governor.succeeded()
+        return response
+
+async def cached_ainvoke(llm: Any, messages: List[Any], namespace: str, payload: Any, **invoke_kwargs) -> str:
+    """
+    Invokes the LLM unless an identical payload was answered within LLM_CACHE_TTL.
+    `payload` is the data the prompt was built from (not the prompt text itself).
+    Returns the response text.
+    """
+    if LLM_CACHE_BACKEND == "off":
+        response = await governed_ainvoke(llm, messages, endpoint=namespace, **invoke_kwargs)
+        return response.content
+
+    key = prompt_cache_key(namespace, llm, payload)
+    cached = await response_cache.get(key)
+    if cached is not MISS:
+        return cached
+
+    response = await governed_ainvoke(llm, messages, endpoint=namespace, **invoke_kwargs)
+    if response.content:
+        await response_cache.set(key, response.content)
+    return response.content
+
+async def cached_astream(llm: Any, messages: List[Any], namespace: str, payload: Any) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of cached_ainvoke: yields the response text as the model
+    produces it. A cache hit is yielded in one piece; a completed stream is cached.
+    """
+    key = prompt_cache_key(namespace, llm, payload)
+    if LLM_CACHE_BACKEND != "off":
+        cached = await response_cache.get(key)
+        if cached is not MISS:
+            yield cached
+            return
+
+    governor = get_governor("gemini")
+    parts: List[str] = []
+    usage: Dict[str, int] = {}
+    async with governor.slot():
+        start = time.perf_counter()
+        try:
+            with span("llm.stream", endpoint=namespace):
+                async for chunk in llm.astream(messages):
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield chunk.content
+        except Exception as e:
+            LLM_DURATION.observe(time.perf_counter() - start, endpoint=namespace, status="error")
+            if is_rate_limit_error(e):
+                governor.throttled()
+            raise
+    LLM_DURATION.observe(time.perf_counter() - start, endpoint=namespace, status="ok")
+    LLM_TOKENS.inc(usage.get("input_tokens", 0), endpoint=namespace, kind="input")
+    LLM_TOKENS.inc(usage.get("output_tokens", 0), endpoint=namespace, kind="output")
+    governor.succeeded()
+    if parts and LLM_CACHE_BACKEND != "off":
+        await response_cache.set(key, "".join(parts))
@@ -0,0 +1,55 @@
+from fastmcp import FastMCP
+try:
+    from backend.tools.geocoding import get_coordinates
+    from backend.tools.weather import get_weather_forecast
+    from backend.tools.places import search_attractions, search_restaurants
+    from backend.tools.routing import calculate_route
+    from backend.planning import run_plan
+except ImportError:
+    # When running on Railway, imports are relative
+    from tools.geocoding import get_coordinates
+    from tools.weather import get_weather_forecast
+    from tools.places import search_attractions, search_restaurants
+    from tools.routing import calculate_route
+    from planning import run_plan
+
+# MCP server for MCP clients, kept apart from the web API (server.py) so neither
+# loads the other's framework. Run with `fastmcp run backend/mcp_server.py`.
+mcp = FastMCP("TouristPlanner")
+
+# --- Register Atomic Tools ---
+@mcp.tool()
+async def get_place_coordinates(place_name: str):
+    """Get latitude and longitude for a place."""
+    return await get_coordinates(place_name)
+
+@mcp.tool()
+async def get_weather(lat: float, lon: float):
+    """Get weather forecast for coordinates."""
+    return await get_weather_forecast(lat, lon)
+
+@mcp.tool()
+async def find_attractions(lat: float, lon: float):
+    """Find top tourist attractions near coordinates."""
+    return await search_attractions(lat, lon)
+
+@mcp.tool()
+async def find_restaurants(lat: float, lon: float):
+    """Find restaurants near coordinates."""
+    return await search_restaurants(lat, lon)
+
+@mcp.tool()
+async def optimize_route(locations: list):
+    """Optimize driving route for a list of locations."""
+    return await calculate_route(locations)
+
+@mcp.tool()
+async def plan_full_trip(destination: str):
+    """
+    Plan a complete trip to a destination.
+    """
+    result = await run_plan(destination)
+    return result["final_itinerary"]
+
+if __name__ == "__main__":
+    mcp.run()
@@ -0,0 +1,119 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# OpenTelemetry is optional: spans are only emitted when the API is installed and a
+# tracer provider is configured by the deployment.
+try:
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("inkle")
+except ImportError:
+    _tracer = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _format_labels(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format."""
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            # One count per bucket, then sum and count
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {count:g}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series[-1]:g}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]:g}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]:g}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+NODE_DURATION = Histogram("inkle_node_duration_seconds", "Latency of each trip graph node.")
+UPSTREAM_DURATION = Histogram("inkle_upstream_request_duration_seconds", "Latency of upstream HTTP calls by status.")
+UPSTREAM_RESPONSE_BYTES = Histogram("inkle_upstream_response_bytes", "Size of upstream response bodies.", SIZE_BUCKETS)
+LLM_DURATION = Histogram("inkle_llm_duration_seconds", "Latency of LLM calls.")
+LLM_TOKENS = Counter("inkle_llm_tokens_total", "LLM tokens used, by direction.")
+
+_registry = [NODE_DURATION, UPSTREAM_DURATION, UPSTREAM_RESPONSE_BYTES, LLM_DURATION, LLM_TOKENS]
+
+# Extra text sections (e.g. governor and cache gauges) appended at scrape time
+_collectors: List[Callable[[], List[str]]] = []
+
+def register_collector(collector: Callable[[], List[str]]):
+    _collectors.append(collector)
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+@contextmanager
+def span(name: str, **attributes):
+    """OpenTelemetry span when available, otherwise a no-op."""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name) as current:
+        for key, value in attributes.items():
+            current.set_attribute(key, value)
+        yield current
+
+def instrument_node(name: str, node: Callable):
+    """Wraps a graph node so its latency is recorded under `name`."""
+    @functools.wraps(node)
+    async def wrapper(state):
+        start = time.perf_counter()
+        with span(f"node.{name}"):
+            try:
+                return await node(state)
+            finally:
+                NODE_DURATION.observe(time.perf_counter() - start, node=name)
+    return wrapper
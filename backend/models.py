@@ -0,0 +1,226 @@
+"""
+Typed plan data. Tool results are converted into these msgspec Structs once, in the
+graph nodes, so the state LangGraph copies and checkpoints at every step holds only
+the fields a plan uses instead of whole upstream payloads (API envelopes, units,
+Distance Matrix rows). msgspec encodes and decodes them natively, for the responses
+(dumps) and the checkpoints (pack/unpack).
+
+The parse_* functions also accept their own serialized form, so a state coming back
+from a client, the shared cache or an older checkpoint is parsed where it enters.
+A value of the wrong type is dropped there, as if the upstream had left it out.
+"""
+from typing import Any, Dict, List, Optional
+
+import msgspec
+import ormsgpack
+
+class Model(msgspec.Struct, gc=False):
+    """Base of the plan models. They hold no reference cycles, so the GC skips them."""
+    def _asdict(self) -> Dict[str, Any]:
+        # LangGraph's own serializer writes objects with an _asdict by keyword
+        return msgspec.structs.asdict(self)
+
+class Coordinates(Model):
+    lat: float
+    lon: float
+    formatted: Optional[str] = None
+
+class Place(Model):
+    """An attraction or a restaurant."""
+    name: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    address: Optional[str] = None
+    rating: Optional[float] = None
+    categories: Optional[List[str]] = None
+    price_level: Optional[str] = None
+
+class CurrentWeather(Model):
+    time: Optional[str] = None
+    temperature_2m: Optional[float] = None
+    precipitation: Optional[float] = None
+    weather_code: Optional[int] = None
+    wind_speed_10m: Optional[float] = None
+
+class DailyForecast(Model):
+    time: List[str] = msgspec.field(default_factory=list)
+    temperature_2m_max: List[Optional[float]] = msgspec.field(default_factory=list)
+    temperature_2m_min: List[Optional[float]] = msgspec.field(default_factory=list)
+    precipitation_probability_max: List[Optional[int]] = msgspec.field(default_factory=list)
+
+class Weather(Model):
+    """Open-Meteo's current conditions and daily forecast, with the same field names."""
+    current: Optional[CurrentWeather] = None
+    daily: Optional[DailyForecast] = None
+    timezone: Optional[str] = None
+
+    @property
+    def days(self) -> int:
+        return len(self.daily.time) if self.daily else 0
+
+class Route(Model):
+    # Visiting order of the places (the Routes API's optimizedIntermediateWaypointIndex)
+    order: List[int] = msgspec.field(default_factory=list)
+    distance_meters: Optional[int] = None
+    duration: Optional[str] = None
+    polyline: Optional[str] = None
+    # "local" when the order was optimized in-process (see route_optimizer)
+    optimizer: Optional[str] = None
+
+class LegCost(Model):
+    distance_m: Optional[int] = None
+    duration_s: Optional[int] = None
+    fare: Optional[str] = None
+    # "api" or "estimate"
+    source: Optional[str] = None
+
+class CostLeg(Model):
+    origin: Optional[str] = None
+    destination: Optional[str] = None
+    modes: Dict[str, Optional[LegCost]] = msgspec.field(default_factory=dict)
+
+class Costs(Model):
+    legs: List[CostLeg] = msgspec.field(default_factory=list)
+
+# Allowed when a checkpoint written by LangGraph's serializer is read back
+# (see planning.checkpoint_serde)
+STATE_TYPES = (Coordinates, Place, CurrentWeather, DailyForecast, Weather, Route, LegCost, CostLeg, Costs)
+
+# Checkpoint encoding of the typed state (pack/unpack): msgpack with one ext type per
+# model, holding the model as msgspec encodes it (a map of its fields, nested models
+# included). The codes are part of the stored format, so never reuse one; new fields
+# need a default, so older checkpoints still load.
+EXT_CODES = {
+    Coordinates: 64, Place: 65, CurrentWeather: 66, DailyForecast: 67, Weather: 68,
+    Route: 69, LegCost: 70, CostLeg: 71, Costs: 72,
+}
+
+def _convert(cls, data: Any):
+    """
+    An instance of `cls` from a mapping (keys it has no field for are ignored), or None
+    if a field has the wrong type.
+    """
+    try:
+        return msgspec.convert(data, cls, strict=False)
+    except msgspec.ValidationError as e:
+        print(f"Dropping malformed {cls.__name__}: {e}")
+        return None
+
+def parse_coordinates(data: Any) -> Optional[Coordinates]:
+    if data is None or isinstance(data, Coordinates):
+        return data
+    if data.get("lat") is None or data.get("lon") is None:
+        return None
+    return Coordinates(lat=data["lat"], lon=data["lon"], formatted=data.get("formatted"))
+
+def parse_place(data: Any) -> Optional[Place]:
+    return data if isinstance(data, Place) else _convert(Place, data)
+
+def parse_places(items: Any) -> List[Place]:
+    return [place for place in map(parse_place, items or []) if place is not None]
+
+def parse_weather(data: Any) -> Optional[Weather]:
+    """From an Open-Meteo forecast; None for a failed lookup."""
+    if data is None or isinstance(data, Weather):
+        return data
+    if not data.get("current") and not data.get("daily"):
+        return None
+    return _convert(Weather, data)
+
+def parse_route(data: Any) -> Optional[Route]:
+    """From a Routes API (or route_optimizer) response; None when there is no route."""
+    if not data or isinstance(data, Route):
+        return data or None
+    if "routes" not in data:
+        return _convert(Route, data)
+    routes = data.get("routes") or []
+    if not routes:
+        return None
+    route = routes[0]
+    return Route(
+        order=route.get("optimizedIntermediateWaypointIndex") or [],
+        distance_meters=route.get("distanceMeters"),
+        duration=route.get("duration"),
+        polyline=(route.get("polyline") or {}).get("encodedPolyline"),
+        optimizer=route.get("optimizer"),
+    )
+
+def parse_leg_cost(data: Any) -> Optional[LegCost]:
+    if data is None or isinstance(data, LegCost):
+        return data
+    return _convert(LegCost, data)
+
+def parse_costs(data: Any) -> Optional[Costs]:
+    if not data or isinstance(data, Costs):
+        return data or None
+    legs = []
+    for leg in data.get("legs") or []:
+        if not isinstance(leg, CostLeg):
+            # Plans from before the typed state named the ends "from" and "to"
+            leg = _convert(CostLeg, {
+                "origin": leg.get("origin", leg.get("from")),
+                "destination": leg.get("destination", leg.get("to")),
+                "modes": leg.get("modes") or {},
+            })
+        if leg is not None:
+            legs.append(leg)
+    return Costs(legs=legs)
+
+PARSERS = {
+    "coordinates": parse_coordinates,
+    "weather": parse_weather,
+    "places": parse_places,
+    "restaurants": parse_places,
+    "route": parse_route,
+    "costs": parse_costs,
+}
+
+def parse_state(values: Dict[str, Any]) -> Dict[str, Any]:
+    """A plan state (or response) with its typed fields parsed; other keys are kept as is."""
+    return {key: PARSERS[key](value) if key in PARSERS else value for key, value in values.items()}
+
+def _encode_default(obj: Any) -> str:
+    return str(obj)
+
+_json_encoder = msgspec.json.Encoder(enc_hook=_encode_default)
+_sorted_json_encoder = msgspec.json.Encoder(enc_hook=_encode_default, order="sorted")
+
+def dumps(value: Any, sort_keys: bool = False) -> bytes:
+    """JSON for anything holding plan data. Unknown types are written as strings."""
+    return (_sorted_json_encoder if sort_keys else _json_encoder).encode(value)
+
+# Other types that msgpack would write lossily (dataclasses, datetimes, enums, UUIDs)
+# are handed to _pack_default, which rejects them
+_PACK_OPTION = (
+    ormsgpack.OPT_NON_STR_KEYS | ormsgpack.OPT_PASSTHROUGH_DATACLASS | ormsgpack.OPT_PASSTHROUGH_DATETIME
+    | ormsgpack.OPT_PASSTHROUGH_ENUM | ormsgpack.OPT_PASSTHROUGH_UUID | ormsgpack.OPT_REPLACE_SURROGATES
+)
+
+_model_encoder = msgspec.msgpack.Encoder()
+_decoders = {code: msgspec.msgpack.Decoder(cls) for cls, code in EXT_CODES.items()}
+_MODELS_BY_CODE = {code: cls for cls, code in EXT_CODES.items()}
+
+def _pack_default(obj: Any) -> ormsgpack.Ext:
+    code = EXT_CODES.get(type(obj))
+    if code is None:
+        raise TypeError(f"{type(obj).__name__} is not a plan model")
+    # The whole model, nested ones included, in one msgspec call
+    return ormsgpack.Ext(code, _model_encoder.encode(obj))
+
+def _unpack_ext(code: int, data: bytes) -> Any:
+    return _decoders[code].decode(data)
+
+def _unpack_ext_v1(code: int, data: bytes) -> Any:
+    # The first format: each model's field values in order, nested models as ext types
+    return _MODELS_BY_CODE[code](*ormsgpack.unpackb(data, ext_hook=_unpack_ext_v1))
+
+def pack(value: Any) -> bytes:
+    """
+    msgpack for plan data, models included (see EXT_CODES). Raises TypeError
+    (ormsgpack.MsgpackEncodeError) if the value holds any other non-JSON type.
+    """
+    return ormsgpack.packb(value, default=_pack_default, option=_PACK_OPTION)
+
+def unpack(data: bytes, version: int = 2) -> Any:
+    """Reads what pack wrote; version 1 is the format of older checkpoints."""
+    return ormsgpack.unpackb(data, ext_hook=_unpack_ext if version >= 2 else _unpack_ext_v1)
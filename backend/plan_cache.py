@@ -0,0 +1,141 @@
+"""
+Layered cache for complete plan responses.
+
+A plan is assembled from three layers with different lifetimes:
+
+- static: coordinates, places, restaurants, route and costs per destination and
+  parameters, kept for PLAN_STATIC_TTL;
+- weather: read through the weather tool cache, which expires with each forecast
+  model run, so it is the only part refreshed on a short cycle;
+- synthesis: itineraries keyed by a hash of the synthesizer's inputs, so the LLM
+  only runs again when the data it writes from actually changed.
+
+Responses are content-addressed: the ETag is a hash of the response body and
+doubles as the plan_id, so identical plans share one checkpoint and clients (or a
+CDN) can revalidate with If-None-Match.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Tuple
+try:
+    from backend.cache import MISS, TTLCache, TieredCache, normalize_query
+    from backend.compaction import payload_tokens
+    from backend.graph import AgentState
+    from backend.models import dumps, parse_state, parse_weather
+    from backend.singleflight import SingleFlight, params_hash
+    from backend.planning import PLAN_CHECKPOINT_TTL, run_plan, get_plan_app, plan_config
+    from backend.synthesis import synthesis_inputs, synthesize_itinerary
+    from backend.tools.weather import get_weather_forecast
+except ImportError:
+    from cache import MISS, TTLCache, TieredCache, normalize_query
+    from compaction import payload_tokens
+    from graph import AgentState
+    from models import dumps, parse_state, parse_weather
+    from singleflight import SingleFlight, params_hash
+    from planning import PLAN_CHECKPOINT_TTL, run_plan, get_plan_app, plan_config
+    from synthesis import synthesis_inputs, synthesize_itinerary
+    from tools.weather import get_weather_forecast
+
+PLAN_STATIC_TTL = float(os.getenv("PLAN_STATIC_TTL", 6 * 3600))
+PLAN_SYNTHESIS_TTL = float(os.getenv("PLAN_SYNTHESIS_TTL", 24 * 3600))
+# Cache-Control max-age for plan responses; short, since the weather inside moves
+PLAN_HTTP_MAX_AGE = int(os.getenv("PLAN_HTTP_MAX_AGE", 300))
+
+STATIC_FIELDS = ("coordinates", "places", "restaurants", "route", "costs", "days", "raw_tokens")
+
+static_layer = TieredCache("plan_static", maxsize=int(os.getenv("PLAN_CACHE_SIZE", 512)), ttl=PLAN_STATIC_TTL)
+synthesis_layer = TieredCache("plan_synthesis", maxsize=int(os.getenv("PLAN_CACHE_SIZE", 512)), ttl=PLAN_SYNTHESIS_TTL)
+
+# Identical requests arriving together assemble the plan once
+layered_flight = SingleFlight()
+# plan_ids already known to have a checkpoint, to skip the lookup
+_checkpointed = TTLCache(maxsize=4096, ttl=PLAN_STATIC_TTL)
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    return {"static": dict(static_layer.stats), "synthesis": dict(synthesis_layer.stats)}
+
+def plan_response(destination: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    # Return structured data for the UI
+    return {
+        "plan_id": result.get("plan_id"),
+        "destination": destination,
+        "coordinates": result.get("coordinates"),  # Add coordinates for map centering
+        "final_itinerary": result.get("final_itinerary"),
+        "structured_itinerary": result.get("structured_itinerary"), # New JSON output
+        "weather": result.get("weather"),
+        "places": result.get("places"),
+        "restaurants": result.get("restaurants"),
+        "route": result.get("route"),
+        "costs": result.get("costs"),
+        "days": result.get("days"),
+    }
+
+def content_etag(response: Dict[str, Any]) -> str:
+    """Hash of a plan response without its plan_id (which is derived from it)."""
+    body = {key: value for key, value in response.items() if key != "plan_id"}
+    return hashlib.sha256(dumps(body, sort_keys=True)).hexdigest()[:32]
+
+def cache_control() -> str:
+    return f"public, max-age={PLAN_HTTP_MAX_AGE}, stale-while-revalidate={PLAN_HTTP_MAX_AGE}"
+
+def _checkpoint_age(created_at: str) -> float:
+    return (datetime.now(timezone.utc) - datetime.fromisoformat(created_at)).total_seconds()
+
+async def _ensure_checkpoint(plan_id: str, state: Dict[str, Any]):
+    """
+    Stores the plan under its content plan_id, as if the graph had just finished.
+    Plans still being served are written again well before they expire (see
+    planning.prune_plans), since _checkpointed skips the lookup for a while.
+    """
+    if _checkpointed.get(plan_id) is not MISS:
+        return
+    plan_app = await get_plan_app()
+    config = plan_config(plan_id)
+    snapshot = await plan_app.aget_state(config)
+    if not snapshot.values or _checkpoint_age(snapshot.created_at) > PLAN_CHECKPOINT_TTL - PLAN_STATIC_TTL:
+        values = {key: value for key, value in state.items() if key in AgentState.__annotations__}
+        await plan_app.aupdate_state(config, values, as_node="synthesizer")
+    _checkpointed.set(plan_id, True)
+
+async def _synthesize(state: Dict[str, Any]) -> Dict[str, Any]:
+    key = params_hash(synthesis_inputs(state))
+    itinerary = await synthesis_layer.get(key)
+    if itinerary is MISS:
+        itinerary = await synthesize_itinerary(state)
+        await synthesis_layer.set(key, itinerary)
+    return itinerary
+
+async def _assemble(destination: str, key: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    static = await static_layer.get(key)
+    if static is MISS:
+        # Cold: run the whole graph once and fill both layers from its result
+        result = await run_plan(destination, **params)
+        if result.get("coordinates") and result.get("structured_itinerary"):
+            await static_layer.set(key, {field: result.get(field) for field in STATIC_FIELDS})
+            await synthesis_layer.set(params_hash(synthesis_inputs(result)), result["structured_itinerary"])
+    else:
+        # Entries read from the shared tier are plain dicts
+        static = parse_state(static)
+        coordinates = static["coordinates"]
+        forecast = await get_weather_forecast(coordinates.lat, coordinates.lon, days=static.get("days"))
+        raw_tokens = {**(static.get("raw_tokens") or {}), "weather": payload_tokens(forecast)}
+        result = {"destination": destination, **static, "weather": parse_weather(forecast), "raw_tokens": raw_tokens}
+        itinerary = await _synthesize(result)
+        result.update(structured_itinerary=itinerary, final_itinerary=json.dumps(itinerary))
+
+    response = plan_response(destination, result)
+    etag = content_etag(response)
+    await _ensure_checkpoint(etag, result)
+    response["plan_id"] = etag
+    return response, etag
+
+async def get_plan(destination: str, **params) -> Tuple[Dict[str, Any], str]:
+    """
+    The plan response for a destination and its ETag, served from the cache layers
+    when possible. Only the weather is re-read on every call; the itinerary is only
+    re-synthesized when its inputs changed.
+    """
+    key = f"{normalize_query(destination)}:{params_hash(params)}"
+    return await layered_flight.do(key, lambda: _assemble(destination, key, params))
@@ -0,0 +1,344 @@
+import asyncio
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+try:
+    from backend.graph import AgentState, get_workflow
+    from backend.llm_factory import load_llm_class
+    from backend.tools.resilience import REQUEST_DEADLINE, deadline
+    from backend.cache import DEFAULT_CACHE_PATH, TieredCache, normalize_query
+    from backend.singleflight import SingleFlight, params_hash
+    from backend.tools.geocoding import get_coordinates
+    from backend.tools.places import search_restaurants
+    from backend.tools.weather import forecast_days, get_weather_forecast
+    from backend.models import STATE_TYPES, Place, pack, parse_place, parse_places, parse_state, parse_weather, unpack
+except ImportError:
+    from graph import AgentState, get_workflow
+    from llm_factory import load_llm_class
+    from tools.resilience import REQUEST_DEADLINE, deadline
+    from cache import DEFAULT_CACHE_PATH, TieredCache, normalize_query
+    from singleflight import SingleFlight, params_hash
+    from tools.geocoding import get_coordinates
+    from tools.places import search_restaurants
+    from tools.weather import forecast_days, get_weather_forecast
+    from models import STATE_TYPES, Place, pack, parse_place, parse_places, parse_state, parse_weather, unpack
+
+# "sqlite" keeps every plan's final state on disk so it can be edited later, even
+# after a restart; "memory" keeps it for the life of the process.
+PLAN_CHECKPOINTER = os.getenv("PLAN_CHECKPOINTER", "sqlite")
+PLAN_CHECKPOINT_PATH = os.getenv("PLAN_CHECKPOINT_PATH", os.path.join(os.path.dirname(DEFAULT_CACHE_PATH), "plans.sqlite3"))
+# Plans not written for this long are deleted, checked every PLAN_PRUNE_INTERVAL
+PLAN_CHECKPOINT_TTL = float(os.getenv("PLAN_CHECKPOINT_TTL", 7 * 24 * 3600))
+PLAN_PRUNE_INTERVAL = float(os.getenv("PLAN_PRUNE_INTERVAL", 3600))
+
+# Identical plans requested concurrently share one graph run; the result is kept
+# for a short while to absorb the tail of a burst, in the shared cache backend so
+# every worker process can serve it.
+PLAN_RESULT_TTL = float(os.getenv("PLAN_RESULT_TTL", 30))
+plan_results = TieredCache("plans", maxsize=256, ttl=PLAN_RESULT_TTL) if PLAN_RESULT_TTL > 0 else None
+plan_flight = SingleFlight(results=plan_results)
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+# Highest concurrency a batch request may ask for
+BATCH_CONCURRENCY_MAX = int(os.getenv("BATCH_CONCURRENCY_MAX", 32))
+
+_plan_app = None
+_checkpoint_conn = None
+
+def load_checkpointer_class():
+    """
+    The checkpointer class for PLAN_CHECKPOINTER, imported on first use. The SQLite
+    saver is optional; without it plans are only kept in memory.
+    """
+    if PLAN_CHECKPOINTER == "sqlite":
+        try:
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            return AsyncSqliteSaver
+        except ImportError:
+            pass
+    from langgraph.checkpoint.memory import InMemorySaver
+    return InMemorySaver
+
+# Type tag of checkpoint values written with models.pack; /1 is the older encoding
+CHECKPOINT_FORMAT = "plan-msgpack/2"
+CHECKPOINT_FORMAT_V1 = "plan-msgpack/1"
+
+def checkpoint_serde():
+    """
+    Checkpoint serializer for the typed state. Values are written with models.pack, a
+    format of our own (CHECKPOINT_FORMAT) that encodes the models without going
+    through LangGraph's generic per-object type checks. Values holding other types,
+    and checkpoints in LangGraph's format, go through its serializer, which is
+    allowed to read the model types back.
+    """
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    class PlanSerializer(JsonPlusSerializer):
+        def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+            if obj is None or isinstance(obj, (bytes, bytearray)):
+                return super().dumps_typed(obj)
+            try:
+                return CHECKPOINT_FORMAT, pack(obj)
+            except TypeError:
+                return super().dumps_typed(obj)
+
+        def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+            if data[0] == CHECKPOINT_FORMAT:
+                return unpack(data[1])
+            if data[0] == CHECKPOINT_FORMAT_V1:
+                return unpack(data[1], version=1)
+            return super().loads_typed(data)
+
+    return PlanSerializer(allowed_msgpack_modules=[(cls.__module__, cls.__name__) for cls in STATE_TYPES])
+
+def preload():
+    """
+    Imports LangGraph, the checkpointer and the Gemini SDK and builds the graph, so
+    the first plan does not pay for it. Blocking; the server runs it in a thread
+    after startup (see STARTUP_PRELOAD).
+    """
+    get_workflow()
+    load_checkpointer_class()
+    load_llm_class()
+
+async def get_plan_app():
+    """
+    The trip graph compiled with a checkpointer, so each plan's state is stored under
+    its plan_id. Built on first use because the SQLite saver binds to the running loop.
+    """
+    global _plan_app, _checkpoint_conn
+    if _plan_app is None:
+        saver = load_checkpointer_class()
+        if saver.__name__ == "AsyncSqliteSaver":
+            import aiosqlite
+            os.makedirs(os.path.dirname(PLAN_CHECKPOINT_PATH) or ".", exist_ok=True)
+            _checkpoint_conn = aiosqlite.connect(PLAN_CHECKPOINT_PATH)
+            checkpointer = saver(_checkpoint_conn, serde=checkpoint_serde())
+            await checkpointer.setup()
+        else:
+            checkpointer = saver(serde=checkpoint_serde())
+        _plan_app = get_workflow().compile(checkpointer=checkpointer)
+    return _plan_app
+
+async def close_plan_app():
+    """Closes the checkpoint database; its worker thread otherwise keeps the process alive."""
+    global _plan_app, _checkpoint_conn
+    if _checkpoint_conn is not None:
+        await _checkpoint_conn.close()
+    _plan_app = None
+    _checkpoint_conn = None
+
+def checkpoint_id_at(seconds: float) -> str:
+    """
+    The lowest checkpoint id for a time. LangGraph's checkpoint ids are uuid6, which
+    sort in the order they were written, so this bounds the ids written before it.
+    """
+    # 100ns intervals since the Gregorian epoch, split as uuid6 lays them out
+    timestamp = int(seconds * 10_000_000) + 0x01B21DD213814000
+    return str(uuid.UUID(int=((timestamp >> 12) << 80) | (6 << 76) | ((timestamp & 0xFFF) << 64) | (2 << 62)))
+
+async def prune_plans(max_age: float = PLAN_CHECKPOINT_TTL) -> int:
+    """
+    Deletes the plans whose latest checkpoint is older than `max_age` seconds and
+    returns how many. Plans are never edited in place, so each plan_id is written
+    once, except content plan_ids still being served (see plan_cache), which are
+    written again before they expire.
+    """
+    checkpointer = (await get_plan_app()).checkpointer
+    cutoff = checkpoint_id_at(time.time() - max_age)
+    stale = set()
+    async for item in checkpointer.alist(None, before={"configurable": {"checkpoint_id": cutoff}}):
+        stale.add(item.config["configurable"]["thread_id"])
+    deleted = 0
+    for plan_id in stale:
+        latest = await checkpointer.aget_tuple(plan_config(plan_id))
+        if latest is None or latest.config["configurable"]["checkpoint_id"] < cutoff:
+            await checkpointer.adelete_thread(plan_id)
+            deleted += 1
+    return deleted
+
+async def prune_plans_forever(interval: float = PLAN_PRUNE_INTERVAL):
+    """Prunes expired plans now and then every `interval` seconds (0 runs once)."""
+    while True:
+        try:
+            deleted = await prune_plans()
+            if deleted:
+                print(f"Plans: pruned {deleted} expired plans")
+        except sqlite3.Error as e:
+            print(f"Plans: prune failed: {e}")
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+
+def new_plan_id() -> str:
+    return uuid.uuid4().hex
+
+def plan_config(plan_id: str) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": plan_id}}
+
+async def run_plan(destination: str, **params) -> Dict[str, Any]:
+    """
+    Runs the trip graph for a destination, coalescing identical in-flight plans.
+    The result carries the `plan_id` its state was checkpointed under; coalesced
+    callers share it, which is safe because edits never modify a plan in place.
+    """
+    async def plan():
+        plan_app = await get_plan_app()
+        plan_id = new_plan_id()
+        # Only the final state is needed for re-planning, so skip per-step writes
+        result = await plan_app.ainvoke({"destination": destination, **params}, plan_config(plan_id), durability="exit")
+        return {**result, "plan_id": plan_id}
+
+    key = f"{normalize_query(destination)}:{params_hash(params)}"
+    # Results shared through the cache backend come back as plain dicts
+    return parse_state(await plan_flight.do(key, plan))
+
+# A re-plan stores the edited fields as if this node had just written them, so only
+# the nodes downstream of it run again: place edits re-run route, geometry, cost and
+# the synthesizer; restaurant and day-count edits only re-run the synthesizer.
+# Geocoding is always reused, and weather unless a longer trip needs more forecast
+# days (which only comes with a day-count edit).
+RERUN_AFTER = {
+    "places": "fetch_places",
+    "restaurants": "calculate_cost",
+    "days": "calculate_cost",
+}
+
+def _same_name(item: Place, name: str) -> bool:
+    return normalize_query(item.name or "") == normalize_query(name)
+
+async def _add_place(state: Dict[str, Any], place: Dict[str, Any]) -> Place:
+    if place.get("lat") is None or place.get("lon") is None:
+        coords = await get_coordinates(f"{place['name']}, {state['destination']}")
+        if not coords:
+            raise ValueError(f"Could not locate place: {place['name']}")
+        place = {**place, "lat": coords["lat"], "lon": coords["lon"]}
+    parsed = parse_place({"categories": ["attraction"], **place})
+    if parsed is None:
+        raise ValueError(f"Invalid place: {place['name']}")
+    return parsed
+
+async def _swap_restaurants(state: Dict[str, Any], names: List[str]) -> List[Place]:
+    """
+    Replaces the named restaurants with the next nearby ones not already in the plan.
+    The first search is normally a cache hit; a wider radius is tried for more options.
+    """
+    kept = [r for r in state.get("restaurants", []) if not any(_same_name(r, n) for n in names)]
+    wanted = len(state.get("restaurants", [])) - len(kept)
+    lat, lon = state["coordinates"].lat, state["coordinates"].lon
+    excluded = {normalize_query(r.name or "") for r in state.get("restaurants", [])}
+    for radius in (1000, 3000):
+        if wanted <= 0:
+            break
+        for candidate in parse_places(await search_restaurants(lat, lon, radius=radius)):
+            key = normalize_query(candidate.name or "")
+            if wanted > 0 and key not in excluded:
+                kept.append(candidate)
+                excluded.add(key)
+                wanted -= 1
+    return kept
+
+async def apply_delta(state: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Applies an edit to a plan's state. Supported keys: `add_places` (dicts with a
+    `name`, plus `lat`/`lon` if known), `remove_places` (names), `swap_restaurants`
+    (names to replace) and `days`. Returns only the fields that changed.
+    """
+    changes: Dict[str, Any] = {}
+    if delta.get("remove_places") or delta.get("add_places"):
+        places = [p for p in state.get("places", []) if not any(_same_name(p, n) for n in delta.get("remove_places") or [])]
+        added = await asyncio.gather(*(_add_place(state, p) for p in delta.get("add_places") or []))
+        changes["places"] = places + list(added)
+    if delta.get("swap_restaurants"):
+        changes["restaurants"] = await _swap_restaurants(state, delta["swap_restaurants"])
+    if delta.get("days") and delta["days"] != state.get("days"):
+        changes["days"] = delta["days"]
+        weather = state.get("weather")
+        if (weather.days if weather else 0) < forecast_days(delta["days"]):
+            coordinates = state["coordinates"]
+            changes["weather"] = parse_weather(await get_weather_forecast(coordinates.lat, coordinates.lon, days=delta["days"]))
+    return changes
+
+async def replan(delta: Dict[str, Any], plan_id: Optional[str] = None, snapshot: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Edits an existing plan, given its plan_id or a state snapshot, re-running only
+    the nodes the edit invalidates. The edited plan is stored under a new plan_id;
+    the original stays untouched, so concurrent edits of a shared plan cannot clash.
+    Raises KeyError for an unknown plan_id and ValueError for a malformed snapshot.
+    """
+    plan_app = await get_plan_app()
+    if snapshot is None:
+        snapshot = (await plan_app.aget_state(plan_config(plan_id))).values
+        if not snapshot:
+            raise KeyError(f"Unknown plan_id: {plan_id}")
+    # A state posted by a client, or checkpointed before the typed state, holds plain dicts
+    try:
+        snapshot = parse_state(snapshot)
+    except (AttributeError, TypeError) as e:
+        raise ValueError(f"Invalid plan state: {e}") from e
+    if not isinstance(snapshot.get("destination"), str) or not snapshot["destination"]:
+        raise ValueError("Invalid plan state: destination is required")
+    state = {key: value for key, value in snapshot.items() if key in AgentState.__annotations__}
+    if not state.get("coordinates"):
+        # Nothing to reuse (e.g. geocoding failed the first time): plan from scratch
+        return await run_plan(state["destination"], **({"days": delta["days"]} if delta.get("days") else {}))
+
+    changes = await apply_delta(state, delta)
+    if not changes:
+        return {**snapshot, "plan_id": plan_id}
+    # The earliest invalidated node decides what re-runs
+    as_node = RERUN_AFTER["places"] if "places" in changes else RERUN_AFTER[next(iter(changes))]
+
+    new_id = new_plan_id()
+    config = plan_config(new_id)
+    await plan_app.aupdate_state(config, {**state, **changes}, as_node=as_node)
+    result = await plan_app.ainvoke(None, config, durability="exit")
+    return {**result, "plan_id": new_id}
+
+async def plan_batch(destinations: List[str], concurrency: Optional[int] = None, **params) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Plans many destinations with at most `concurrency` graphs running at once and
+    yields {"index", "destination", "result" | "error"} as each plan completes.
+
+    Shared sub-work is deduplicated by the layers below: repeated destinations
+    coalesce in run_plan, identical geocodes and places cells hit the tool caches
+    and single-flight groups, and each upstream is capped by its connection pool.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY if concurrency is None else concurrency)
+
+    async def plan_one(index: int, destination: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                with deadline(REQUEST_DEADLINE):
+                    result = await run_plan(destination, **params)
+                return {"index": index, "destination": destination, "result": result}
+            except Exception as e:
+                return {"index": index, "destination": destination, "error": str(e)}
+
+    tasks = [asyncio.ensure_future(plan_one(i, d)) for i, d in enumerate(destinations)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The consumer went away (e.g. the HTTP client disconnected): stop the rest
+        for task in tasks:
+            task.cancel()
+
+async def _main(path: str, out_path: str):
+    import json
+    with open(path) as f:
+        destinations = [line.strip() for line in f if line.strip()]
+    try:
+        with open(out_path, "w") as out:
+            async for item in plan_batch(destinations):
+                out.write(json.dumps(item, default=str) + "\n")
+                out.flush()
+    finally:
+        await close_plan_app()
+
+if __name__ == "__main__":
+    # Nightly pre-generation: python -m backend.planning destinations.txt plans.ndjson
+    import sys
+    asyncio.run(_main(sys.argv[1], sys.argv[2]))
@@ -0,0 +1,129 @@
+"""
+Multi-worker launcher for the web API.
+
+Binds the port once and runs WEB_WORKERS uvicorn processes on the shared socket, so
+requests are spread over every CPU. Worker processes share the cache backend
+(CACHE_BACKEND) and the plan checkpoint database. With WARM_CACHE=1 the cache warmer
+runs once, in its own process, instead of inside every worker.
+
+    python -m backend.serve --workers 4
+
+Crashed workers are restarted. On SIGTERM or SIGINT every worker stops accepting
+connections, finishes its in-flight requests (up to GRACEFUL_TIMEOUT seconds) and
+runs its shutdown hooks; stragglers are killed after that.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+from typing import Dict, Optional
+import uvicorn
+try:
+    from backend.cache import env_flag
+except ImportError:
+    from cache import env_flag
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", os.cpu_count() or 1))
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", 30))
+# Default in-process TTL cap with several workers, so a worker picks up entries
+# another process refreshed within a minute
+MULTI_WORKER_MEMORY_TTL = "60"
+
+def _run_worker(worker_id: int, sock, graceful_timeout: float):
+    os.environ["WORKER_ID"] = str(worker_id)
+    config = uvicorn.Config("backend.server:app", timeout_graceful_shutdown=int(graceful_timeout))
+    uvicorn.Server(config).run(sockets=[sock])
+
+def _stop_warmer(signum, frame):
+    raise SystemExit(0)
+
+def _run_warmer():
+    signal.signal(signal.SIGTERM, _stop_warmer)
+    signal.signal(signal.SIGINT, _stop_warmer)
+    from backend.warmer import _main
+    try:
+        asyncio.run(_main())
+    except SystemExit:
+        pass
+
+class Supervisor:
+    """Starts the worker processes, restarts any that die and stops them all on a signal."""
+    def __init__(self, sock, workers: int, graceful_timeout: float, warm: bool):
+        self.sock = sock
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.warm = warm
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: Dict[str, multiprocessing.Process] = {}
+        self.stopping = False
+
+    def _spawn(self, name: str) -> multiprocessing.Process:
+        if name == "warmer":
+            process = self.context.Process(target=_run_warmer, name=name)
+        else:
+            worker_id = int(name.split("-")[1])
+            process = self.context.Process(target=_run_worker, args=(worker_id, self.sock, self.graceful_timeout), name=name)
+        process.start()
+        print(f"Started {name} (pid {process.pid})")
+        return process
+
+    def _handle_signal(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        names = [f"worker-{i}" for i in range(self.workers)] + (["warmer"] if self.warm else [])
+        for name in names:
+            self.processes[name] = self._spawn(name)
+
+        while not self.stopping:
+            time.sleep(0.5)
+            for name, process in list(self.processes.items()):
+                if not process.is_alive() and not self.stopping:
+                    print(f"{name} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                    self.processes[name] = self._spawn(name)
+        self.shutdown()
+
+    def shutdown(self):
+        print("Shutting down workers")
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM: uvicorn drains in-flight requests
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        for name, process in self.processes.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                print(f"{name} (pid {process.pid}) did not stop in time, killing it")
+                process.kill()
+                process.join()
+        self.sock.close()
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Run the web API with several worker processes")
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--graceful-timeout", type=float, default=GRACEFUL_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    workers = max(1, args.workers)
+    warm = env_flag("WARM_CACHE")
+    # Read by the spawned processes, which inherit the environment
+    os.environ["WEB_WORKERS"] = str(workers)
+    os.environ["WARM_CACHE"] = "0"
+    if workers > 1:
+        os.environ.setdefault("CACHE_MEMORY_MAX_TTL", MULTI_WORKER_MEMORY_TTL)
+        backend = os.getenv("CACHE_BACKEND", "sqlite")
+        if backend == "none" or (backend == "redis" and os.getenv("REDIS_URL", "").startswith("local://")):
+            print("Warning: the cache backend is per process, so workers will not share cached results")
+        if os.getenv("PLAN_CHECKPOINTER") == "memory":
+            print("Warning: PLAN_CHECKPOINTER=memory, so a plan can only be re-planned on the worker that made it")
+
+    sock = uvicorn.Config("backend.server:app", host=args.host, port=args.port).bind_socket()
+    Supervisor(sock, workers, args.graceful_timeout, warm).run()
+
+if __name__ == "__main__":
+    main()
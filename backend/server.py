@@ -1,73 +1,73 @@
-from fastmcp import FastMCP
 try:
-    from backend.graph import app as graph_app
-    from backend.tools.geocoding import get_coordinates
-    from backend.tools.weather import get_weather_forecast
-    from backend.tools.places import search_attractions, search_restaurants
-    from backend.tools.routing import calculate_route
-    from backend.tools.costs import estimate_travel_costs
-    from backend.llm_factory import get_llm
+    from backend.llm_factory import get_llm, cached_ainvoke, cached_astream
+    from backend.chat_context import relevant_chunks
+    from backend.warmer import warmer, popularity, record_request
+    from backend.tools import http_client
+    from backend.planning import BATCH_CONCURRENCY_MAX, plan_batch, replan, get_plan_app, close_plan_app, new_plan_id, plan_config, preload, prune_plans_forever
+    from backend.plan_cache import get_plan, plan_response, cache_control
+    from backend.metrics import render_prometheus
+    from backend.models import dumps
+    from backend.cache import close_redis_client, env_flag, purge_forever
+    from backend.tools.resilience import REQUEST_DEADLINE, deadline
+    from backend.synthesis import MAX_TRIP_DAYS
 except ImportError:
     # When running on Railway, imports are relative
-    from graph import app as graph_app
-    from tools.geocoding import get_coordinates
-    from tools.weather import get_weather_forecast
-    from tools.places import search_attractions, search_restaurants
-    from tools.routing import calculate_route
-    from tools.costs import estimate_travel_costs
-    from llm_factory import get_llm
+    from llm_factory import get_llm, cached_ainvoke, cached_astream
+    from chat_context import relevant_chunks
+    from warmer import warmer, popularity, record_request
+    from tools import http_client
+    from planning import BATCH_CONCURRENCY_MAX, plan_batch, replan, get_plan_app, close_plan_app, new_plan_id, plan_config, preload, prune_plans_forever
+    from plan_cache import get_plan, plan_response, cache_control
+    from metrics import render_prometheus
+    from models import dumps
+    from cache import close_redis_client, env_flag, purge_forever
+    from tools.resilience import REQUEST_DEADLINE, deadline
+    from synthesis import MAX_TRIP_DAYS
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any
-import json
+from typing import Dict, Any, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import os
 
 
-# Initialize FastMCP Server (for MCP Clients)
-mcp = FastMCP("TouristPlanner")
+# The MCP tools live in mcp_server.py (`fastmcp run backend/mcp_server.py`), so the
+# web API starts without loading FastMCP.
 
-# --- Register Atomic Tools ---
-@mcp.tool()
-async def get_place_coordinates(place_name: str):
-    """Get latitude and longitude for a place."""
-    return await get_coordinates(place_name)
+# "background" (default) loads LangGraph and the Gemini SDK in a thread once the app
+# has started, so the port is bound sooner; "eager" loads them before serving;
+# "off" leaves it to the first request.
+STARTUP_PRELOAD = os.getenv("STARTUP_PRELOAD", "background")
 
-@mcp.tool()
-async def get_weather(lat: float, lon: float):
-    """Get weather forecast for coordinates."""
-    return await get_weather_forecast(lat, lon)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Share one keep-alive pool per upstream across all requests
+    await http_client.startup()
+    await popularity.load()
+    # Expired entries are dropped from the shared cache file now and periodically
+    purge = asyncio.create_task(purge_forever())
+    # Plans nobody has written for PLAN_CHECKPOINT_TTL are deleted the same way
+    prune = asyncio.create_task(prune_plans_forever())
+    if STARTUP_PRELOAD == "eager":
+        preload()
+    elif STARTUP_PRELOAD == "background":
+        asyncio.get_running_loop().run_in_executor(None, preload)
+    # Keep popular destinations warm from this process (or run `python -m backend.warmer`)
+    if env_flag("WARM_CACHE"):
+        warmer.start()
+    yield
+    await warmer.stop()
+    purge.cancel()
+    prune.cancel()
+    await popularity.save()
+    await http_client.shutdown()
+    await close_plan_app()
+    await close_redis_client()
 
-@mcp.tool()
-async def find_attractions(lat: float, lon: float):
-    """Find top tourist attractions near coordinates."""
-    return await search_attractions(lat, lon)
-
-@mcp.tool()
-async def find_restaurants(lat: float, lon: float):
-    """Find restaurants near coordinates."""
-    return await search_restaurants(lat, lon)
-
-@mcp.tool()
-async def optimize_route(locations: list):
-    """Optimize driving route for a list of locations."""
-    return await calculate_route(locations)
-
-@mcp.tool()
-async def plan_full_trip(destination: str):
-    """
-    Plan a complete trip to a destination.
-    """
-    initial_state = {"destination": destination}
-    result = await graph_app.ainvoke(initial_state)
-    return result["final_itinerary"]
-
-# --- Expose HTTP Endpoint for Web App ---
-# FastMCP doesn't easily expose custom HTTP routes mixed with MCP SSE.
-# So we will mount FastMCP on a FastAPI app or just use FastAPI directly for the web.
-# Since we want BOTH, let's create a FastAPI app that wraps the logic.
-
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS
 app.add_middleware(
@@ -78,26 +78,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Batches run many plans; each of them gets its own deadline (see plan_batch)
+DEADLINE_EXEMPT_PATHS = {"/api/plan_batch"}
+
+@app.middleware("http")
+async def request_deadline(request, call_next):
+    # Every upstream call made for this request shares one time budget
+    with deadline(0 if request.url.path in DEADLINE_EXEMPT_PATHS else REQUEST_DEADLINE):
+        return await call_next(request)
+
 class TripRequest(BaseModel):
     destination: str
+    days: Optional[int] = Field(None, ge=1, le=MAX_TRIP_DAYS)
+
+    def params(self) -> Dict[str, Any]:
+        return {"days": self.days} if self.days else {}
+
+class PlanDelta(BaseModel):
+    add_places: List[Dict[str, Any]] = []
+    remove_places: List[str] = []
+    swap_restaurants: List[str] = []
+    days: Optional[int] = Field(None, ge=1, le=MAX_TRIP_DAYS)
+
+class ReplanRequest(BaseModel):
+    # Either the plan_id returned by /api/plan_trip or the plan's state as returned
+    plan_id: Optional[str] = None
+    state: Optional[Dict[str, Any]] = None
+    delta: PlanDelta
 
-from langchain_core.messages import HumanMessage
+class BatchTripRequest(BaseModel):
+    destinations: List[str]
+    concurrency: Optional[int] = Field(None, ge=1, le=BATCH_CONCURRENCY_MAX)
 
 class ChatRequest(BaseModel):
     message: str
-    context: Dict[str, Any]
+    # The plan_id returned by /api/plan_trip; the server keeps the plan's context.
+    # Sending the context inline still works for older clients.
+    plan_id: Optional[str] = None
+    context: Optional[Dict[str, Any]] = None
 
-@app.post("/api/chat")
-async def chat(request: ChatRequest):
-    llm = get_llm()
-    
-    # Construct context string
-    context_str = json.dumps(request.context, default=str)
+async def _chat_prompt(request: ChatRequest):
+    """
+    Builds the chat prompt from the plan chunks most relevant to the question,
+    rather than the whole plan. Returns the prompt and its cache payload.
+    """
+    if not request.plan_id and request.context is None:
+        raise HTTPException(status_code=422, detail="Either plan_id or context is required")
+    try:
+        chunks = await relevant_chunks(request.message, plan_id=request.plan_id, context=request.context)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    context_str = "\n".join(f"- {chunk}" for chunk in chunks)
     
     prompt = f"""
     You are a helpful Travel Assistant for a specific trip.
     
-    Current Itinerary Context:
+    Relevant parts of the current itinerary:
     {context_str}
     
     User Question: {request.message}
@@ -106,36 +142,166 @@ async def chat(request: ChatRequest):
     If the answer is not in the context, say "I don't have that information in the current plan."
     Be concise and friendly.
     """
-    
-    response = await llm.ainvoke([HumanMessage(content=prompt)])
-    return {"response": response.content}
+    return prompt, {"chunks": chunks, "message": request.message}
+
+@app.post("/api/chat")
+async def chat(request: ChatRequest):
+    from langchain_core.messages import HumanMessage
+
+    llm = get_llm()
+    prompt, payload = await _chat_prompt(request)
+    content = await cached_ainvoke(llm, [HumanMessage(content=prompt)], "chat", payload)
+    return {"response": content}
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streams the answer as Server-Sent Events: `token` events as the model writes,
+    then `done` with the full response.
+    """
+    from langchain_core.messages import HumanMessage
+
+    llm = get_llm()
+    prompt, payload = await _chat_prompt(request)
+
+    async def events():
+        parts = []
+        try:
+            async for text in cached_astream(llm, [HumanMessage(content=prompt)], "chat", payload):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+            yield _sse("done", {"response": "".join(parts)})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class PlanResponse(JSONResponse):
+    """JSON response for plan data, encoded with msgspec (models included)."""
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def _if_none_match(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/").strip('"') for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+async def _cached_plan(request: TripRequest, if_none_match: Optional[str] = None) -> Response:
+    record_request(request.destination)
+    try:
+        response, etag = await get_plan(request.destination, **request.params())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    headers = {"ETag": f'"{etag}"', "Cache-Control": cache_control()}
+    if _if_none_match(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return PlanResponse(response, headers=headers)
 
 @app.post("/api/plan_trip")
 async def api_plan_trip(request: TripRequest):
-    # ... (keep existing code)
+    """
+    Plans a trip. Served from the layered plan cache (see plan_cache.py); the
+    response carries an ETag that is also its plan_id.
+    """
+    return await _cached_plan(request)
+
+@app.get("/api/plan_trip")
+async def api_plan_trip_get(destination: str, days: Optional[int] = Query(None, ge=1, le=MAX_TRIP_DAYS), if_none_match: Optional[str] = Header(None)):
+    """
+    Cacheable variant of POST /api/plan_trip for browsers and CDNs. Answers 304 Not
+    Modified when If-None-Match has the current ETag.
+    """
+    return await _cached_plan(TripRequest(destination=destination, days=days), if_none_match)
+
+@app.post("/api/replan")
+async def api_replan(request: ReplanRequest):
+    """
+    Applies an edit to an earlier plan and re-runs only what it invalidates. The
+    response has the same shape as /api/plan_trip, with a new plan_id.
+    """
+    if not request.plan_id and not request.state:
+        raise HTTPException(status_code=422, detail="Either plan_id or state is required")
     try:
-        initial_state = {"destination": request.destination}
-        result = await graph_app.ainvoke(initial_state)
-        # Return structured data for the UI
-        return {
-            "destination": request.destination,
-            "coordinates": result.get("coordinates"),  # Add coordinates for map centering
-            "final_itinerary": result.get("final_itinerary"),
-            "structured_itinerary": result.get("structured_itinerary"), # New JSON output
-            "weather": result.get("weather"),
-            "places": result.get("places"),
-            "restaurants": result.get("restaurants"),
-            "route": result.get("route"),
-            "costs": result.get("costs")
-        }
+        result = await replan(request.delta.model_dump(), plan_id=request.plan_id, snapshot=request.state)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return PlanResponse(plan_response(result["destination"], result))
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+@app.post("/api/plan_trip/stream")
+async def api_plan_trip_stream(request: TripRequest):
+    """
+    Streams the plan as Server-Sent Events: one event per state field as soon as the
+    node producing it finishes (coordinates, weather, places, ...), `token` events while
+    the synthesizer is generating, and a final `done` event with the full response.
+    Long trips are synthesized in concurrent parts, so each token names the document
+    it belongs to: "itinerary" for a single generation, else "overview" or a run of
+    days such as "days 1-4".
+    """
+    record_request(request.destination)
+
+    async def events():
+        plan_id = new_plan_id()
+        result: Dict[str, Any] = {"plan_id": plan_id}
+        try:
+            plan_app = await get_plan_app()
+            initial_state = {"destination": request.destination, **request.params()}
+            async for mode, chunk in plan_app.astream(initial_state, plan_config(plan_id), stream_mode=["updates", "messages"], durability="exit"):
+                if mode == "messages":
+                    message, metadata = chunk
+                    if metadata.get("langgraph_node") == "synthesizer" and message.content:
+                        yield _sse("token", {"text": message.content, "part": metadata.get("synthesis_part")})
+                    continue
+                for update in chunk.values():
+                    for key, value in (update or {}).items():
+                        result[key] = value
+                        # Bookkeeping for the synthesizer's prompt report, not plan data
+                        if key != "raw_tokens":
+                            yield _sse(key, value)
+            yield _sse("done", plan_response(request.destination, result))
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/plan_batch")
+async def api_plan_batch(request: BatchTripRequest):
+    """
+    Plans many destinations and streams one NDJSON line per destination as soon as
+    its plan completes (not in request order; use `index` to match them up).
+    """
+    async def lines():
+        async for item in plan_batch(request.destinations, concurrency=request.concurrency):
+            if "error" in item:
+                line = {"index": item["index"], "destination": item["destination"], "error": item["error"]}
+            else:
+                line = {"index": item["index"], **plan_response(item["destination"], item["result"])}
+            yield dumps(line) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint: node, upstream and LLM latency histograms."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
-    # We can run FastMCP in a separate process or thread if needed, 
-    # but for this Web App demo, we'll prioritize the HTTP server.
-    # To run MCP, one would use `fastmcp run backend/server.py`
+    # To run MCP, use `fastmcp run backend/mcp_server.py`
     # To run Web API, we use `python backend/server.py`
-    import os
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,81 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Optional
+try:
+    from backend.cache import MISS, TieredCache, params_hash
+    from backend.tools.resilience import DeadlineExceeded, detached_context, within_deadline
+except ImportError:
+    from cache import MISS, TieredCache, params_hash
+    from tools.resilience import DeadlineExceeded, detached_context, within_deadline
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls for the same key: the first caller runs the work,
+    everyone arriving while it is in flight awaits the same task. With result_ttl > 0
+    the result is also kept briefly so callers arriving just after it finishes reuse it.
+    Pass `results` (a TieredCache with a shared store) to share kept results between
+    worker processes; in-flight deduplication is always per process. The work runs
+    without the first caller's deadline, since it is not that caller's alone.
+    """
+    def __init__(self, result_ttl: float = 0, maxsize: int = 256, results: Any = None):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        if results is None and result_ttl > 0:
+            results = TieredCache("singleflight", maxsize=maxsize, ttl=result_ttl, persist=False)
+        self.results = results
+        self.stats: Dict[str, int] = {"calls": 0, "executions": 0, "coalesced": 0, "result_hits": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats["calls"] += 1
+        if self.results is not None:
+            cached = await self.results.get(key)
+            if cached is not MISS:
+                self.stats["result_hits"] += 1
+                return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["executions"] += 1
+            task = asyncio.get_running_loop().create_task(self._run(key, fn), context=detached_context())
+            self._inflight[key] = task
+        else:
+            self.stats["coalesced"] += 1
+        # Shield so one caller disconnecting does not cancel the work for the others
+        return await asyncio.shield(task)
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result = await fn()
+            if self.results is not None:
+                await self.results.set(key, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+def singleflight(key: Callable[..., Optional[str]], result_ttl: float = 0, maxsize: int = 256,
+                 expired: Optional[Callable[[], Any]] = None):
+    """
+    Decorator that coalesces concurrent calls of an async function. `key` receives the
+    call's arguments and returns the dedup key, or None to run that call on its own
+    (e.g. one made with its own client); the group is exposed as `fn.flight`.
+    With `expired`, each caller waits no longer than its own deadline and then gets
+    `expired()`, the function's failure value, while the shared call carries on.
+    """
+    group = SingleFlight(result_ttl=result_ttl, maxsize=maxsize)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            flight_key = key(*args, **kwargs)
+            if flight_key is None:
+                return await fn(*args, **kwargs)
+            call = lambda: group.do(f"{fn.__name__}:{flight_key}", lambda: fn(*args, **kwargs))
+            if expired is None:
+                return await call()
+            try:
+                return await within_deadline(call)
+            except DeadlineExceeded as e:
+                print(f"{fn.__name__}: {e}")
+                return expired()
+        wrapper.flight = group
+        return wrapper
+    return decorator
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional, Type, TypeVar
+from pydantic import BaseModel, ValidationError
+try:
+    from backend.llm_factory import get_llm, cached_ainvoke
+    from backend.compaction import compact_data_summary, prompt_token_report
+except ImportError:
+    from llm_factory import get_llm, cached_ainvoke
+    from compaction import compact_data_summary, prompt_token_report
+
+# Trip length when the request does not give one (matches the 3-day weather forecast)
+DEFAULT_TRIP_DAYS = int(os.getenv("DEFAULT_TRIP_DAYS", 3))
+# Longest trip that is planned (Open-Meteo forecasts up to 16 days)
+MAX_TRIP_DAYS = 16
+# Trips at least this long are written as one overview plus at most SYNTH_DAY_PARTS
+# generations of consecutive days, all running concurrently; shorter trips use a
+# single generation.
+SYNTH_SPLIT_MIN_DAYS = int(os.getenv("SYNTH_SPLIT_MIN_DAYS", 5))
+SYNTH_DAY_PARTS = int(os.getenv("SYNTH_DAY_PARTS", 4))
+# Targeted retries for a fragment that fails validation, before falling back to
+# an itinerary built from the data alone
+SYNTH_REPAIR_ATTEMPTS = int(os.getenv("SYNTH_REPAIR_ATTEMPTS", 1))
+
+class Attraction(BaseModel):
+    name: str
+    description: str
+    rating: Optional[float] = None
+    visit_order: int
+
+class Dining(BaseModel):
+    name: str
+    description: str
+    cuisine: Optional[str] = None
+    rating: Optional[float] = None
+
+class CostEstimate(BaseModel):
+    transport_estimate: str
+    total_estimate: str
+
+class DayPlan(BaseModel):
+    day: int
+    activities: List[str]
+
+class TripOverview(BaseModel):
+    trip_title: str
+    weather_summary: str
+    attractions: List[Attraction]
+    dining: List[Dining]
+    costs: CostEstimate
+
+class Itinerary(TripOverview):
+    daily_plan: List[DayPlan]
+
+class DailyPlan(BaseModel):
+    daily_plan: List[DayPlan]
+
+Model = TypeVar("Model", bound=BaseModel)
+
+RULES = """
+    CRITICAL INSTRUCTIONS:
+    1. **STRICTLY FORBIDDEN TO HALLUCINATE**: You must ONLY use the Attractions and Restaurants explicitly listed in the data above.
+    2. Be enthusiastic in the descriptions but strictly factual based on the provided data.
+"""
+
+async def generate(prompt: str, model: Type[Model], payload: Dict[str, Any], part: str) -> Model:
+    """
+    Runs one generation in the model's JSON-schema mode and validates it. A fragment
+    that fails validation gets a targeted repair request with the errors, rather than
+    being regenerated from scratch. Raises ValueError if it cannot be repaired.
+
+    `part` names the fragment in the run metadata ("synthesis_part"), so streamed
+    tokens of concurrent fragments can be told apart.
+    """
+    from langchain_core.messages import HumanMessage
+
+    llm = get_llm()
+    schema = model.model_json_schema()
+    invoke_kwargs = {
+        "response_mime_type": "application/json",
+        "response_json_schema": schema,
+        "config": {"metadata": {"synthesis_part": part}},
+    }
+    payload = {**payload, "schema": model.__name__}
+    content = await cached_ainvoke(llm, [HumanMessage(content=prompt)], "synthesizer", payload, **invoke_kwargs)
+
+    for attempt in range(SYNTH_REPAIR_ATTEMPTS + 1):
+        try:
+            return model.model_validate_json(content)
+        except ValidationError as e:
+            if attempt == SYNTH_REPAIR_ATTEMPTS:
+                raise ValueError(f"{model.__name__} failed validation: {e}") from e
+            print(f"Repairing invalid {model.__name__} ({e.error_count()} errors)")
+            repair_prompt = f"""
+    This JSON was supposed to match the {model.__name__} schema but failed validation.
+
+    JSON:
+    {content}
+
+    Validation errors:
+    {e}
+
+    Return the corrected JSON only. Keep every valid field exactly as it is.
+    """
+            repair_payload = {"repair": content, "errors": str(e), "schema": model.__name__}
+            content = await cached_ainvoke(llm, [HumanMessage(content=repair_prompt)], "synthesizer", repair_payload, **invoke_kwargs)
+
+def allocate_days(places: List[Dict[str, Any]], restaurants: List[Dict[str, Any]], days: int) -> List[Dict[str, List[Dict[str, Any]]]]:
+    """
+    Splits the route-ordered places into `days` consecutive groups of near-equal size
+    and deals the restaurants out in turn, so every day can be written independently.
+    """
+    plan = [{"places": [], "restaurants": []} for _ in range(days)]
+    for i, place in enumerate(places):
+        plan[i * days // len(places)]["places"].append(place)
+    for i, restaurant in enumerate(restaurants):
+        plan[i % days]["restaurants"].append(restaurant)
+    return plan
+
+def day_parts(days: int, parts: int) -> List[range]:
+    """Splits days 1..`days` into at most `parts` runs of consecutive days of near-equal length."""
+    parts = max(1, min(days, parts))
+    bounds = [days * k // parts for k in range(parts + 1)]
+    return [range(bounds[k] + 1, bounds[k + 1] + 1) for k in range(parts)]
+
+def fallback_overview(destination: str, compact: Dict[str, Any]) -> TripOverview:
+    """Overview built from the data alone, used when the model output is unusable."""
+    return TripOverview(
+        trip_title=f"Trip to {destination}",
+        weather_summary="",
+        attractions=[
+            Attraction(name=p["name"], description="", rating=p.get("rating"), visit_order=i + 1)
+            for i, p in enumerate(compact["places"]) if p.get("name")
+        ],
+        dining=[
+            Dining(name=r["name"], description="", rating=r.get("rating"))
+            for r in compact["restaurants"] if r.get("name")
+        ],
+        costs=CostEstimate(transport_estimate="N/A", total_estimate="N/A"),
+    )
+
+def fallback_day(day: int, allocation: Dict[str, List[Dict[str, Any]]]) -> DayPlan:
+    activities = [f"Visit {p['name']}" for p in allocation["places"] if p.get("name")]
+    activities += [f"Eat at {r['name']}" for r in allocation["restaurants"] if r.get("name")]
+    return DayPlan(day=day, activities=activities or ["Free time to explore"])
+
+async def _overview(destination: str, compact: Dict[str, Any]) -> TripOverview:
+    prompt = f"""
+    You are an expert Travel Agent writing the overview of a trip to {destination}.
+
+    Here is the real-time data I have gathered:
+    {json.dumps(compact, default=str)}
+    {RULES}
+    Give the trip a title, summarize the weather, describe every attraction (in the
+    given visiting order) and every restaurant, and estimate the costs. The day-by-day
+    plan is written separately.
+    """
+    try:
+        return await generate(prompt, TripOverview, {"part": "overview", "data": compact}, "overview")
+    except ValueError as e:
+        print(f"Synthesizer overview: {e}")
+        return fallback_overview(destination, compact)
+
+async def _days(destination: str, span: range, days: int, allocation: List[Dict[str, List[Dict[str, Any]]]], weather_days: List[Any]) -> List[DayPlan]:
+    first, last = span[0], span[-1]
+    data = {
+        "of_days": days,
+        "days": [
+            {
+                "day": day,
+                "places": allocation[day - 1]["places"],
+                "restaurants": allocation[day - 1]["restaurants"],
+                "weather": weather_days[day - 1] if day <= len(weather_days) else None,
+            }
+            for day in span
+        ],
+    }
+    which = f"day {first}" if first == last else f"days {first} to {last}"
+    prompt = f"""
+    You are an expert Travel Agent writing {which} of a {days}-day trip to {destination}.
+
+    Each day's stops in visiting order, restaurants and forecast:
+    {json.dumps(data, default=str)}
+    {RULES}
+    For each of these days, in order, list the day's activities in order, fitting
+    meals at the listed restaurants around the stops and taking the weather into account.
+    """
+    try:
+        plans = (await generate(prompt, DailyPlan, {"part": "days", "destination": destination, "data": data}, f"days {first}-{last}")).daily_plan
+    except ValueError as e:
+        print(f"Synthesizer {which}: {e}")
+        plans = []
+    # Day numbers come from the allocation, whatever the model wrote; days it left
+    # out are built from the data
+    return [
+        plans[i].model_copy(update={"day": day}) if i < len(plans) else fallback_day(day, allocation[day - 1])
+        for i, day in enumerate(span)
+    ]
+
+def _data_summary(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "destination": state["destination"],
+        "weather": state.get("weather"),
+        "places": state.get("places"),
+        "restaurants": state.get("restaurants"),
+        # The Routes field mask does not ask for a summary
+        "route_summary": "N/A",
+        "costs": state.get("costs"),
+        "days": state.get("days"),
+    }
+
+def synthesis_inputs(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The compacted data an itinerary is written from. Plans with equal inputs get the
+    same itinerary, so plan_cache keys synthesized itineraries on a hash of this.
+    """
+    return compact_data_summary(_data_summary(state))
+
+async def synthesize_itinerary(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Writes the itinerary for the gathered data and returns it as a validated dict in
+    the shape the frontend expects.
+    """
+    data_summary = _data_summary(state)
+    # Only the fields the itinerary needs go into the prompt
+    compact = compact_data_summary(data_summary)
+    tokens = prompt_token_report(data_summary, compact, state.get("raw_tokens"))
+    print(f"Synthesizer prompt data: ~{tokens['before']} -> ~{tokens['after']} tokens")
+
+    destination = state["destination"]
+    days = max(1, min(state.get("days") or DEFAULT_TRIP_DAYS, MAX_TRIP_DAYS))
+
+    if days < SYNTH_SPLIT_MIN_DAYS:
+        prompt = f"""
+    You are an expert Travel Agent. Create a detailed {days}-day itinerary for a trip to {destination}.
+
+    Here is the real-time data I have gathered:
+    {json.dumps(compact, default=str)}
+    {RULES}"""
+        try:
+            itinerary = await generate(prompt, Itinerary, {"part": "full", "data": compact}, "itinerary")
+        except ValueError as e:
+            print(f"Synthesizer: {e}")
+            allocation = allocate_days(compact["places"], compact["restaurants"], days)
+            overview = fallback_overview(destination, compact)
+            itinerary = Itinerary(**overview.model_dump(), daily_plan=[fallback_day(i + 1, a) for i, a in enumerate(allocation)])
+        return itinerary.model_dump()
+
+    # The overview and the runs of days are independent, so they are generated
+    # concurrently; each output is a fraction of the full itinerary, and output length
+    # dominates latency. The number of runs is capped so long trips do not fan out
+    # into one call per day.
+    allocation = allocate_days(compact["places"], compact["restaurants"], days)
+    weather_days = (compact.get("weather") or {}).get("days") or []
+    overview, *parts = await asyncio.gather(
+        _overview(destination, compact),
+        *(_days(destination, span, days, allocation, weather_days) for span in day_parts(days, SYNTH_DAY_PARTS)),
+    )
+    daily_plan = [plan for part in parts for plan in part]
+    return Itinerary(**overview.model_dump(), daily_plan=daily_plan).model_dump()
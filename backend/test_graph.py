@@ -5,19 +5,20 @@ import sys
 # Add project root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from backend.graph import app
+from backend.graph import get_app
 
 async def main():
     print("Testing Trip Planner Graph...")
     initial_state = {"destination": "Bangalore"}
     
     try:
-        result = await app.ainvoke(initial_state)
+        result = await get_app().ainvoke(initial_state)
         print("\n--- Final Itinerary ---\n")
         print(result.get("final_itinerary", "No itinerary generated."))
         
         print("\n--- Debug Data ---\n")
-        print(f"Weather: {result.get('weather', {}).get('current_weather', 'N/A')}")
+        weather = result.get("weather")
+        print(f"Weather: {weather.current if weather else 'N/A'}")
         print(f"Places Found: {len(result.get('places', []))}")
         print(f"Route Calculated: {'Yes' if result.get('route') else 'No'}")
         
@@ -1,38 +1,147 @@
+import asyncio
 import httpx
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+try:
+    from backend.cache import MISS, TieredCache
+    from backend.tools.geo import haversine_m
+    from backend.tools.governor import governed_request
+    from backend.tools.http_client import get_client
+except ImportError:
+    from cache import MISS, TieredCache
+    from tools.geo import haversine_m
+    from tools.governor import governed_request
+    from tools.http_client import get_client
 
-async def estimate_travel_costs(origins: List[Dict], destinations: List[Dict]) -> Dict[str, Any]:
+# Distance Matrix modes to price every leg in, fetched concurrently
+COST_MODES = [m.strip() for m in os.getenv("COST_MODES", "transit,driving,walking").split(",") if m.strip()]
+
+# Legs are cached per mode and coordinate pair, rounded to COST_LEG_PRECISION decimals
+# (4 is about 11 m), so re-plans and overlapping trips reuse the same legs.
+COST_LEG_PRECISION = int(os.getenv("COST_LEG_PRECISION", 4))
+
+leg_cache = TieredCache(
+    "legs",
+    maxsize=int(os.getenv("COST_LEG_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("COST_LEG_CACHE_TTL", 24 * 3600)),
+)
+
+# Distance Matrix limits per request
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
+
+# Fallback estimate: straight-line distance times a detour factor at a typical city
+# speed, plus a fixed overhead (waiting for transit, parking).
+ESTIMATE_SPEED_KMH = {"walking": 4.8, "bicycling": 15.0, "driving": 25.0, "transit": 18.0}
+ESTIMATE_OVERHEAD_S = {"walking": 0, "bicycling": 60, "driving": 300, "transit": 420}
+DETOUR_FACTOR = 1.3
+
+Point = Dict[str, float]
+
+def get_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters for the leg cache."""
+    return dict(leg_cache.stats)
+
+def _point_key(point: Point) -> str:
+    return f"{point['lat']:.{COST_LEG_PRECISION}f},{point['lon']:.{COST_LEG_PRECISION}f}"
+
+def leg_key(origin: Point, destination: Point, mode: str) -> str:
+    return f"{mode}:{_point_key(origin)}>{_point_key(destination)}"
+
+def estimate_leg(origin: Point, destination: Point, mode: str) -> Dict[str, Any]:
+    """Instant haversine-based estimate, used when the API has no answer."""
+    distance = haversine_m(origin, destination) * DETOUR_FACTOR
+    speed = ESTIMATE_SPEED_KMH.get(mode, ESTIMATE_SPEED_KMH["driving"]) / 3.6
+    return {
+        "distance_m": round(distance),
+        "duration_s": round(distance / speed + ESTIMATE_OVERHEAD_S.get(mode, 0)),
+        "fare": None,
+        "source": "estimate",
+    }
+
+def _parse_element(element: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if element.get("status") != "OK":
+        return None
+    return {
+        "distance_m": element.get("distance", {}).get("value"),
+        "duration_s": element.get("duration", {}).get("value"),
+        "fare": element.get("fare", {}).get("text"),
+        "source": "api",
+    }
+
+def plan_batches(legs: List[Tuple[Point, Point]]) -> List[Tuple[Point, List[Point]]]:
     """
-    Calculate travel costs/times using Google Distance Matrix.
-    Note: This is a simplified estimation.
+    Groups legs into Distance Matrix requests without asking for elements we do not
+    need: every request has one origin and the destinations of legs leaving it, so
+    each billed element is a leg we use.
     """
-    api_key = os.getenv("GOOGLE_MAPS_API_KEY")
-    if not api_key:
-        return {}
-
-    # Google Distance Matrix API (Legacy or New)
-    # Using the new Routes API Matrix for better features if possible, 
-    # but standard Distance Matrix is simpler for N x M.
-    
-    # Let's use the standard REST API for simplicity
+    by_origin: Dict[str, Tuple[Point, List[Point]]] = {}
+    for origin, destination in legs:
+        entry = by_origin.setdefault(_point_key(origin), (origin, []))
+        if all(_point_key(d) != _point_key(destination) for d in entry[1]):
+            entry[1].append(destination)
+    batches = []
+    per_request = min(MAX_DESTINATIONS, MAX_ELEMENTS)
+    for origin, destinations in by_origin.values():
+        for i in range(0, len(destinations), per_request):
+            batches.append((origin, destinations[i:i + per_request]))
+    return batches
+
+async def _fetch_batch(origin: Point, destinations: List[Point], mode: str, api_key: str, client: httpx.AsyncClient):
     url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    
-    origins_str = "|".join([f"{loc['lat']},{loc['lon']}" for loc in origins])
-    destinations_str = "|".join([f"{loc['lat']},{loc['lon']}" for loc in destinations])
-    
     params = {
-        "origins": origins_str,
-        "destinations": destinations_str,
-        "mode": "transit", # Check transit first
-        "key": api_key
+        "origins": f"{origin['lat']},{origin['lon']}",
+        "destinations": "|".join(f"{d['lat']},{d['lon']}" for d in destinations),
+        "mode": mode,
+        "key": api_key,
     }
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            print(f"Distance Matrix error: {e}")
-            return {}
+    try:
+        response = await governed_request("distancematrix", client, "GET", url, params=params)
+        response.raise_for_status()
+        elements = response.json().get("rows", [{}])[0].get("elements", [])
+    except Exception as e:
+        # Not cached, so the next plan asks again; this one falls back to estimates
+        print(f"Distance Matrix ({mode}) error: {e}")
+        return
+    # ZERO_RESULTS (e.g. no transit) is cached as None so it is not asked again
+    await asyncio.gather(*(
+        leg_cache.set(leg_key(origin, destination, mode), _parse_element(element))
+        for destination, element in zip(destinations, elements)
+    ))
+
+async def estimate_leg_costs(legs: List[Tuple[Point, Point]], modes: Optional[List[str]] = None, client: Optional[httpx.AsyncClient] = None) -> List[Dict[str, Dict[str, Any]]]:
+    """
+    Travel distance, duration and fare for each (origin, destination) leg in every
+    mode, as [{mode: {"distance_m", "duration_s", "fare", "source"}}] in leg order.
+    Only uncached legs are requested, batched per origin, with all modes in flight
+    at once. Legs the API cannot answer get a haversine estimate (source "estimate").
+    """
+    modes = modes or COST_MODES
+    api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+
+    found: Dict[str, Any] = {}
+    if api_key:
+        keys = [leg_key(origin, destination, mode) for mode in modes for origin, destination in legs]
+        found = dict(zip(keys, await asyncio.gather(*(leg_cache.get(key) for key in keys))))
+        missing: Dict[str, List[Tuple[Point, Point]]] = {}
+        for mode in modes:
+            for origin, destination in legs:
+                if found[leg_key(origin, destination, mode)] is MISS:
+                    missing.setdefault(mode, []).append((origin, destination))
+        client = client or get_client("distancematrix")
+        await asyncio.gather(*(
+            _fetch_batch(origin, destinations, mode, api_key, client)
+            for mode, mode_legs in missing.items()
+            for origin, destinations in plan_batches(mode_legs)
+        ))
+        fetched = [key for key, value in found.items() if value is MISS]
+        found.update(zip(fetched, await asyncio.gather(*(leg_cache.get(key) for key in fetched))))
+
+    table = []
+    for origin, destination in legs:
+        row = {}
+        for mode in modes:
+            cached = found.get(leg_key(origin, destination, mode), MISS)
+            row[mode] = cached if cached not in (MISS, None) else estimate_leg(origin, destination, mode)
+        table.append(row)
+    return table
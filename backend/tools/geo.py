@@ -0,0 +1,48 @@
+import math
+from typing import Dict, List
+
+EARTH_RADIUS_M = 6371000.0
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat: float, lon: float, precision: int = 6) -> str:
+    """
+    Encodes coordinates as a geohash cell. Points in the same cell share the prefix,
+    which makes the hash a cheap spatial cache key (precision 6 is roughly 1.2 x 0.6 km).
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit, ch, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch <<= 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_GEOHASH_ALPHABET[ch])
+            bit, ch = 0, 0
+    return "".join(chars)
+
+def haversine_m(a: Dict[str, float], b: Dict[str, float]) -> float:
+    """Great-circle distance in meters between two {"lat", "lon"} dicts."""
+    lat1, lat2 = math.radians(a["lat"]), math.radians(b["lat"])
+    dlat = lat2 - lat1
+    dlon = math.radians(b["lon"] - a["lon"])
+    h = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+def distance_matrix(locations: List[Dict[str, float]]) -> List[List[float]]:
+    """Symmetric haversine distance matrix in meters."""
+    n = len(locations)
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            matrix[i][j] = matrix[j][i] = haversine_m(locations[i], locations[j])
+    return matrix
@@ -1,26 +1,85 @@
 import httpx
 import os
 from typing import Dict, Optional
+try:
+    from backend.cache import MISS, TieredCache, normalize_query
+    from backend.singleflight import singleflight
+    from backend.tools.governor import governed_request
+    from backend.tools.http_client import get_client
+except ImportError:
+    from cache import MISS, TieredCache, normalize_query
+    from singleflight import singleflight
+    from tools.governor import governed_request
+    from tools.http_client import get_client
 
-async def get_coordinates(place_name: str) -> Optional[Dict[str, float]]:
+# Places that resolve are stable for weeks; misses are retried sooner in case
+# the query was a transient upstream hiccup or the index has since been updated.
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", 30 * 24 * 3600))
+GEOCODE_NEGATIVE_TTL = float(os.getenv("GEOCODE_NEGATIVE_TTL", 3600))
+
+geocode_cache = TieredCache(
+    "geocode",
+    maxsize=int(os.getenv("GEOCODE_CACHE_SIZE", 2048)),
+    ttl=GEOCODE_CACHE_TTL,
+)
+
+def get_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters for the geocoding cache."""
+    return dict(geocode_cache.stats)
+
+# Calls made with their own client are not coalesced with anyone else's
+@singleflight(key=lambda place_name, client=None: None if client else normalize_query(place_name), expired=lambda: None)
+async def get_coordinates(place_name: str, client: Optional[httpx.AsyncClient] = None) -> Optional[Dict[str, float]]:
     """
     Get latitude and longitude for a place name using Geoapify.
+    Results, including "not found", are cached by normalized query text.
     """
     api_key = os.getenv("GEOAPIFY_KEY")
     if not api_key:
         print("Warning: GEOAPIFY_KEY not found")
         return None
-        
+
+    key = normalize_query(place_name)
+    cached = await geocode_cache.get(key)
+    if cached is not MISS:
+        return cached
+
+    try:
+        coords = await _geocode(place_name, api_key, client or get_client("geoapify"))
+    except Exception as e:
+        # Upstream failures are not cached so the next request retries
+        print(f"Geocoding error: {e}")
+        return None
+
+    await geocode_cache.set(key, coords, ttl=GEOCODE_CACHE_TTL if coords else GEOCODE_NEGATIVE_TTL)
+    return coords
+
+async def _geocode(place_name: str, api_key: str, client: httpx.AsyncClient) -> Optional[Dict[str, float]]:
+    """Uncached Geoapify lookup. Returns None when nothing matches, raises on upstream errors."""
     base_url = "https://api.geoapify.com/v1/geocode/search"
     params = {
         "text": place_name,
         "apiKey": api_key,
         "limit": 1
     }
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(base_url, params=params)
+
+    response = await governed_request("geoapify", client, "GET", base_url, params=params)
+    response.raise_for_status()
+    data = response.json()
+    if data["features"]:
+        props = data["features"][0]["properties"]
+        return {
+            "lat": props["lat"],
+            "lon": props["lon"],
+            "formatted": props["formatted"]
+        }
+    else:
+        print(f"Geocoding: No results for '{place_name}'. Response: {data}")
+        # Fallback: Try appending "India" if not present (simple heuristic for this user context)
+        if "india" not in place_name.lower():
+            print(f"Geocoding: Retrying with '{place_name}, India'...")
+            params["text"] = f"{place_name}, India"
+            response = await governed_request("geoapify", client, "GET", base_url, params=params)
             response.raise_for_status()
             data = response.json()
             if data["features"]:
@@ -30,23 +89,4 @@ async def get_coordinates(place_name: str) -> Optional[Dict[str, float]]:
                     "lon": props["lon"],
                     "formatted": props["formatted"]
                 }
-            else:
-                print(f"Geocoding: No results for '{place_name}'. Response: {data}")
-                # Fallback: Try appending "India" if not present (simple heuristic for this user context)
-                if "india" not in place_name.lower():
-                    print(f"Geocoding: Retrying with '{place_name}, India'...")
-                    params["text"] = f"{place_name}, India"
-                    response = await client.get(base_url, params=params)
-                    data = response.json()
-                    if data["features"]:
-                        props = data["features"][0]["properties"]
-                        return {
-                            "lat": props["lat"],
-                            "lon": props["lon"],
-                            "formatted": props["formatted"]
-                        }
-                return None
-        except Exception as e:
-            print(f"Geocoding error: {e}")
-            return None
-    return None
+        return None
@@ -0,0 +1,209 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import httpx
+try:
+    from backend.metrics import UPSTREAM_DURATION, UPSTREAM_RESPONSE_BYTES, register_collector, span
+    from backend.tools.resilience import request_key, resilient_call
+except ImportError:
+    from metrics import UPSTREAM_DURATION, UPSTREAM_RESPONSE_BYTES, register_collector, span
+    from tools.resilience import request_key, resilient_call
+
+# Default requests/second, burst size and in-flight cap per upstream. Override with
+# RATE_LIMIT_<UPSTREAM>, RATE_BURST_<UPSTREAM> and MAX_INFLIGHT_<UPSTREAM>
+# (e.g. RATE_LIMIT_PLACES=50). A rate of 0 disables the token bucket.
+DEFAULT_LIMITS = {
+    "geoapify": (5.0, 5, 10),
+    "open-meteo": (10.0, 10, 10),
+    "places": (20.0, 20, 20),
+    "routes": (20.0, 20, 10),
+    # Requests are per origin (see tools/costs.py): a plan sends one per leg and mode,
+    # each only a few elements. Google meters elements, which this does not raise.
+    "distancematrix": (50.0, 50, 20),
+    "gemini": (5.0, 5, 10),
+}
+
+MAX_RETRIES = int(os.getenv("GOVERNOR_MAX_RETRIES", 2))
+MAX_BACKOFF = float(os.getenv("GOVERNOR_MAX_BACKOFF", 30))
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> float:
+        """Tokens that could be taken right now, without taking any."""
+        self._refill()
+        return self.tokens
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # The lock keeps waiters in FIFO order
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+class UpstreamGovernor:
+    """
+    Rate governor for one upstream: a token bucket, a cap on in-flight requests, and
+    AIMD adaptation. A 429 halves the rate and pauses the upstream for Retry-After
+    (or an exponential backoff); each success creeps the rate back to its configured value.
+    """
+    def __init__(self, name: str, rate: float, burst: int, max_inflight: int):
+        self.name = name
+        self.configured_rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.semaphore = asyncio.Semaphore(max_inflight)
+        self.blocked_until = 0.0
+        self.consecutive_throttles = 0
+        self.stats: Dict[str, float] = {
+            "requests": 0, "throttled": 0, "inflight": 0,
+            "queue_wait_ms_total": 0.0, "queue_wait_ms_max": 0.0,
+        }
+
+    @asynccontextmanager
+    async def slot(self):
+        start = time.monotonic()
+        pause = self.blocked_until - start
+        if pause > 0:
+            await asyncio.sleep(pause)
+        async with self.semaphore:
+            await self.bucket.acquire()
+            waited_ms = (time.monotonic() - start) * 1000
+            self.stats["requests"] += 1
+            self.stats["queue_wait_ms_total"] += waited_ms
+            self.stats["queue_wait_ms_max"] = max(self.stats["queue_wait_ms_max"], waited_ms)
+            self.stats["inflight"] += 1
+            try:
+                yield
+            finally:
+                self.stats["inflight"] -= 1
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """Records a 429 from the upstream and slows down."""
+        self.stats["throttled"] += 1
+        self.consecutive_throttles += 1
+        if self.configured_rate > 0:
+            self.bucket.rate = max(self.configured_rate * 0.1, self.bucket.rate / 2)
+        if retry_after is None:
+            backoff = min(MAX_BACKOFF, 0.5 * 2 ** (self.consecutive_throttles - 1))
+            retry_after = backoff * random.uniform(0.5, 1.0)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def succeeded(self):
+        self.consecutive_throttles = 0
+        if self.configured_rate > 0 and self.bucket.rate < self.configured_rate:
+            self.bucket.rate = min(self.configured_rate, self.bucket.rate + self.configured_rate * 0.05)
+
+    def snapshot(self) -> Dict[str, Any]:
+        requests = self.stats["requests"] or 1
+        return {
+            **self.stats,
+            "queue_wait_ms_avg": self.stats["queue_wait_ms_total"] / requests,
+            "rate": self.bucket.rate,
+            "paused_s": max(0.0, self.blocked_until - time.monotonic()),
+        }
+
+_governors: Dict[str, UpstreamGovernor] = {}
+
+def get_governor(upstream: str) -> UpstreamGovernor:
+    governor = _governors.get(upstream)
+    if governor is None:
+        rate, burst, inflight = DEFAULT_LIMITS.get(upstream, (0.0, 1, 10))
+        suffix = upstream.upper().replace("-", "_")
+        governor = UpstreamGovernor(
+            upstream,
+            rate=float(os.getenv(f"RATE_LIMIT_{suffix}", rate)),
+            burst=int(os.getenv(f"RATE_BURST_{suffix}", burst)),
+            max_inflight=int(os.getenv(f"MAX_INFLIGHT_{suffix}", inflight)),
+        )
+        _governors[upstream] = governor
+    return governor
+
+def get_governor_stats() -> Dict[str, Dict[str, Any]]:
+    """Request counts, 429s, queue-wait times and current rate per upstream."""
+    return {name: governor.snapshot() for name, governor in _governors.items()}
+
+def _prometheus_lines() -> List[str]:
+    lines = [
+        "# HELP inkle_upstream_queue_wait_seconds_total Time spent waiting for the rate governor.",
+        "# TYPE inkle_upstream_queue_wait_seconds_total counter",
+    ]
+    stats = get_governor_stats()
+    for name, snapshot in sorted(stats.items()):
+        lines.append(f'inkle_upstream_queue_wait_seconds_total{{upstream="{name}"}} {snapshot["queue_wait_ms_total"] / 1000:g}')
+    lines += ["# HELP inkle_upstream_throttled_total 429 responses per upstream.", "# TYPE inkle_upstream_throttled_total counter"]
+    for name, snapshot in sorted(stats.items()):
+        lines.append(f'inkle_upstream_throttled_total{{upstream="{name}"}} {snapshot["throttled"]:g}')
+    lines += ["# HELP inkle_upstream_rate Current allowed requests/second.", "# TYPE inkle_upstream_rate gauge"]
+    for name, snapshot in sorted(stats.items()):
+        lines.append(f'inkle_upstream_rate{{upstream="{name}"}} {snapshot["rate"]:g}')
+    return lines
+
+register_collector(_prometheus_lines)
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+async def governed_request(upstream: str, client: httpx.AsyncClient, method: str, url: str, idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+    """
+    Sends a request through the upstream's governor, retrying 429s after the
+    advertised Retry-After, and through its resilience layer (deadline, circuit
+    breaker; hedging, retries and the last-good fallback for idempotent requests).
+    GETs are idempotent; pass idempotent=True for read-only POSTs. The final
+    response is returned as-is, so callers keep using raise_for_status() for error
+    handling.
+    """
+    governor = get_governor(upstream)
+
+    async def attempt() -> httpx.Response:
+        for number in range(MAX_RETRIES + 1):
+            async with governor.slot():
+                start = time.perf_counter()
+                with span(f"upstream.{upstream}", method=method):
+                    try:
+                        response = await client.request(method, url, **kwargs)
+                    except Exception:
+                        UPSTREAM_DURATION.observe(time.perf_counter() - start, upstream=upstream, status="error")
+                        raise
+            UPSTREAM_DURATION.observe(time.perf_counter() - start, upstream=upstream, status=response.status_code)
+            UPSTREAM_RESPONSE_BYTES.observe(len(response.content), upstream=upstream)
+            if response.status_code != 429:
+                governor.succeeded()
+                return response
+            governor.throttled(_retry_after(response))
+            print(f"{upstream}: 429 Too Many Requests (attempt {number + 1})")
+        return response
+
+    if idempotent is None:
+        idempotent = method == "GET"
+    key = request_key(upstream, method, url, kwargs) if idempotent else None
+    return await resilient_call(upstream, attempt, idempotent, method, url, key)
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """SDK clients (e.g. Gemini) surface 429s as exceptions rather than responses."""
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text
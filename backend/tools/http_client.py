@@ -0,0 +1,85 @@
+import importlib.util
+import os
+from typing import Dict, Optional
+
+import httpx
+
+# Every upstream gets its own keep-alive pool so a slow host cannot starve the others
+# of connections. Names are used as keys throughout the tools modules.
+UPSTREAMS = {
+    "geoapify": "https://api.geoapify.com",
+    "open-meteo": "https://api.open-meteo.com",
+    "places": "https://places.googleapis.com",
+    "routes": "https://routes.googleapis.com",
+    "distancematrix": "https://maps.googleapis.com",
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def _env_setting(name: str, upstream: str, default: float) -> float:
+    """
+    Reads a pool setting, preferring the per-upstream override
+    (e.g. HTTP_MAX_CONNECTIONS_PLACES) over the global value.
+    """
+    suffix = upstream.upper().replace("-", "_")
+    value = os.getenv(f"{name}_{suffix}") or os.getenv(name)
+    return float(value) if value else default
+
+def _http2_enabled() -> bool:
+    if os.getenv("HTTP2_ENABLED", "1").lower() in ("0", "false", "no"):
+        return False
+    # httpx only speaks HTTP/2 when the optional `h2` package is installed
+    return importlib.util.find_spec("h2") is not None
+
+def build_client(upstream: str) -> httpx.AsyncClient:
+    """
+    Creates a pooled client for one upstream using the HTTP_* environment settings.
+    """
+    limits = httpx.Limits(
+        max_connections=int(_env_setting("HTTP_MAX_CONNECTIONS", upstream, 20)),
+        max_keepalive_connections=int(_env_setting("HTTP_MAX_KEEPALIVE", upstream, 10)),
+        keepalive_expiry=_env_setting("HTTP_KEEPALIVE_EXPIRY", upstream, 30.0),
+    )
+    timeout = httpx.Timeout(
+        _env_setting("HTTP_TIMEOUT", upstream, 10.0),
+        connect=_env_setting("HTTP_CONNECT_TIMEOUT", upstream, 5.0),
+        # How long a request may queue for a free pooled connection; under batch load
+        # the pool size is what caps concurrent calls to each upstream.
+        pool=_env_setting("HTTP_POOL_TIMEOUT", upstream, 30.0),
+    )
+    return httpx.AsyncClient(http2=_http2_enabled(), limits=limits, timeout=timeout)
+
+def get_client(upstream: str) -> httpx.AsyncClient:
+    """
+    Returns the shared client for an upstream, creating it on first use so scripts
+    and the MCP server work without going through the FastAPI lifespan.
+    """
+    if upstream not in UPSTREAMS:
+        raise KeyError(f"Unknown upstream: {upstream}")
+    client = _clients.get(upstream)
+    if client is None or client.is_closed:
+        client = build_client(upstream)
+        _clients[upstream] = client
+    return client
+
+def set_client(upstream: str, client: Optional[httpx.AsyncClient]):
+    """
+    Replaces the shared client for an upstream, e.g. with one backed by
+    httpx.MockTransport in tests and benchmarks. Passing None drops the override.
+    """
+    if client is None:
+        _clients.pop(upstream, None)
+    else:
+        _clients[upstream] = client
+
+async def startup():
+    """Opens a pooled client per upstream. Called from the FastAPI lifespan."""
+    for upstream in UPSTREAMS:
+        get_client(upstream)
+
+async def shutdown():
+    """Closes all pooled clients and releases their connections."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
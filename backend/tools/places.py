@@ -1,13 +1,98 @@
+import asyncio
 import httpx
 import os
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
+try:
+    from backend.cache import MISS, TieredCache, normalize_query
+    from backend.metrics import Counter, register_collector
+    from backend.tools.geo import geohash
+    from backend.singleflight import singleflight
+    from backend.tools.governor import governed_request
+    from backend.tools.http_client import get_client
+except ImportError:
+    from cache import MISS, TieredCache, normalize_query
+    from metrics import Counter, register_collector
+    from singleflight import singleflight
+    from tools.geo import geohash
+    from tools.governor import governed_request
+    from tools.http_client import get_client
 
-async def search_attractions(lat: float, lon: float, limit: int = 5, query_context: str = None) -> List[Dict[str, Any]]:
+# Results are cached per geohash cell, so any coordinates inside the same cell
+# (e.g. "Paris" and "Paris, France") share one upstream fetch.
+PLACES_CACHE_PRECISION = int(os.getenv("PLACES_CACHE_PRECISION", 6))
+
+places_cache = TieredCache(
+    "places",
+    maxsize=int(os.getenv("PLACES_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("PLACES_CACHE_TTL", 24 * 3600)),
+)
+
+def get_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters for the places cache."""
+    return dict(places_cache.stats)
+
+# "serial" walks the fallback tiers one at a time and only pays for the tiers it needs.
+# "hedged" fires every tier at once and cancels the rest once enough results are in,
+# trading extra Places quota for a single round trip in sparse regions.
+PLACES_SEARCH_STRATEGY = os.getenv("PLACES_SEARCH_STRATEGY", "serial")
+
+# Per-tier timings: how often each tier ran, was used, was cancelled, and its total latency
+tier_metrics: Dict[str, Dict[str, float]] = {}
+TIER_CALLS = Counter("inkle_places_tier_calls_total", "Attraction search tier calls by outcome (used, unused, cancelled).")
+TIER_SECONDS = Counter("inkle_places_tier_seconds_total", "Time spent in attraction search tiers, by outcome.")
+register_collector(TIER_CALLS.render)
+register_collector(TIER_SECONDS.render)
+
+def _record_tier(tier: str, outcome: str, elapsed: float):
+    stats = tier_metrics.setdefault(tier, {"calls": 0, "used": 0, "unused": 0, "cancelled": 0, "total_ms": 0.0})
+    stats["calls"] += 1
+    stats[outcome] += 1
+    stats["total_ms"] += elapsed * 1000
+    TIER_CALLS.inc(tier=tier, outcome=outcome)
+    TIER_SECONDS.inc(elapsed, tier=tier, outcome=outcome)
+
+def get_tier_stats() -> Dict[str, Dict[str, float]]:
+    """Per-tier call counts and average latency for search_attractions."""
+    return {
+        tier: {**stats, "avg_ms": stats["total_ms"] / stats["calls"]}
+        for tier, stats in tier_metrics.items()
+    }
+
+def normalize_attractions(places: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Converts raw Places API results into our attraction dicts, keyed by place ID.
+    """
+    results = {}
+    for place in places:
+        place_id = place.get("id") # Need 'places.id' in FieldMask
+        if place_id and place_id not in results:
+            results[place_id] = {
+                "name": place.get("displayName", {}).get("text"),
+                "address": place.get("formattedAddress"),
+                "rating": place.get("rating"),
+                "lat": place.get("location", {}).get("latitude"),
+                "lon": place.get("location", {}).get("longitude"),
+                "categories": [place.get("primaryType", "attraction")]
+            }
+    return results
+
+def _attractions_key(lat, lon, limit=5, query_context=None, client=None, strategy=None):
+    # Calls made with their own client are not coalesced with anyone else's
+    if client:
+        return None
+    context = normalize_query(query_context) if query_context else ""
+    return f"{geohash(lat, lon, PLACES_CACHE_PRECISION)}:{limit}:{context}:{strategy}"
+
+@singleflight(key=_attractions_key, expired=list)
+async def search_attractions(lat: float, lon: float, limit: int = 5, query_context: str = None, client: Optional[httpx.AsyncClient] = None, strategy: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Fetches top rated tourist attractions using Google Places API with a 3-step fallback strategy:
     1. 5km radius (City Center)
     2. 50km radius (Surrounding Region)
     3. Text Search (District/Region fallback)
+    With strategy="hedged" all tiers start concurrently. It returns as soon as the tiers
+    that have answered, merged in tier order, make up `limit` results, and cancels the rest.
     """
     api_key = os.getenv("GOOGLE_MAPS_API_KEY")
     if not api_key:
@@ -24,8 +109,14 @@ async def search_attractions(lat: float, lon: float, limit: int = 5, query_conte
     }
     
     all_results = {} # Use dict for deduplication by ID
+    client = client or get_client("places")
+    cell = geohash(lat, lon, PLACES_CACHE_PRECISION)
 
     async def fetch_nearby(radius: int):
+        cache_key = f"nearby:{cell}:{radius}:{limit}"
+        cached = await places_cache.get(cache_key)
+        if cached is not MISS:
+            return cached
         body = {
             "includedTypes": ["tourist_attraction", "museum", "historical_landmark", "park"],
             "maxResultCount": limit,
@@ -37,65 +128,113 @@ async def search_attractions(lat: float, lon: float, limit: int = 5, query_conte
             },
             "rankPreference": "POPULARITY"
         }
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(nearby_url, headers=headers, json=body)
-                response.raise_for_status()
-                return response.json().get("places", [])
-            except Exception as e:
-                print(f"Google Places Nearby ({radius}m) error: {e}")
-                if 'response' in locals():
-                    print(f"Response: {response.text}")
-                return []
+        try:
+            response = await governed_request("places", client, "POST", nearby_url, idempotent=True, headers=headers, json=body)
+            response.raise_for_status()
+            results = normalize_attractions(response.json().get("places", []))
+        except Exception as e:
+            print(f"Google Places Nearby ({radius}m) error: {e}")
+            if 'response' in locals():
+                print(f"Response: {response.text}")
+            return {}
+        await places_cache.set(cache_key, results)
+        return results
 
     async def fetch_text(query: str):
+        cache_key = f"text:{normalize_query(query)}:{limit}"
+        cached = await places_cache.get(cache_key)
+        if cached is not MISS:
+            return cached
         body = {
             "textQuery": query,
             "maxResultCount": limit
         }
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(text_url, headers=headers, json=body)
-                response.raise_for_status()
-                return response.json().get("places", [])
-            except Exception as e:
-                print(f"Google Places Text Search ({query}) error: {e}")
-                return []
+        try:
+            response = await governed_request("places", client, "POST", text_url, idempotent=True, headers=headers, json=body)
+            response.raise_for_status()
+            results = normalize_attractions(response.json().get("places", []))
+        except Exception as e:
+            print(f"Google Places Text Search ({query}) error: {e}")
+            return {}
+        await places_cache.set(cache_key, results)
+        return results
 
     def process_places(places):
-        for place in places:
-            place_id = place.get("id") # Need 'places.id' in FieldMask
-            if place_id and place_id not in all_results:
-                all_results[place_id] = {
-                    "name": place.get("displayName", {}).get("text"),
-                    "address": place.get("formattedAddress"),
-                    "rating": place.get("rating"),
-                    "lat": place.get("location", {}).get("latitude"),
-                    "lon": place.get("location", {}).get("longitude"),
-                    "categories": [place.get("primaryType", "attraction")]
-                }
+        for place_id, place in places.items():
+            if place_id not in all_results:
+                all_results[place_id] = place
+
+    async def timed(tier: str, fetch):
+        start = time.perf_counter()
+        try:
+            return await fetch
+        except asyncio.CancelledError:
+            _record_tier(tier, "cancelled", time.perf_counter() - start)
+            raise
+        finally:
+            elapsed[tier] = time.perf_counter() - start
+
+    elapsed: Dict[str, float] = {}
+    query = f"top tourist attractions in {query_context}" if query_context else None
+
+    if (strategy or PLACES_SEARCH_STRATEGY) == "hedged":
+        tiers = [("nearby_5km", fetch_nearby(5000)), ("nearby_50km", fetch_nearby(50000))]
+        if query:
+            tiers.append(("text", fetch_text(query)))
+        print(f"Searching {len(tiers)} tiers concurrently...")
+        tasks = [(tier, asyncio.create_task(timed(tier, fetch))) for tier, fetch in tiers]
+        answered: Dict[str, Dict[str, Any]] = {}
+        merged: List[str] = []
+        pending = {task: tier for tier, task in tasks}
+        try:
+            # Merge whatever has answered in tier order, so dedup and priority match the
+            # serial strategy, but do not wait on a slow tier once the others are enough
+            while pending and len(all_results) < limit:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    answered[pending.pop(task)] = task.result()
+                all_results.clear()
+                merged.clear()
+                for tier, _ in tasks:
+                    if tier in answered and len(all_results) < limit:
+                        process_places(answered[tier])
+                        merged.append(tier)
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for tier, task in tasks:
+                if tier in merged:
+                    _record_tier(tier, "used", elapsed[tier])
+                elif not task.cancelled():
+                    # Finished but not needed: the quota was spent and the result discarded
+                    _record_tier(tier, "unused", elapsed[tier])
+        return list(all_results.values())[:limit]
 
     # Step 1: 5km Radius
     print("Searching 5km radius...")
-    places_5km = await fetch_nearby(5000)
+    places_5km = await timed("nearby_5km", fetch_nearby(5000))
     process_places(places_5km)
+    _record_tier("nearby_5km", "used", elapsed["nearby_5km"])
     
-    # Step 2: 50km Radius (if < 5 results)
-    if len(all_results) < 5:
+    # Step 2: 50km Radius (if < limit results)
+    if len(all_results) < limit:
         print("Expanding to 50km radius...")
-        places_50km = await fetch_nearby(50000)
+        places_50km = await timed("nearby_50km", fetch_nearby(50000))
         process_places(places_50km)
+        _record_tier("nearby_50km", "used", elapsed["nearby_50km"])
 
-    # Step 3: Text Search (if < 5 results and context provided)
-    if len(all_results) < 5 and query_context:
+    # Step 3: Text Search (if < limit results and context provided)
+    if len(all_results) < limit and query:
         print(f"Falling back to Text Search for: {query_context}...")
-        query = f"top tourist attractions in {query_context}"
-        places_text = await fetch_text(query)
+        places_text = await timed("text", fetch_text(query))
         process_places(places_text)
+        _record_tier("text", "used", elapsed["text"])
 
     return list(all_results.values())[:limit]
 
-async def search_restaurants(lat: float, lon: float, radius: int = 1000) -> List[Dict[str, Any]]:
+@singleflight(key=lambda lat, lon, radius=1000, client=None: None if client else f"{geohash(lat, lon, PLACES_CACHE_PRECISION)}:{radius}", expired=list)
+async def search_restaurants(lat: float, lon: float, radius: int = 1000, client: Optional[httpx.AsyncClient] = None) -> List[Dict[str, Any]]:
     """
     Fetches nearby restaurants using Google Places API (New).
     """
@@ -111,6 +250,11 @@ async def search_restaurants(lat: float, lon: float, radius: int = 1000) -> List
         "X-Goog-FieldMask": "places.displayName,places.formattedAddress,places.priceLevel,places.rating,places.userRatingCount,places.location"
     }
     
+    cache_key = f"restaurants:{geohash(lat, lon, PLACES_CACHE_PRECISION)}:{radius}"
+    cached = await places_cache.get(cache_key)
+    if cached is not MISS:
+        return cached
+
     body = {
         "includedTypes": ["restaurant"],
         "maxResultCount": 5,
@@ -125,22 +269,23 @@ async def search_restaurants(lat: float, lon: float, radius: int = 1000) -> List
         }
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, headers=headers, json=body)
-            response.raise_for_status()
-            data = response.json()
-            results = []
-            for place in data.get("places", []):
-                results.append({
-                    "name": place.get("displayName", {}).get("text"),
-                    "address": place.get("formattedAddress"),
-                    "rating": place.get("rating"),
-                    "price_level": place.get("priceLevel"),
-                    "lat": place.get("location", {}).get("latitude"),
-                    "lon": place.get("location", {}).get("longitude")
-                })
-            return results
-        except Exception as e:
-            print(f"Google Places error: {e}")
-            return []
+    client = client or get_client("places")
+    try:
+        response = await governed_request("places", client, "POST", url, idempotent=True, headers=headers, json=body)
+        response.raise_for_status()
+        data = response.json()
+        results = []
+        for place in data.get("places", []):
+            results.append({
+                "name": place.get("displayName", {}).get("text"),
+                "address": place.get("formattedAddress"),
+                "rating": place.get("rating"),
+                "price_level": place.get("priceLevel"),
+                "lat": place.get("location", {}).get("latitude"),
+                "lon": place.get("location", {}).get("longitude")
+            })
+        await places_cache.set(cache_key, results)
+        return results
+    except Exception as e:
+        print(f"Google Places error: {e}")
+        return []
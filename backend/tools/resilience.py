@@ -0,0 +1,325 @@
+"""
+Resilience for upstream calls: deadline budgets, hedged requests, circuit breakers
+with cached fallbacks, and retries with jitter. Used by governor.governed_request,
+so every tool gets it without changes.
+
+- Deadlines live in a context variable. The server sets one per request and graph
+  nodes narrow it to their own budget; each upstream attempt only gets what is left.
+- Idempotent requests still running after the upstream's recent p95 latency get a
+  duplicate; the first answer wins and the other is cancelled.
+- After CIRCUIT_FAILURE_THRESHOLD consecutive failures an upstream's breaker opens
+  and calls fail fast for CIRCUIT_RESET_TIMEOUT seconds, then one probe is let through.
+- Failed, timed-out and short-circuited idempotent requests are answered from the
+  last good response to the same request, when there is one.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+try:
+    from backend.cache import MISS, TTLCache, params_hash
+    from backend.metrics import register_collector
+except ImportError:
+    from cache import MISS, TTLCache, params_hash
+    from metrics import register_collector
+
+# Overall budget for one API request, in seconds (0 disables it)
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 30))
+# Per-node budgets, within the request's; override with NODE_BUDGET_<NODE>
+DEFAULT_NODE_BUDGETS = {
+    "geocoder": 6.0,
+    "fetch_weather": 6.0,
+    "fetch_places": 12.0,
+    "calculate_route": 8.0,
+    "fetch_route_geometry": 8.0,
+    "calculate_cost": 8.0,
+}
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1").lower() not in ("0", "false", "no")
+# Hedging waits until an upstream has this many latency samples
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.05))
+
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", 2))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.1))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 2.0))
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+
+# Last good response per idempotent request, served when the upstream cannot answer
+last_good = TTLCache(
+    maxsize=int(os.getenv("FALLBACK_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("FALLBACK_CACHE_TTL", 24 * 3600)),
+)
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before the upstream answered."""
+
+class CircuitOpenError(RuntimeError):
+    """The upstream's circuit breaker is open, so the call was not attempted."""
+
+# --- Deadlines ---
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Limits everything awaited inside the block to `seconds` from now, or to the
+    enclosing deadline if that is sooner. None or 0 leaves the enclosing one as is.
+    """
+    if not seconds:
+        yield
+        return
+    current = _deadline.get()
+    new = time.monotonic() + seconds
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current deadline, or None without one."""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+async def within_deadline(attempt: Callable[[], Awaitable[Any]]) -> Any:
+    """Awaits `attempt()` for no longer than the current deadline allows; raises DeadlineExceeded."""
+    left = remaining()
+    if left is None:
+        return await attempt()
+    if left <= 0:
+        raise DeadlineExceeded("deadline exceeded before the call started")
+    try:
+        return await asyncio.wait_for(attempt(), left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"no answer within the remaining {left:.2f}s budget")
+
+def detached_context() -> contextvars.Context:
+    """
+    A copy of the current context without its deadline, for work several requests
+    share: it must not stop at whichever request started it. Each of them bounds its
+    own wait with within_deadline.
+    """
+    context = contextvars.copy_context()
+    context.run(_deadline.set, None)
+    return context
+
+def node_budget(name: str) -> float:
+    suffix = name.upper()
+    return float(os.getenv(f"NODE_BUDGET_{suffix}", DEFAULT_NODE_BUDGETS.get(name, 0)))
+
+def budgeted(name: str, node: Callable):
+    """Wraps a graph node so its upstream calls share the node's time budget."""
+    budget = node_budget(name)
+
+    @functools.wraps(node)
+    async def wrapper(state):
+        with deadline(budget):
+            return await node(state)
+    return wrapper
+
+# --- Latency tracking, circuit breaking ---
+
+class UpstreamHealth:
+    """Recent latencies (for the hedge delay) and circuit breaker state of one upstream."""
+    def __init__(self, name: str, window: int = 200):
+        self.name = name
+        self.latencies: deque = deque(maxlen=window)
+        self._p95: Optional[float] = None
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.stats: Dict[str, int] = {
+            "hedged": 0, "hedge_wins": 0, "retries": 0, "short_circuited": 0,
+            "fallbacks": 0, "deadline_exceeded": 0, "circuit_opened": 0,
+        }
+
+    def observe(self, seconds: float):
+        self.latencies.append(seconds)
+        self._p95 = None
+
+    def hedge_delay(self) -> Optional[float]:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        if self._p95 is None:
+            ordered = sorted(self.latencies)
+            self._p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        return max(HEDGE_MIN_DELAY, self._p95)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= CIRCUIT_RESET_TIMEOUT else "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state only one probe at a time."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def succeeded(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failed(self):
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= CIRCUIT_FAILURE_THRESHOLD):
+            if self.opened_at is None:
+                self.stats["circuit_opened"] += 1
+                print(f"{self.name}: circuit open after {self.failures} failures")
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "state": self.state, "p95_ms": (self.hedge_delay() or 0) * 1000}
+
+_health: Dict[str, UpstreamHealth] = {}
+
+def get_health(upstream: str) -> UpstreamHealth:
+    health = _health.get(upstream)
+    if health is None:
+        health = _health[upstream] = UpstreamHealth(upstream)
+    return health
+
+def get_resilience_stats() -> Dict[str, Dict[str, Any]]:
+    """Hedges, retries, breaker state and fallbacks per upstream."""
+    return {name: health.snapshot() for name, health in _health.items()}
+
+def _prometheus_lines() -> List[str]:
+    stats = get_resilience_stats()
+    lines = ["# HELP inkle_upstream_resilience_total Hedges, retries, fallbacks and short-circuits per upstream.",
+             "# TYPE inkle_upstream_resilience_total counter"]
+    for name, snapshot in sorted(stats.items()):
+        for event in ("hedged", "hedge_wins", "retries", "short_circuited", "fallbacks", "deadline_exceeded", "circuit_opened"):
+            lines.append(f'inkle_upstream_resilience_total{{upstream="{name}",event="{event}"}} {snapshot[event]}')
+    lines += ["# HELP inkle_upstream_circuit_open 1 while the upstream's circuit breaker is open.",
+              "# TYPE inkle_upstream_circuit_open gauge"]
+    for name, snapshot in sorted(stats.items()):
+        lines.append(f'inkle_upstream_circuit_open{{upstream="{name}"}} {int(snapshot["state"] != "closed")}')
+    return lines
+
+register_collector(_prometheus_lines)
+
+# --- Calls ---
+
+Attempt = Callable[[], Awaitable[httpx.Response]]
+
+def request_key(upstream: str, method: str, url: str, kwargs: Dict[str, Any]) -> str:
+    return f"{upstream}:{method}:{url}:{params_hash({'params': kwargs.get('params'), 'json': kwargs.get('json')})}"
+
+def _retryable(outcome: Any) -> bool:
+    if isinstance(outcome, BaseException):
+        return isinstance(outcome, (httpx.TransportError, asyncio.TimeoutError))
+    return outcome.status_code in RETRY_STATUSES
+
+def _fallback(key: Optional[str], method: str, url: str) -> Optional[httpx.Response]:
+    cached = last_good.get(key) if key else MISS
+    if cached is MISS:
+        return None
+    status, content_type, content = cached
+    headers = {"content-type": content_type, "x-inkle-fallback": "stale"}
+    return httpx.Response(status, headers=headers, content=content, request=httpx.Request(method, url))
+
+
+async def _hedged(health: UpstreamHealth, attempt: Attempt) -> httpx.Response:
+    """One attempt, plus a duplicate if it is still running after the p95 delay."""
+    delay = health.hedge_delay() if HEDGE_ENABLED else None
+    primary = asyncio.ensure_future(within_deadline(attempt))
+    if delay is None:
+        return await primary
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary.result()
+
+    health.stats["hedged"] += 1
+    hedge = asyncio.ensure_future(within_deadline(attempt))
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and not _retryable(task.result()):
+                    if task is hedge:
+                        health.stats["hedge_wins"] += 1
+                    return task.result()
+        # Neither attempt succeeded: report the primary's outcome
+        return primary.result()
+    finally:
+        for task in (primary, hedge):
+            if not task.done():
+                task.cancel()
+
+async def resilient_call(upstream: str, attempt: Attempt, idempotent: bool, method: str, url: str, key: Optional[str] = None) -> httpx.Response:
+    """
+    Runs `attempt` (one governed round trip) under the current deadline, the
+    upstream's circuit breaker and, for idempotent requests, hedging, retries with
+    full jitter and the last-good fallback. Returns the upstream's response (which
+    may still be an error status) or raises.
+    """
+    health = get_health(upstream)
+    key = key if idempotent else None
+    attempts = 1 + (RETRY_ATTEMPTS if idempotent else 0)
+    outcome: Any = None
+
+    for number in range(attempts):
+        if not health.allow():
+            health.stats["short_circuited"] += 1
+            outcome = CircuitOpenError(f"{upstream} circuit is open")
+            break
+        start = time.monotonic()
+        try:
+            outcome = await (_hedged(health, attempt) if idempotent else within_deadline(attempt))
+        except DeadlineExceeded as e:
+            # Out of budget; the upstream is not necessarily unhealthy
+            health.stats["deadline_exceeded"] += 1
+            health.probing = False
+            outcome = e
+            break
+        except (httpx.TransportError, asyncio.TimeoutError) as e:
+            outcome = e
+        except BaseException:
+            health.probing = False
+            raise
+
+        if _retryable(outcome):
+            health.failed()
+        else:
+            health.succeeded()
+            health.observe(time.monotonic() - start)
+            if key and outcome.status_code == 200:
+                last_good.set(key, (200, outcome.headers.get("content-type", "application/json"), outcome.content))
+            return outcome
+
+        if number + 1 < attempts:
+            backoff = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** number))
+            left = remaining()
+            if left is not None and left <= backoff:
+                break
+            health.stats["retries"] += 1
+            await asyncio.sleep(backoff)
+
+    fallback = _fallback(key, method, url)
+    if fallback is not None:
+        health.stats["fallbacks"] += 1
+        print(f"{upstream}: serving the last good response ({outcome})")
+        return fallback
+    if isinstance(outcome, BaseException):
+        raise outcome
+    return outcome
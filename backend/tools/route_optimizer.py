@@ -0,0 +1,89 @@
+import os
+from typing import Any, Dict, List, Tuple
+try:
+    from backend.tools.geo import distance_matrix
+except ImportError:
+    from tools.geo import distance_matrix
+
+# Held-Karp is O(2^n * n^2); above this many stops fall back to nearest neighbour + 2-opt
+EXACT_MAX_STOPS = int(os.getenv("ROUTE_OPTIMIZER_EXACT_MAX", 8))
+
+def _path_length(dist: List[List[float]], path: List[int]) -> float:
+    return sum(dist[a][b] for a, b in zip(path, path[1:]))
+
+def _held_karp(dist: List[List[float]], n: int) -> List[int]:
+    """
+    Exact shortest open path starting at node 0 and visiting nodes 1..n.
+    """
+    full = (1 << n) - 1
+    # best[(mask, j)] = (cost, previous node) for paths from 0 covering `mask` and ending at j
+    best: Dict[Tuple[int, int], Tuple[float, int]] = {}
+    for j in range(n):
+        best[(1 << j, j)] = (dist[0][j + 1], -1)
+    for mask in range(1, full + 1):
+        for j in range(n):
+            if not mask & (1 << j) or (mask, j) not in best:
+                continue
+            cost = best[(mask, j)][0]
+            for k in range(n):
+                if mask & (1 << k):
+                    continue
+                key = (mask | (1 << k), k)
+                candidate = cost + dist[j + 1][k + 1]
+                if key not in best or candidate < best[key][0]:
+                    best[key] = (candidate, j)
+    end = min(range(n), key=lambda j: best[(full, j)][0])
+    order, mask = [], full
+    while end != -1:
+        order.append(end)
+        _, prev = best[(mask, end)]
+        mask ^= 1 << end
+        end = prev
+    return order[::-1]
+
+def _nearest_neighbour_2opt(dist: List[List[float]], n: int) -> List[int]:
+    """
+    Greedy open path from node 0, improved with 2-opt segment reversals.
+    """
+    path = [0]
+    remaining = set(range(1, n + 1))
+    while remaining:
+        nxt = min(remaining, key=lambda k: dist[path[-1]][k])
+        path.append(nxt)
+        remaining.remove(nxt)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 1):
+            for j in range(i + 1, len(path)):
+                a, b = path[i - 1], path[i]
+                c = path[j]
+                d = path[j + 1] if j + 1 < len(path) else None
+                before = dist[a][b] + (dist[c][d] if d is not None else 0)
+                after = dist[a][c] + (dist[b][d] if d is not None else 0)
+                if after < before - 1e-9:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    improved = True
+    return [k - 1 for k in path[1:]]
+
+def optimize_route(locations: List[Dict[str, float]]) -> Dict[str, Any]:
+    """
+    Orders stops locally using straight-line distances, without calling Google Routes.
+    Input: List of dicts with 'lat' and 'lon'. The first location is the fixed origin;
+    every other location is a stop whose visiting order is optimized (the path ends
+    wherever is shortest). Returns the same shape as calculate_route, with
+    optimizedIntermediateWaypointIndex indexing into locations[1:].
+    """
+    n = len(locations) - 1
+    if n < 1:
+        return {}
+    dist = distance_matrix(locations)
+    order = _held_karp(dist, n) if n <= EXACT_MAX_STOPS else _nearest_neighbour_2opt(dist, n)
+    return {
+        "routes": [{
+            "optimizedIntermediateWaypointIndex": order,
+            "distanceMeters": round(_path_length(dist, [0] + [k + 1 for k in order])),
+            "optimizer": "local",
+        }]
+    }
@@ -1,12 +1,20 @@
 import httpx
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+try:
+    from backend.tools.governor import governed_request
+    from backend.tools.http_client import get_client
+except ImportError:
+    from tools.governor import governed_request
+    from tools.http_client import get_client
 
-async def calculate_route(locations: List[Dict[str, float]]) -> Dict[str, Any]:
+async def calculate_route(locations: List[Dict[str, float]], client: Optional[httpx.AsyncClient] = None, optimize_waypoint_order: bool = True) -> Dict[str, Any]:
     """
     Optimizes route for a list of locations using Google Routes API.
     Input: List of dicts with 'lat' and 'lon'.
     First location is origin, last is destination (or round trip).
+    Pass optimize_waypoint_order=False when the order was already decided locally
+    and only the polyline and ETA are needed.
     """
     api_key = os.getenv("GOOGLE_MAPS_API_KEY")
     if not api_key or len(locations) < 2:
@@ -34,7 +42,7 @@ async def calculate_route(locations: List[Dict[str, float]]) -> Dict[str, Any]:
             for loc in intermediates
         ],
         "travelMode": "DRIVE",
-        "optimizeWaypointOrder": True, # Enable TSP
+        "optimizeWaypointOrder": optimize_waypoint_order, # Enable TSP
         "routingPreference": "TRAFFIC_AWARE",
         "computeAlternativeRoutes": False
     }
@@ -45,11 +53,11 @@ async def calculate_route(locations: List[Dict[str, float]]) -> Dict[str, Any]:
         "X-Goog-FieldMask": "routes.duration,routes.distanceMeters,routes.polyline.encodedPolyline,routes.optimizedIntermediateWaypointIndex"
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, headers=headers, json=body)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            print(f"Google Routes error: {e}")
-            return {}
+    client = client or get_client("routes")
+    try:
+        response = await governed_request("routes", client, "POST", url, idempotent=True, headers=headers, json=body)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        print(f"Google Routes error: {e}")
+        return {}
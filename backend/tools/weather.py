@@ -1,25 +1,198 @@
+import asyncio
 import httpx
-from typing import Dict, Any, Optional
+import os
+import time
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+try:
+    from backend.cache import MISS, TieredCache
+    from backend.tools.governor import governed_request
+    from backend.tools.http_client import get_client
+    from backend.tools.resilience import DeadlineExceeded, detached_context, within_deadline
+except ImportError:
+    from cache import MISS, TieredCache
+    from tools.governor import governed_request
+    from tools.http_client import get_client
+    from tools.resilience import DeadlineExceeded, detached_context, within_deadline
 
-async def get_weather_forecast(lat: float, lon: float) -> Optional[Dict[str, Any]]:
-    """
-    Get current weather and 3-day forecast using Open-Meteo.
-    """
-    base_url = "https://api.open-meteo.com/v1/forecast"
+# Forecasts are cached per grid cell: every point within a cell (0.25° is about
+# 28 km, the resolution of the global models) shares the forecast for its center.
+WEATHER_GRID_DEG = float(os.getenv("WEATHER_GRID_DEG", 0.25))
+# Open-Meteo publishes new model runs about hourly; a cached forecast lives until
+# the next run is out (plus WEATHER_UPDATE_LAG), so it is never older than needed.
+WEATHER_UPDATE_INTERVAL = float(os.getenv("WEATHER_UPDATE_INTERVAL", 3600))
+WEATHER_UPDATE_LAG = float(os.getenv("WEATHER_UPDATE_LAG", 600))
+# Forecast length for trips without a day count; Open-Meteo serves up to 16 days
+WEATHER_FORECAST_DAYS = int(os.getenv("WEATHER_FORECAST_DAYS", 3))
+MAX_FORECAST_DAYS = 16
+# Locations per multi-location request, and how long a lookup waits for others
+# to share its request
+WEATHER_BATCH_SIZE = int(os.getenv("WEATHER_BATCH_SIZE", 50))
+WEATHER_BATCH_WINDOW = float(os.getenv("WEATHER_BATCH_WINDOW", 0.01))
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+CURRENT_FIELDS = "temperature_2m,precipitation,weather_code,wind_speed_10m"
+DAILY_FIELDS = "temperature_2m_max,temperature_2m_min,precipitation_probability_max"
+
+weather_cache = TieredCache(
+    "weather",
+    maxsize=int(os.getenv("WEATHER_CACHE_SIZE", 1024)),
+    ttl=WEATHER_UPDATE_INTERVAL,
+)
+
+Cell = Tuple[float, float]
+
+def get_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters for the weather cache."""
+    return dict(weather_cache.stats)
+
+def grid_cell(lat: float, lon: float) -> Cell:
+    """Center of the WEATHER_GRID_DEG cell containing the point."""
+    return (round(round(lat / WEATHER_GRID_DEG) * WEATHER_GRID_DEG, 4), round(round(lon / WEATHER_GRID_DEG) * WEATHER_GRID_DEG, 4))
+
+def forecast_days(days: Optional[int]) -> int:
+    """Forecast length for a trip of `days` days (the default when unknown)."""
+    return max(1, min(MAX_FORECAST_DAYS, days or WEATHER_FORECAST_DAYS))
+
+def forecast_ttl(now: Optional[float] = None) -> float:
+    """Seconds until the next model run should be available."""
+    now = time.time() if now is None else now
+    phase = (now - WEATHER_UPDATE_LAG) % WEATHER_UPDATE_INTERVAL
+    return WEATHER_UPDATE_INTERVAL - phase
+
+def _cache_key(cell: Cell) -> str:
+    return f"forecast:{cell[0]},{cell[1]}"
+
+def _forecast_length(forecast: Dict[str, Any]) -> int:
+    return len((forecast.get("daily") or {}).get("time") or [])
+
+def _truncate(forecast: Dict[str, Any], days: int) -> Dict[str, Any]:
+    """A cached longer forecast serves shorter trips: keep the first `days` days."""
+    daily = forecast.get("daily")
+    if not daily or _forecast_length(forecast) <= days:
+        return forecast
+    return {**forecast, "daily": {key: values[:days] for key, values in daily.items()}}
+
+async def _cached(cell: Cell, days: int) -> Optional[Dict[str, Any]]:
+    cached = await weather_cache.get(_cache_key(cell))
+    if cached is MISS or _forecast_length(cached) < days:
+        return None
+    return _truncate(cached, days)
+
+async def _fetch(cells: Sequence[Cell], days: int, client: httpx.AsyncClient) -> Dict[Cell, Optional[Dict[str, Any]]]:
+    """One multi-location request for up to WEATHER_BATCH_SIZE cells; caches each forecast."""
     params = {
-        "latitude": lat,
-        "longitude": lon,
-        "current": "temperature_2m,precipitation,weather_code,wind_speed_10m",
-        "daily": "temperature_2m_max,temperature_2m_min,precipitation_probability_max",
-        "forecast_days": 3,
-        "timezone": "auto"
+        "latitude": ",".join(str(lat) for lat, _ in cells),
+        "longitude": ",".join(str(lon) for _, lon in cells),
+        "current": CURRENT_FIELDS,
+        "daily": DAILY_FIELDS,
+        "forecast_days": days,
+        "timezone": "auto",
     }
-    
-    async with httpx.AsyncClient() as client:
+    try:
+        response = await governed_request("open-meteo", client, "GET", FORECAST_URL, params=params)
+        response.raise_for_status()
+        body = response.json()
+    except Exception as e:
+        print(f"Weather API error: {e}")
+        return {cell: None for cell in cells}
+    # A single location comes back as an object, several as a list in request order
+    forecasts = body if isinstance(body, list) else [body]
+    ttl = forecast_ttl()
+    result = dict(zip(cells, forecasts))
+    await asyncio.gather(*(weather_cache.set(_cache_key(cell), forecast, ttl=ttl) for cell, forecast in result.items()))
+    return result
+
+async def get_weather_forecasts(points: Sequence[Tuple[float, float]], days: Optional[int] = None, client: Optional[httpx.AsyncClient] = None) -> List[Optional[Dict[str, Any]]]:
+    """
+    Current weather and daily forecast for many (lat, lon) points, in order. Points
+    in the same grid cell share one forecast, and uncached cells are fetched with one
+    Open-Meteo request per WEATHER_BATCH_SIZE cells.
+    """
+    days = forecast_days(days)
+    cells = [grid_cell(lat, lon) for lat, lon in points]
+    unique = list(dict.fromkeys(cells))
+    found: Dict[Cell, Optional[Dict[str, Any]]] = dict(zip(unique, await asyncio.gather(*(_cached(cell, days) for cell in unique))))
+    missing = [cell for cell in unique if found[cell] is None]
+
+    client = client or get_client("open-meteo")
+    batches = [missing[i:i + WEATHER_BATCH_SIZE] for i in range(0, len(missing), WEATHER_BATCH_SIZE)]
+    for fetched in await asyncio.gather(*(_fetch(batch, days, client) for batch in batches)):
+        found.update(fetched)
+    return [found[cell] for cell in cells]
+
+class ForecastBatcher:
+    """
+    Collects single-point lookups arriving within WEATHER_BATCH_WINDOW of each other
+    (e.g. the weather nodes of a plan batch) into multi-location requests. Lookups
+    for a cell that is already queued or in flight share its result. Requests run
+    without the deadline of the lookup that queued them; each lookup waits only until
+    its own deadline and then gets None, as for a failed fetch.
+    """
+    def __init__(self, window: float = WEATHER_BATCH_WINDOW):
+        self.window = window
+        # Queued and in-flight lookups by (cell, days)
+        self._futures: Dict[Tuple[Cell, int], asyncio.Future] = {}
+        self._queued: Dict[int, List[Cell]] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+
+    async def load(self, cell: Cell, days: int) -> Optional[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        future = self._futures.get((cell, days))
+        if future is None:
+            future = self._futures[(cell, days)] = loop.create_future()
+            queued = self._queued.setdefault(days, [])
+            queued.append(cell)
+            if len(queued) >= WEATHER_BATCH_SIZE:
+                timer = self._timers.pop(days, None)
+                if timer is not None:
+                    timer.cancel()
+                loop.create_task(self._flush(days), context=detached_context())
+            elif days not in self._timers:
+                self._timers[days] = loop.create_task(self._flush_later(days), context=detached_context())
+        # Shield so one caller going away does not cancel the lookup for the others
         try:
-            response = await client.get(base_url, params=params)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            print(f"Weather API error: {e}")
+            return await within_deadline(lambda: asyncio.shield(future))
+        except DeadlineExceeded as e:
+            print(f"Weather lookup: {e}")
             return None
+
+    async def _flush_later(self, days: int):
+        await asyncio.sleep(self.window)
+        self._timers.pop(days, None)
+        await self._flush(days)
+
+    async def _flush(self, days: int):
+        cells = self._queued.pop(days, [])
+        if not cells:
+            return
+        try:
+            fetched = await _fetch(cells, days, get_client("open-meteo"))
+        except BaseException as e:
+            fetched, error = {}, e
+        else:
+            error = None
+        for cell in cells:
+            future = self._futures.pop((cell, days))
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(fetched.get(cell))
+
+_batcher = ForecastBatcher()
+
+async def get_weather_forecast(lat: float, lon: float, days: Optional[int] = None, client: Optional[httpx.AsyncClient] = None) -> Optional[Dict[str, Any]]:
+    """
+    Get current weather and a forecast for a trip of `days` days using Open-Meteo
+    (WEATHER_FORECAST_DAYS when not given). Concurrent lookups are batched into
+    multi-location requests; pass a client to fetch this point on its own.
+    """
+    days = forecast_days(days)
+    cell = grid_cell(lat, lon)
+    cached = await _cached(cell, days)
+    if cached is not None:
+        return cached
+    if client is not None:
+        return (await _fetch([cell], days, client))[cell]
+    return await _batcher.load(cell, days)
@@ -0,0 +1,262 @@
+"""
+Background cache warmer for popular destinations.
+
+Keeps geocodes, attractions, restaurants and weather for the top-N destinations in
+the tool caches, refreshing weather more often than places. Runs inside the web
+server (WARM_CACHE=1) or as a separate worker sharing the same cache backend:
+
+    python -m backend.warmer
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+try:
+    from backend.cache import MISS, close_redis_client, env_flag, make_store, normalize_query, refreshing
+    from backend.tools.geocoding import get_coordinates
+    from backend.tools.weather import forecast_ttl, get_weather_forecast, get_weather_forecasts
+    from backend.tools.places import search_attractions, search_restaurants
+    from backend.tools.governor import get_governor
+    from backend.tools import http_client
+except ImportError:
+    from cache import MISS, close_redis_client, env_flag, make_store, normalize_query, refreshing
+    from tools.geocoding import get_coordinates
+    from tools.weather import forecast_ttl, get_weather_forecast, get_weather_forecasts
+    from tools.places import search_attractions, search_restaurants
+    from tools.governor import get_governor
+    from tools import http_client
+
+WARM_TOP_N = int(os.getenv("WARM_TOP_N", 20))
+# Always warmed, on top of the observed top-N (comma-separated)
+WARM_DESTINATIONS = [d.strip() for d in os.getenv("WARM_DESTINATIONS", "").split(",") if d.strip()]
+# Places are refreshed well within their cache TTL. Weather entries expire with each
+# forecast model run, and the warmer also wakes up right after each run.
+WEATHER_REFRESH_INTERVAL = float(os.getenv("WEATHER_REFRESH_INTERVAL", 900))
+PLACES_REFRESH_INTERVAL = float(os.getenv("PLACES_REFRESH_INTERVAL", 6 * 3600))
+WARM_CONCURRENCY = int(os.getenv("WARM_CONCURRENCY", 2))
+# Background work waits while an upstream's token bucket is below this fraction,
+# leaving the rest of the rate budget to user requests
+WARM_MIN_BUDGET = float(os.getenv("WARM_MIN_BUDGET", 0.5))
+
+WARM_UPSTREAMS = ("geoapify", "open-meteo", "places")
+
+# Set by the multi-worker launcher (backend/serve.py): each web worker saves its own
+# counts and the warmer merges them.
+WORKER_ID = os.getenv("WORKER_ID", "")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", 1))
+
+class DestinationStats:
+    """
+    Request counts per destination, decayed over time so the ranking follows current
+    traffic. Saved to the shared cache backend so the ranking survives restarts and a
+    separate warmer process can read what the web server observed.
+    """
+    def __init__(self, half_life: float = 7 * 24 * 3600, save_interval: float = 30, persist: Optional[bool] = None):
+        self.half_life = half_life
+        self.save_interval = save_interval
+        if persist is None:
+            persist = env_flag("CACHE_PERSIST", True)
+        self.store = make_store("popularity") if persist else None
+        self.key = f"counts:{WORKER_ID}" if WORKER_ID else "counts"
+        self.counts: Dict[str, float] = {}
+        self.names: Dict[str, str] = {}
+        self.updated = time.time()
+        self.saved = 0.0
+
+    def _decay(self):
+        now = time.time()
+        factor = 0.5 ** ((now - self.updated) / self.half_life)
+        if factor < 1:
+            self.counts = {key: count * factor for key, count in self.counts.items() if count * factor >= 0.01}
+            self.names = {key: self.names[key] for key in self.counts}
+        self.updated = now
+
+    def record(self, destination: str):
+        key = normalize_query(destination)
+        if not key:
+            return
+        self._decay()
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.names.setdefault(key, destination.strip())
+        if time.time() - self.saved >= self.save_interval:
+            self.saved = time.time()
+            asyncio.ensure_future(self.save())
+
+    def top(self, n: int) -> List[str]:
+        self._decay()
+        ranked = sorted(self.counts, key=self.counts.get, reverse=True)[:n]
+        return [self.names[key] for key in ranked]
+
+    async def load(self):
+        """Restores this process's saved counts (called once at startup)."""
+        if self.store is None:
+            return
+        saved = await self.store.get(self.key)
+        if saved is not MISS:
+            self.counts, self.names, self.updated = saved["counts"], saved["names"], saved["updated"]
+
+    async def load_all(self):
+        """Replaces the counts with the sum of what every web worker saved."""
+        if self.store is None:
+            return
+        keys = ["counts"] + [f"counts:{i}" for i in range(WEB_WORKERS)]
+        counts: Dict[str, float] = {}
+        names: Dict[str, str] = {}
+        now = time.time()
+        for saved in await asyncio.gather(*(self.store.get(key) for key in keys)):
+            if saved is MISS:
+                continue
+            factor = 0.5 ** ((now - saved["updated"]) / self.half_life)
+            for name_key, count in saved["counts"].items():
+                counts[name_key] = counts.get(name_key, 0) + count * factor
+                names.setdefault(name_key, saved["names"][name_key])
+        self.counts, self.names, self.updated = counts, names, now
+
+    async def save(self):
+        self.saved = time.time()
+        if self.store is None:
+            return
+        try:
+            await self.store.set(self.key, {"counts": self.counts, "names": self.names, "updated": self.updated}, ttl=30 * 24 * 3600)
+        except Exception as e:
+            print(f"Destination stats: save failed: {e}")
+
+popularity = DestinationStats()
+
+def record_request(destination: str):
+    """Counts a planning request towards the warm-cache ranking."""
+    popularity.record(destination)
+
+async def wait_for_budget(poll: float = 1.0):
+    """Waits until every upstream the warmer uses has spare rate budget."""
+    while True:
+        busy = False
+        for upstream in WARM_UPSTREAMS:
+            governor = get_governor(upstream)
+            bucket = governor.bucket
+            if governor.blocked_until > time.monotonic():
+                busy = True
+            elif bucket.rate > 0:
+                busy = busy or bucket.available() < bucket.capacity * WARM_MIN_BUDGET
+        if not busy:
+            return
+        await asyncio.sleep(poll)
+
+async def warm_destination(destination: str, refresh_weather: bool = False, refresh_places: bool = False) -> bool:
+    """
+    Fills the caches for one destination through the regular tool functions, so the
+    entries are exactly what a plan request would look up. Geocodes are only fetched
+    when missing; weather and places are refetched when asked to.
+    """
+    coords = await get_coordinates(destination)
+    if not coords:
+        return False
+    lat, lon = coords["lat"], coords["lon"]
+    await wait_for_budget()
+    with refreshing(refresh_weather):
+        await get_weather_forecast(lat, lon)
+    await wait_for_budget()
+    with refreshing(refresh_places):
+        await asyncio.gather(
+            search_attractions(lat, lon, query_context=destination),
+            search_restaurants(lat, lon),
+        )
+    return True
+
+class CacheWarmer:
+    """
+    Every WEATHER_REFRESH_INTERVAL, and right after each forecast model run, re-ranks
+    destinations and refreshes their expired weather in bulk; places and restaurants
+    are refreshed once they are PLACES_REFRESH_INTERVAL old. A destination entering
+    the list is warmed completely.
+    """
+    def __init__(self, stats: DestinationStats = popularity, top_n: int = WARM_TOP_N, reload_stats: bool = False):
+        self.stats = stats
+        self.top_n = top_n
+        # A separate worker reads the counts the web workers saved
+        self.reload_stats = reload_stats
+        self.places_refreshed: Dict[str, float] = {}
+        self.last_run: Dict[str, float] = {"destinations": 0, "warmed": 0, "seconds": 0.0}
+        self._task: Optional[asyncio.Task] = None
+
+    def destinations(self) -> List[str]:
+        seen, result = set(), []
+        for destination in WARM_DESTINATIONS + self.stats.top(self.top_n):
+            key = normalize_query(destination)
+            if key not in seen:
+                seen.add(key)
+                result.append(destination)
+        return result
+
+    async def refresh_weather(self, destinations: List[str]):
+        """Refetches expired weather for all destinations with a few multi-location requests."""
+        points = []
+        for destination in destinations:
+            coords = await get_coordinates(destination)
+            if coords:
+                points.append((coords["lat"], coords["lon"]))
+        if points:
+            await wait_for_budget()
+            await get_weather_forecasts(points)
+
+    async def run_once(self):
+        if self.reload_stats:
+            await self.stats.load_all()
+        destinations = self.destinations()
+        semaphore = asyncio.Semaphore(WARM_CONCURRENCY)
+        start = time.monotonic()
+        try:
+            await self.refresh_weather(destinations)
+        except Exception as e:
+            print(f"Cache warmer: weather refresh failed: {e}")
+
+        async def warm(destination: str) -> bool:
+            key = normalize_query(destination)
+            refresh_places = key in self.places_refreshed and time.time() - self.places_refreshed[key] >= PLACES_REFRESH_INTERVAL
+            async with semaphore:
+                try:
+                    ok = await warm_destination(destination, refresh_places=refresh_places)
+                except Exception as e:
+                    print(f"Cache warmer: {destination} failed: {e}")
+                    return False
+            if ok and (refresh_places or key not in self.places_refreshed):
+                self.places_refreshed[key] = time.time()
+            return ok
+
+        results = await asyncio.gather(*(warm(d) for d in destinations))
+        self.last_run = {"destinations": len(destinations), "warmed": sum(results), "seconds": time.monotonic() - start}
+        print(f"Cache warmer: warmed {self.last_run['warmed']}/{len(destinations)} destinations in {self.last_run['seconds']:.1f}s")
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Cache warmer error: {e}")
+            await asyncio.sleep(min(WEATHER_REFRESH_INTERVAL, forecast_ttl()))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+warmer = CacheWarmer()
+
+async def _main():
+    await http_client.startup()
+    try:
+        await CacheWarmer(reload_stats=True).run_forever()
+    finally:
+        await http_client.shutdown()
+        await close_redis_client()
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -126,7 +126,7 @@ export default function Home() {
 
           {/* Chatbot */}
           {result.structured_itinerary && (
-            <Chatbot context={result.structured_itinerary} />
+            <Chatbot planId={result.plan_id} context={result.structured_itinerary} />
           )}
         </>
       )}
@@ -10,10 +10,11 @@ interface Message {
 }
 
 interface ChatbotProps {
+    planId?: string;
     context: any;
 }
 
-export function Chatbot({ context }: ChatbotProps) {
+export function Chatbot({ planId, context }: ChatbotProps) {
     const [isOpen, setIsOpen] = useState(false);
     const [messages, setMessages] = useState<Message[]>([
         { role: 'assistant', content: 'Hi! I can help you with details about your trip. Ask me anything!' }
@@ -38,17 +39,43 @@ export function Chatbot({ context }: ChatbotProps) {
 
         try {
             const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
-            const response = await fetch(`${apiUrl}/api/chat`, {
+            // The server keeps the plan's context; only send it when there is no plan ID
+            const response = await fetch(`${apiUrl}/api/chat/stream`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    message: userMessage,
-                    context: context
-                })
+                body: JSON.stringify(
+                    planId ? { message: userMessage, plan_id: planId } : { message: userMessage, context: context }
+                )
             });
+            if (!response.ok || !response.body) {
+                throw new Error(`Chat failed with status ${response.status}`);
+            }
 
-            const data = await response.json();
-            setMessages(prev => [...prev, { role: 'assistant', content: data.response }]);
+            // Append tokens to the assistant message as they arrive
+            setMessages(prev => [...prev, { role: 'assistant', content: '' }]);
+            setLoading(false);
+            const appendToReply = (text: string) => setMessages(prev => {
+                const last = prev[prev.length - 1];
+                return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+            });
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop() || '';
+                for (const raw of events) {
+                    const event = raw.match(/^event: (.*)$/m)?.[1];
+                    const data = raw.match(/^data: (.*)$/m)?.[1];
+                    if (!data) continue;
+                    if (event === 'token') appendToReply(JSON.parse(data).text);
+                    if (event === 'error') throw new Error(JSON.parse(data).detail);
+                }
+            }
         } catch (error) {
             console.error('Chat error:', error);
             setMessages(prev => [...prev, { role: 'assistant', content: 'Sorry, I encountered an error. Please try again.' }]);
@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 
 export interface ItineraryResult {
+  plan_id?: string; // Used for /api/replan and /api/chat
   destination: string;
   coordinates?: { lat: number; lon: number; formatted?: string };
   final_itinerary: string;